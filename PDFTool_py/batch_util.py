@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+批次處理共用工具（關鍵字遮罩與差異比對兩個工具共用，不依賴任何一方）
+- spawn 程序池、預設平行數
+- 把來源（bytes / 檔案物件 / 路徑）寫成暫存檔，worker 依路徑開檔
+- 命令列輸入收集（檔案、資料夾、glob）與輸出名稱去重
+- 上傳檔的內容雜湊（預覽／比對快取的鍵）
+"""
+import glob, hashlib, os, shutil
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+
+def content_key(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def default_workers() -> int:
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def make_pool(workers: int) -> ProcessPoolExecutor:
+    # 使用 spawn：Streamlit 伺服器本身是多執行緒，fork 可能鎖死
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+
+
+def spill_to_file(src, path: str) -> str:
+    """把來源（bytes / 檔案物件 / 路徑）寫成暫存檔，避免把大檔整包送進 worker；回傳 path"""
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        with open(path, "wb") as f:
+            f.write(src)
+    elif isinstance(src, (str, os.PathLike)):
+        shutil.copyfile(src, path)
+    else:
+        if hasattr(src, "seek"):
+            src.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(src, f, 1024 * 1024)
+    return path
+
+
+def unique_arcname(name: str, used: set) -> str:
+    """name 已用過時改成「名稱 (2).ext」、「名稱 (3).ext」…，並登記到 used"""
+    if name not in used:
+        used.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    n = 2
+    while f"{stem} ({n}){ext}" in used:
+        n += 1
+    name = f"{stem} ({n}){ext}"
+    used.add(name)
+    return name
+
+
+def _glob_root(spec: str) -> str:
+    """glob 中第一個含萬用字元的路徑段之前的部分（'in/**/*.pdf' → 'in'）"""
+    head = spec
+    while glob.has_magic(head):
+        parent = os.path.dirname(head)
+        if parent == head:
+            break
+        head = parent
+    return head
+
+
+def collect_inputs(specs, recursive: bool = True):
+    """
+    specs 可為檔案、資料夾或 glob；回傳 [(相對名稱, 絕對路徑), ...]。
+    相對名稱保留資料夾（或 glob 不含萬用字元的開頭目錄）內的子目錄，輸出時據此重建目錄結構。
+    """
+    found, seen = [], set()
+
+    def add(rel, path):
+        ap = os.path.abspath(path)
+        if ap not in seen and ap.lower().endswith(".pdf"):
+            seen.add(ap)
+            found.append((rel, ap))
+
+    for spec in specs:
+        if os.path.isdir(spec):
+            pattern = os.path.join(spec, "**", "*") if recursive else os.path.join(spec, "*")
+            for p in sorted(glob.glob(pattern, recursive=recursive)):
+                if os.path.isfile(p):
+                    add(os.path.relpath(p, spec), p)
+        elif os.path.isfile(spec):
+            add(os.path.basename(spec), spec)
+        else:
+            root = _glob_root(spec) or "."
+            for p in sorted(glob.glob(spec, recursive=True)):
+                if os.path.isfile(p):
+                    add(os.path.relpath(p, root), p)
+    return found
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜效能與準確度基準測試
+
+用 PyMuPDF 在本機產生 A/B 兩份合成 PDF，B 帶有已知的變更：
+    text    每個被改的頁換掉 1～3 個字（該行之後的文字會跟著位移）
+    move    兩段相鄰段落對調
+    insert  插入全新的頁
+    image   換掉頁面上的圖片
+    noise   兩份都轉成加雜訊的 JPEG 掃描頁（含隱形文字層，模擬 OCR 後的掃描檔），B 另有 text 變更
+再以三種預設參數（standard / high / low）與不同頁數跑完整流程（diff_pdfs，含 HTML 報告）：
+- 各階段耗時取自 diff_profile（render、mask、components、merge、overlay、similarity、text_diff、encode、report …）
+- 端到端耗時、每秒頁數與峰值 RSS；另跑一次只要結構化結果（不寫報告）的耗時
+- 偵測到的差異框（PDF 點）與已知變更比對：變更召回率、框的精確率、頁層級召回與誤判頁數、插入頁是否正確
+每個情境在獨立的子程序執行，峰值 RSS 才不會互相干擾。結果為 JSON，可用 --compare 和先前的結果比較
+（同時列出速度倍率與召回率／精確率的變化，加速不會悄悄犧牲準確度）。
+
+範例：
+    python bench_diff.py --quick -o bench_diff.json
+    python bench_diff.py --pages 20,200 --edit text,noise -o new.json --compare old.json --min-recall 0.95
+    python bench_diff.py --pages 50,500 --edit text --preset standard --memory-budget 0,512
+"""
+import argparse, datetime, hashlib, io, itertools, json, os, platform, random, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from bench_redactor import _make_word, _peak_rss_mb, _ints, _floats, _strs
+from diff_batch import PRESET_ALIASES, diff_pdfs, resolve_settings
+from diff_core import pixmap_array
+
+EDIT_KINDS = ("text", "move", "insert", "image", "noise")
+
+# 版面（PDF 點）：標題、段落在上半部，圖片在下方；都避開頁首／頁尾忽略區
+_FONT, _FS, _LEAD, _PARA_GAP = "helv", 10, 14, 8
+_X0, _TOP = 72, 90
+_IMG_RECT = fitz.Rect(72, 600, 312, 760)
+_IMG_PX = (240, 160)
+_TRUTH_PAD = 2  # 比對差異框與已知變更時的容許誤差（點）
+
+
+# ---------------------- 合成文件 ----------------------
+def _make_line(rng: random.Random) -> list:
+    return [_make_word(rng, "latin") for _ in range(rng.randint(7, 10))]
+
+
+def _make_spec(rng: random.Random) -> dict:
+    """一頁的內容：標題、4～5 段（每段 3～5 行）與一張圖片（以種子表示）"""
+    return {
+        "title": " ".join(_make_word(rng, "latin") for _ in range(4)).title(),
+        "paras": [[_make_line(rng) for _ in range(rng.randint(3, 5))] for _ in range(rng.randint(4, 5))],
+        "image": rng.randrange(1 << 30),
+    }
+
+
+def _copy_spec(spec: dict) -> dict:
+    return {"title": spec["title"], "paras": [[list(words) for words in para] for para in spec["paras"]],
+            "image": spec["image"]}
+
+
+def _baselines(spec: dict):
+    """每一行的基線 y：[(段, 行, y), ...]"""
+    out, y = [], _TOP + 28
+    for p, para in enumerate(spec["paras"]):
+        for l in range(len(para)):
+            out.append((p, l, y))
+            y += _LEAD
+        y += _PARA_GAP
+    return out
+
+
+def _text_width(words) -> float:
+    return fitz.get_text_length(" ".join(words), fontname=_FONT, fontsize=_FS)
+
+
+def _image_png(seed: int) -> bytes:
+    """色塊拼成的圖片（不同種子幾乎每個色塊都不同）"""
+    rng = np.random.default_rng(seed)
+    w, h = _IMG_PX
+    blocks = rng.integers(0, 256, size=(8, 12, 3), dtype=np.uint8)
+    arr = np.kron(blocks, np.ones((h // 8, w // 12, 1), dtype=np.uint8))
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _draw_page(page: fitz.Page, spec: dict, render_mode: int = 0, image: bool = True):
+    page.insert_text((_X0, _TOP), spec["title"], fontname=_FONT, fontsize=14, render_mode=render_mode)
+    for p, l, y in _baselines(spec):
+        page.insert_text((_X0, y), " ".join(spec["paras"][p][l]), fontname=_FONT, fontsize=_FS,
+                         render_mode=render_mode)
+    if image:
+        page.insert_image(_IMG_RECT, stream=_image_png(spec["image"]))
+
+
+def _scan_page(out: fitz.Document, spec: dict, rng: np.random.Generator, dpi: int = 150, sigma: float = 6.0):
+    """畫好的頁 → 灰階點陣加高斯雜訊、JPEG 壓縮，再疊一層隱形文字"""
+    with fitz.open() as tmp:
+        src = tmp.new_page()
+        _draw_page(src, spec)
+        pix = src.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        noisy = np.clip(pixmap_array(pix) + rng.normal(0, sigma, (pix.height, pix.width)), 0, 255)
+        buf = io.BytesIO()
+        Image.fromarray(noisy.astype(np.uint8)).save(buf, "JPEG", quality=80)
+    page = out.new_page()
+    page.insert_image(page.rect, stream=buf.getvalue())
+    _draw_page(page, spec, render_mode=3, image=False)
+
+
+def write_pdf(path: str, specs, scan_seed: int = None):
+    doc = fitz.open()
+    rng = np.random.default_rng(scan_seed) if scan_seed is not None else None
+    for spec in specs:
+        if rng is not None:
+            _scan_page(doc, spec, rng)
+        else:
+            _draw_page(doc.new_page(), spec)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def _edit_text(rng: random.Random, spec: dict) -> list:
+    """換掉 1～3 行中的一個字；回傳受影響的區域（換掉的字到兩版中較長的行尾）"""
+    lines = _baselines(spec)
+    truth = []
+    for p, l, y in rng.sample(lines, rng.randint(1, 3)):
+        words = spec["paras"][p][l]
+        old = list(words)
+        w = rng.randrange(len(words))
+        while words[w] == old[w]:
+            words[w] = _make_word(rng, "latin")
+        x0 = _X0 + (_text_width(old[:w] + [""]) if w else 0)
+        x1 = _X0 + max(_text_width(old), _text_width(words))
+        truth.append(fitz.Rect(x0, y - _FS, x1, y + 0.3 * _FS))
+    return truth
+
+
+def _edit_move(rng: random.Random, spec: dict) -> list:
+    """相鄰兩段對調；兩段合起來的高度不變，受影響的區域就是這兩段"""
+    paras = spec["paras"]
+    p = rng.randrange(len(paras) - 1)
+    first = [y for q, _, y in _baselines(spec) if q == p][0]
+    paras[p], paras[p + 1] = paras[p + 1], paras[p]
+    last = [y for q, _, y in _baselines(spec) if q == p + 1][-1]
+    x1 = _X0 + max(_text_width(words) for words in paras[p] + paras[p + 1])
+    return [fitz.Rect(_X0, first - _FS, x1, last + 0.3 * _FS)]
+
+
+def _edit_image(rng: random.Random, spec: dict) -> list:
+    spec["image"] = rng.randrange(1 << 30)
+    return [fitz.Rect(_IMG_RECT)]
+
+
+def make_pair(dir_: str, pages: int, edit: str, edit_rate: float, seed: int):
+    """
+    產生 a.pdf / b.pdf，回傳 (路徑 A, 路徑 B, 已知變更)。
+    已知變更：{"rects": {B 頁索引: [fitz.Rect, ...]}, "inserted": [B 頁索引, ...]}
+    """
+    rng = random.Random(seed)
+    specs_a = [_make_spec(rng) for _ in range(pages)]
+    specs_b = [_copy_spec(s) for s in specs_a]
+    rects, inserted = {}, []
+    if edit == "insert":
+        n_ins = max(1, round(pages * edit_rate / 3))
+        new = []
+        for pos in sorted(rng.sample(range(pages + 1), n_ins), reverse=True):
+            new.append(_make_spec(rng))
+            specs_b.insert(pos, new[-1])
+        inserted = [i for i, s in enumerate(specs_b) if any(s is n for n in new)]
+    else:
+        editor = {"text": _edit_text, "noise": _edit_text, "move": _edit_move, "image": _edit_image}[edit]
+        for i in sorted(rng.sample(range(pages), max(1, round(pages * edit_rate)))):
+            rects[i] = editor(rng, specs_b[i])
+    path_a, path_b = os.path.join(dir_, "a.pdf"), os.path.join(dir_, "b.pdf")
+    scan = edit == "noise"
+    write_pdf(path_a, specs_a, seed + 1 if scan else None)
+    write_pdf(path_b, specs_b, seed + 2 if scan else None)
+    return path_a, path_b, {"rects": rects, "inserted": inserted}
+
+
+# ---------------------- 準確度 ----------------------
+def _hit(bbox, rect: fitz.Rect) -> bool:
+    return fitz.Rect(bbox).intersects(rect + (-_TRUTH_PAD, -_TRUTH_PAD, _TRUTH_PAD, _TRUTH_PAD))
+
+
+def score(result, truth: dict) -> dict:
+    """
+    以 B 頁為準比對：已知變更被任一差異框碰到算召回；差異框碰到任一已知變更算正確。
+    未變更的頁出現的差異框全部算誤判。
+    """
+    rects = truth["rects"]
+    n_truth = sum(len(v) for v in rects.values())
+    found = boxes = true_boxes = 0
+    flagged, false_pages = set(), 0
+    for p in result.pages:
+        if p.status != "changed" or p.page_b is None:
+            continue
+        ib = p.page_b - 1
+        expected = rects.get(ib, [])
+        found += sum(1 for r in expected if any(_hit(b["bbox"], r) for b in p.boxes))
+        boxes += len(p.boxes)
+        true_boxes += sum(1 for b in p.boxes if any(_hit(b["bbox"], r) for r in expected))
+        if p.boxes:
+            if expected:
+                flagged.add(ib)
+            else:
+                false_pages += 1
+    inserted = sorted(p.page_b - 1 for p in result.pages if p.status == "inserted")
+    return {
+        "edits": n_truth,
+        "edits_found": found,
+        "recall": round(found / n_truth, 4) if n_truth else 1.0,
+        "boxes": boxes,
+        "precision": round(true_boxes / boxes, 4) if boxes else 1.0,
+        "pages_edited": len(rects),
+        "page_recall": round(len(flagged) / len(rects), 4) if rects else 1.0,
+        "false_pages": false_pages,
+        "inserted_ok": inserted == truth["inserted"],
+    }
+
+
+# ---------------------- 計時 ----------------------
+def run_scenario(sc: dict, workdir: str, workers: int = 1, py_mem: bool = False) -> dict:
+    """在子程序中執行單一情境，回傳各階段耗時（秒）、端到端耗時、準確度與峰值記憶體（MB）"""
+    key = hashlib.sha1(json.dumps(sc, sort_keys=True).encode()).hexdigest()[:12]
+    dir_ = os.path.join(workdir, key)
+    os.makedirs(dir_, exist_ok=True)
+    t0 = time.perf_counter()
+    path_a, path_b, truth = make_pair(dir_, sc["pages"], sc["edit"], sc["edit_rate"], int(key[:8], 16))
+    gen_s = time.perf_counter() - t0
+
+    opts = dict(mode=sc["mode"], grayscale=not sc["color"], memory_budget_mb=sc.get("memory_budget_mb", 0))
+    settings = resolve_settings(sc["preset"], **opts)
+    report = os.path.join(dir_, "report.zip")
+
+    # 逐階段量測（Profiler 本身有少量額外成本，端到端時間另外跑）
+    prof_run = diff_pdfs(path_a, path_b, resolve_settings(sc["preset"], profile=True, **opts),
+                         report=report, max_workers=workers)
+    if not prof_run.ok:
+        raise RuntimeError(prof_run.error)
+    stages = {k: v["total_s"] for k, v in prof_run.profile["stages"].items()}
+
+    t = time.perf_counter()
+    result = diff_pdfs(path_a, path_b, settings, report=report, max_workers=workers)
+    e2e = time.perf_counter() - t
+    report_bytes = os.path.getsize(report)
+
+    t = time.perf_counter()
+    diff_pdfs(path_a, path_b, settings, max_workers=workers)
+    structured = time.perf_counter() - t
+
+    stage_peak = None
+    if py_mem:
+        mem_run = diff_pdfs(path_a, path_b, resolve_settings(sc["preset"], profile=True, profile_memory=True, **opts),
+                            report=report, max_workers=workers)
+        stage_peak = {k: v["peak_mb"] for k, v in mem_run.profile["stages"].items()}
+
+    rows = len(result.pages)
+    out = {
+        "scenario": sc,
+        "generate_s": round(gen_s, 4),
+        "stages_s": stages,
+        "stage_peak_mb": stage_peak,
+        "end_to_end_s": round(e2e, 4),
+        "structured_s": round(structured, 4),
+        "pages_per_s": round(rows / e2e, 2) if e2e > 0 else None,
+        "rows": rows,
+        "changed_pages": result.changed_pages,
+        "similarity": result.similarity,
+        "report_bytes": report_bytes,
+        "accuracy": score(result, truth),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+    for f in os.listdir(dir_):
+        os.remove(os.path.join(dir_, f))
+    os.rmdir(dir_)
+    return out
+
+
+# ---------------------- 主程式 ----------------------
+def build_scenarios(args):
+    if args.quick:
+        grid = dict(preset=list(PRESET_ALIASES), pages=[6], edit=list(EDIT_KINDS), mode=["raster"],
+                    color=[False], edit_rate=[0.5], memory_budget_mb=[0])
+    else:
+        grid = dict(preset=args.preset, pages=args.pages, edit=args.edit, mode=args.mode,
+                    color=[False, True] if args.color else [False], edit_rate=args.edit_rate,
+                    memory_budget_mb=args.memory_budget)
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[n] for n in names))]
+
+
+def compare(current: dict, baseline: dict):
+    """依情境比對端到端時間（>1 代表變快）與召回率／精確率；準確度下降的情境標上 !"""
+    base = {json.dumps(r["scenario"], sort_keys=True): r for r in baseline.get("results", [])}
+    print(f"{'情境':<60} {'舊(s)':>8} {'新(s)':>8} {'倍率':>6} {'召回':>13} {'精確':>13}")
+    for r in current["results"]:
+        k = json.dumps(r["scenario"], sort_keys=True)
+        if k not in base:
+            continue
+        b = base[k]
+        old, new = b["end_to_end_s"], r["end_to_end_s"]
+        ratio = old / new if new else float("inf")
+        ra, rb = b["accuracy"]["recall"], r["accuracy"]["recall"]
+        pa, pb = b["accuracy"]["precision"], r["accuracy"]["precision"]
+        flag = " !" if rb < ra - 0.01 or pb < pa - 0.05 else ""
+        print(f"{k[:60]:<60} {old:>8.3f} {new:>8.3f} {ratio:>6.2f} {ra:>6.3f}→{rb:<6.3f} {pa:>6.3f}→{pb:<6.3f}{flag}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="PDF 差異比對效能與準確度基準")
+    ap.add_argument("--quick", action="store_true", help="只跑小型預設矩陣（三種參數模式 × 五種變更，每份 6 頁）")
+    ap.add_argument("--preset", type=_strs, default=list(PRESET_ALIASES), help="參數模式：standard,high,low")
+    ap.add_argument("--pages", type=_ints, default=[10, 50])
+    ap.add_argument("--edit", type=_strs, default=list(EDIT_KINDS), help="變更種類：" + ",".join(EDIT_KINDS))
+    ap.add_argument("--edit-rate", type=_floats, default=[0.3], help="被修改的頁比例")
+    ap.add_argument("--mode", type=_strs, default=["raster"], help="比對方式：raster,vector")
+    ap.add_argument("--color", action="store_true", help="另跑彩色（RGB）比對路徑")
+    ap.add_argument("--memory-budget", type=_ints, default=[0],
+                    help="記憶體上限（MB，0 = 不限制）；>0 時走串流模式，可用來確認峰值 RSS 不隨頁數成長")
+    ap.add_argument("-j", "--workers", type=int, default=1, help="每組的逐頁平行 worker 數（預設 1，逐頁處理）")
+    ap.add_argument("--py-mem", action="store_true", help="另跑一次 tracemalloc 量測各階段 Python 端峰值記憶體")
+    ap.add_argument("-o", "--out", help="結果 JSON 路徑（預設輸出到 stdout）")
+    ap.add_argument("--compare", help="與先前的結果 JSON 比較")
+    ap.add_argument("--min-recall", type=float, help="任一情境的變更召回率低於此值時結束碼為 1")
+    args = ap.parse_args(argv)
+    for e in args.edit:
+        if e not in EDIT_KINDS:
+            ap.error(f"未知的變更種類：{e}")
+
+    scenarios = build_scenarios(args)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_diff_") as tmp:
+        # 每個情境一個全新子程序，峰值 RSS 才準確
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"),
+                                 max_tasks_per_child=1) as pool:
+            for i, sc in enumerate(scenarios, 1):
+                r = pool.submit(run_scenario, sc, tmp, args.workers, args.py_mem).result()
+                results.append(r)
+                acc = r["accuracy"]
+                print(f"[{i}/{len(scenarios)}] {sc} → {r['end_to_end_s']:.3f}s "
+                      f"({r['pages_per_s']} 頁/秒, RSS {r['peak_rss_mb']} MB, "
+                      f"召回 {acc['recall']:.3f}, 精確 {acc['precision']:.3f})", file=sys.stderr)
+
+    report = {
+        "benchmark": "diff",
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    if args.min_recall is not None and any(r["accuracy"]["recall"] < args.min_recall for r in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
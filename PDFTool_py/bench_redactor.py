@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 關鍵字遮罩｜效能基準測試
+
+用 PyMuPDF 在本機產生合成 PDF（頁數、文字密度、中文／拉丁文字、關鍵字數量、命中密度皆可調），
+分別計時 prescreen、search、whole_word 過濾、apply_redactions、save 與端到端 redact_pdf，
+並記錄峰值記憶體。每個情境在獨立的子程序執行，峰值 RSS 才不會互相干擾。
+tracemalloc 會大幅拖慢 Python 端配置，因此 Python 峰值記憶體另外跑一次量測（--py-mem），不影響計時。
+結果為 JSON，可用 --compare 和先前的結果比較。
+
+範例：
+    python bench_redactor.py --quick -o bench_redactor.json
+    python bench_redactor.py --pages 50,500 --script latin,cjk --keywords 20,300 -o new.json --compare old.json
+"""
+import argparse, datetime, hashlib, io, itertools, json, os, platform, random, sys, tempfile, time, tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+
+import fitz  # PyMuPDF
+
+from redact_core import (RedactStats, SAVE_OPTIONS, extract_page_text, find_keyword_hits, get_matcher,
+                         page_may_match, redact_pdf, PageWordIndex)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_CJK_CHARS = "的一是在不了有和人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行學法所民得經"
+_LATIN_SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "to", "su", "vi", "de", "an", "el", "or", "us", "ti", "po", "ge"]
+
+
+# ---------------------- 合成文件 ----------------------
+def _make_word(rng: random.Random, script: str) -> str:
+    if script == "cjk":
+        return "".join(rng.choice(_CJK_CHARS) for _ in range(rng.randint(2, 4)))
+    return "".join(rng.choice(_LATIN_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def make_keywords(n: int, script: str, seed: int = 7):
+    """產生 n 個不會在填充文字中自然出現的關鍵字（前綴固定，避免誤命中）"""
+    rng = random.Random(seed)
+    prefix = "機密" if script == "cjk" else "Zq"
+    return [f"{prefix}{_make_word(rng, script)}{i}" for i in range(n)]
+
+
+def make_pdf(path: str, pages: int, lines: int, script: str, keywords, hit_rate: float, seed: int = 11):
+    """每頁 lines 行文字；每行以 hit_rate 的機率插入一個關鍵字"""
+    rng = random.Random(seed)
+    fontname = "china-t" if script == "cjk" else "helv"
+    fontsize = 9 if script == "cjk" else 8
+    words_per_line = 10 if script == "cjk" else 12
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        y = 40
+        step = (page.rect.height - 80) / max(1, lines)
+        for _ in range(lines):
+            words = [_make_word(rng, script) for _ in range(words_per_line)]
+            if keywords and rng.random() < hit_rate:
+                words[rng.randrange(len(words))] = rng.choice(keywords)
+            page.insert_text((36, y), " ".join(words), fontname=fontname, fontsize=fontsize)
+            y += step
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+# ---------------------- 計時 ----------------------
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(sc: dict, workdir: str, py_mem: bool = False) -> dict:
+    """在子程序中執行單一情境，回傳各階段耗時（秒）與峰值記憶體（MB）"""
+    keywords = make_keywords(sc["keywords"], sc["script"])
+    key = hashlib.sha1(json.dumps(sc, sort_keys=True).encode()).hexdigest()[:12]
+    path = os.path.join(workdir, f"bench_{key}.pdf")
+    t0 = time.perf_counter()
+    make_pdf(path, sc["pages"], sc["lines"], sc["script"], keywords, sc["hit_rate"])
+    gen_s = time.perf_counter() - t0
+
+    timings = dict.fromkeys(("prescreen", "search", "whole_word", "apply", "save"), 0.0)
+    rects_total = hits_total = ww_kept = 0
+    matcher = get_matcher(keywords, True)
+    doc = fitz.open(path)
+    try:
+        for page in doc:
+            t = time.perf_counter()
+            page_may_match(page, keywords, True)
+            timings["prescreen"] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            hits = find_keyword_hits(extract_page_text(page), matcher)
+            timings["search"] += time.perf_counter() - t
+            hits_total += len(hits)
+
+            t = time.perf_counter()
+            if hits:
+                wi = PageWordIndex.from_page(page)
+                ww_kept += sum(1 for ki, rects in hits if wi.is_whole_word(rects, keywords[ki], True))
+            timings["whole_word"] += time.perf_counter() - t
+
+            t = time.perf_counter()
+            rects = [r for _, rs in hits for r in rs]
+            for r in rects:
+                page.add_redact_annot(r, fill=(0, 0, 0))
+            if rects:
+                page.apply_redactions()
+            timings["apply"] += time.perf_counter() - t
+            rects_total += len(rects)
+        t = time.perf_counter()
+        out = io.BytesIO()
+        doc.save(out, **SAVE_OPTIONS)
+        timings["save"] = time.perf_counter() - t
+        out_size = out.getbuffer().nbytes
+        del out
+    finally:
+        doc.close()
+
+    stats = RedactStats()
+    t = time.perf_counter()
+    redact_pdf(path, keywords, True, False, stats)
+    e2e = time.perf_counter() - t
+
+    py_peak = None
+    if py_mem:
+        tracemalloc.start()
+        redact_pdf(path, keywords, True, False)
+        py_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+        tracemalloc.stop()
+    os.remove(path)
+
+    return {
+        "scenario": sc,
+        "generate_s": round(gen_s, 4),
+        "stages_s": {k: round(v, 4) for k, v in timings.items()},
+        "end_to_end_s": round(e2e, 4),
+        "pages_per_s": round(sc["pages"] / e2e, 2) if e2e > 0 else None,
+        "pages_skipped": stats.pages_skipped,
+        "hits": hits_total,
+        "whole_word_kept": ww_kept,
+        "rects": rects_total,
+        "output_bytes": out_size,
+        "py_peak_mb": py_peak,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+# ---------------------- 主程式 ----------------------
+def _ints(s): return [int(x) for x in s.split(",") if x]
+def _floats(s): return [float(x) for x in s.split(",") if x]
+def _strs(s): return [x for x in s.split(",") if x]
+
+
+def build_scenarios(args):
+    if args.quick:
+        grid = dict(pages=[20], lines=[40], script=["latin", "cjk"], keywords=[20, 300], hit_rate=[0.05])
+    else:
+        grid = dict(pages=args.pages, lines=args.lines, script=args.script,
+                    keywords=args.keywords, hit_rate=args.hit_rate)
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[n] for n in names))]
+
+
+def compare(current: dict, baseline: dict):
+    """依情境比對端到端時間，印出速度比（>1 代表變快）"""
+    base = {json.dumps(r["scenario"], sort_keys=True): r for r in baseline.get("results", [])}
+    print(f"{'情境':<60} {'舊(s)':>8} {'新(s)':>8} {'倍率':>6}")
+    for r in current["results"]:
+        k = json.dumps(r["scenario"], sort_keys=True)
+        if k not in base:
+            continue
+        old, new = base[k]["end_to_end_s"], r["end_to_end_s"]
+        ratio = old / new if new else float("inf")
+        print(f"{k[:60]:<60} {old:>8.3f} {new:>8.3f} {ratio:>6.2f}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="PDF 關鍵字遮罩效能基準")
+    ap.add_argument("--quick", action="store_true", help="只跑小型預設矩陣")
+    ap.add_argument("--pages", type=_ints, default=[20, 200])
+    ap.add_argument("--lines", type=_ints, default=[20, 60], help="每頁行數（文字密度）")
+    ap.add_argument("--script", type=_strs, default=["latin", "cjk"])
+    ap.add_argument("--keywords", type=_ints, default=[10, 300])
+    ap.add_argument("--hit-rate", type=_floats, default=[0.01, 0.2], help="每行含關鍵字的機率")
+    ap.add_argument("--py-mem", action="store_true", help="另跑一次 tracemalloc 量測 Python 端峰值記憶體")
+    ap.add_argument("-o", "--out", help="結果 JSON 路徑（預設輸出到 stdout）")
+    ap.add_argument("--compare", help="與先前的結果 JSON 比較")
+    args = ap.parse_args(argv)
+
+    scenarios = build_scenarios(args)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_redact_") as tmp:
+        # 每個情境一個全新子程序，峰值 RSS 才準確
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn"),
+                                 max_tasks_per_child=1) as pool:
+            for i, sc in enumerate(scenarios, 1):
+                r = pool.submit(run_scenario, sc, tmp, args.py_mem).result()
+                results.append(r)
+                print(f"[{i}/{len(scenarios)}] {sc} → {r['end_to_end_s']:.3f}s "
+                      f"({r['pages_per_s']} 頁/秒, RSS {r['peak_rss_mb']} MB)", file=sys.stderr)
+
+    report = {
+        "benchmark": "redactor",
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
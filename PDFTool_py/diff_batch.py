@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜不依賴 UI 的 API 與批次處理
+- diff_pdfs：比對一組 A/B，回傳結構化結果（逐頁相似度、PDF 點座標的差異框、是否變更），需要時才寫出 HTML 報告
+- diff_batch：多組 A/B 以程序池平行比對（每組一個任務）；只有一組時改在該組內逐頁平行
+- diff_chain：多版本 v1→v2→…→vN 逐版比對（可加比第一版 vs 最後一版），搭配 diff_store 每個版本的每一頁只處理一次
+"""
+import os, shutil, tempfile, time, traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass, field, replace
+from typing import List
+
+import fitz  # PyMuPDF
+
+from diff_core import DiffSettings, DEFAULT, PRESETS, extract_texts, page_fingerprints, align_pages, positional_pairs
+from diff_text import document_similarity
+from diff_profile import Profiler
+from diff_parallel import diff_pages_parallel
+from diff_report import ReportWriter, report_output_name, write_chain_index
+from diff_store import RenderStore, file_key
+from diff_stream import diff_stream
+from batch_util import default_workers, make_pool, unique_arcname
+
+CHAIN_REPORT_ZIP = "diff_chain_report.zip"
+
+# 命令列與設定檔用的英文別名
+PRESET_ALIASES = {"standard": "標準（建議）", "high": "高敏感（抓更多差異）", "low": "低敏感（只看明顯差異）"}
+
+
+@dataclass
+class PageDiff:
+    idx: int
+    page_a: int = None            # 1-based；新增頁為 None
+    page_b: int = None            # 1-based；刪除頁為 None
+    status: str = "changed"       # unchanged / changed / inserted / deleted（changed 表示有實際比對）
+    changed: bool = False         # 有差異框、相似度 < 1，或為新增／刪除頁
+    similarity: float = 0.0
+    similarity_exact: bool = True
+    method: str = None            # raster / vector；未比對的列為 None
+    boxes: List[dict] = field(default_factory=list)  # [{"page": "a"/"b", "bbox": [x0, y0, x1, y1]}]，PDF 點
+
+
+@dataclass
+class PairResult:
+    name: str
+    path_a: str
+    path_b: str
+    ok: bool
+    error: str = ""
+    seconds: float = 0.0
+    pages_a: int = 0
+    pages_b: int = 0
+    similarity: float = 0.0
+    changed: bool = False
+    changed_pages: int = 0
+    inserted_pages: int = 0
+    deleted_pages: int = 0
+    boxes: int = 0
+    report: str = ""
+    pages: List[PageDiff] = field(default_factory=list)
+    profile: dict = None          # settings.profile 時：各階段合計、最慢的頁與原始事件（見 diff_profile）
+
+
+def resolve_settings(preset: str = None, **overrides) -> DiffSettings:
+    """依預設模式名稱（中文名稱或 standard/high/low）建立設定，再套用 overrides（值為 None 的略過）"""
+    if preset:
+        name = PRESET_ALIASES.get(preset, preset)
+        if name not in PRESETS:
+            raise ValueError(f"未知的參數模式：{preset}（可用：{'、'.join(list(PRESET_ALIASES) + list(PRESETS))}）")
+        base = PRESETS[name]
+    else:
+        base = DEFAULT
+    return replace(base, **{k: v for k, v in overrides.items() if v is not None})
+
+
+def page_diff(r: dict) -> PageDiff:
+    """diff_page / quick_row_result 的列 → PageDiff"""
+    changed = (r["status"] in ("inserted", "deleted")
+               or (r["status"] == "changed" and (r["boxes_count"] > 0 or r["sim"] < 1.0)))
+    return PageDiff(idx=r["idx"], page_a=r["page_a"], page_b=r["page_b"], status=r["status"], changed=changed,
+                    similarity=round(r["sim"], 6), similarity_exact=r["sim_exact"], method=r.get("method"),
+                    boxes=r.get("boxes_pt") or [])
+
+
+def diff_pdfs(path_a: str, path_b: str, settings: DiffSettings = DEFAULT, align: bool = True,
+              report: str = None, max_workers: int = 1, name: str = None, on_page=None,
+              store: RenderStore = None) -> PairResult:
+    """
+    比對一組 PDF。report 為 .zip 路徑或資料夾時寫出 HTML 報告，否則不編碼任何影像。
+    max_workers > 1 時在這組內逐頁平行。on_page(done, total, PageDiff) 每完成一列呼叫一次。
+    store 有值時文字、指紋與整頁渲染結果都經過磁碟快取（以檔案內容雜湊為鍵）。
+    settings.profile 為 True 時量測各階段耗時，結果放在 PairResult.profile（Profiler.summary() 加上 events）。
+    失敗時不拋例外，回傳 ok=False 的 PairResult。
+    """
+    if not settings.profile:
+        return _diff_pdfs(path_a, path_b, settings, align, report, max_workers, name, on_page, store, None)
+    with Profiler(settings.profile_memory) as prof:
+        return _diff_pdfs(path_a, path_b, settings, align, report, max_workers, name, on_page, store, prof)
+
+
+def _diff_pdfs(path_a, path_b, settings, align, report, max_workers, name, on_page, store, prof) -> PairResult:
+    name = name or f"{os.path.basename(path_a)} vs {os.path.basename(path_b)}"
+    t0 = time.perf_counter()
+    writer = None
+    try:
+        keys = (file_key(path_a), file_key(path_b)) if store is not None else None
+        settings = replace(settings, render_report=bool(report))
+        if report:
+            writer = ReportWriter(report, os.path.basename(path_a), os.path.basename(path_b),
+                                  settings.text_similarity_warn)
+
+        def on_progress(done, total, r):
+            if prof is not None:
+                prof.add_row(r)
+            if writer is not None:
+                writer.add(r)
+            if on_page:
+                on_page(done, total, page_diff(r))
+
+        if settings.memory_budget_mb > 0:
+            # 串流模式：不保留整份文字，平行數與渲染大小依記憶體預算決定
+            res = diff_stream(path_a, path_b, settings, align, max_workers, on_progress, store, keys)
+            rows, overall, n_a, n_b = res.rows, res.similarity, res.pages_a, res.pages_b
+        else:
+            with fitz.open(path_a) as doc_a, fitz.open(path_b) as doc_b:
+                h, f = settings.header_ignore_ratio, settings.footer_ignore_ratio
+                if store is not None:
+                    texts_a, fps_a = store.analysis(keys[0], doc_a, h, f)
+                    texts_b, fps_b = store.analysis(keys[1], doc_b, h, f)
+                else:
+                    texts_a, texts_b = extract_texts(doc_a, h, f), extract_texts(doc_b, h, f)
+                    fps_a, fps_b = page_fingerprints(doc_a, texts_a), page_fingerprints(doc_b, texts_b)
+                n_a, n_b = len(doc_a), len(doc_b)
+            pairs = align_pages(texts_a, texts_b) if align else positional_pairs(n_a, n_b)
+            rows = diff_pages_parallel(path_a, path_b, texts_a, texts_b, fps_a, fps_b, settings,
+                                       max_workers=max_workers, on_progress=on_progress, pairs=pairs,
+                                       store=store, keys=keys)
+            overall = document_similarity(texts_a, texts_b, pairs, [r["sim"] for r in rows])
+        profile = None
+        if prof is not None:
+            profile = prof.summary()
+            profile["events"] = prof.events
+        if writer is not None:
+            writer.finish(overall, profile)
+        pages = [page_diff(r) for r in rows]
+        return PairResult(
+            name, path_a, path_b, True, seconds=round(time.perf_counter() - t0, 3), pages_a=n_a, pages_b=n_b,
+            similarity=round(overall, 6), changed=any(p.changed for p in pages),
+            changed_pages=sum(1 for p in pages if p.changed and p.status == "changed"),
+            inserted_pages=sum(1 for p in pages if p.status == "inserted"),
+            deleted_pages=sum(1 for p in pages if p.status == "deleted"),
+            boxes=sum(len(p.boxes) for p in pages), report=report or "", pages=pages, profile=profile)
+    except Exception as e:
+        traceback.print_exc()
+        if writer is not None:
+            writer.abort()
+        return PairResult(name, path_a, path_b, False, f"{type(e).__name__}: {e}",
+                          seconds=round(time.perf_counter() - t0, 3))
+
+
+def _report_target(report_dir: str, name: str, path_a: str, path_b: str, as_zip: bool, used: set) -> str:
+    base = report_output_name(os.path.basename(path_a), os.path.basename(path_b))
+    rel = os.path.join(os.path.dirname(name or ""), base if as_zip else os.path.splitext(base)[0])
+    target = os.path.join(report_dir, unique_arcname(os.path.normpath(rel), used))
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    return target
+
+
+def diff_batch(jobs, settings: DiffSettings = DEFAULT, align: bool = True, report_dir: str = None,
+               report_zip: bool = True, max_workers: int = None, on_progress=None,
+               store: RenderStore = None) -> List[PairResult]:
+    """
+    jobs：[(名稱, A 路徑, B 路徑), ...]。回傳依 jobs 順序排列的 PairResult。
+    report_dir 有值時每組輸出一份報告（report_zip=False 時輸出成資料夾）。
+    on_progress(done, total, PairResult) 在每組完成時呼叫（完成順序不一定依 jobs 順序）。
+    store 見 diff_pdfs；多個 worker 共用同一個快取目錄是安全的（寫入為原子操作）。
+    settings.memory_budget_mb > 0 時逐組處理（預算是整個批次的上限），平行度用在每組的頁面上。
+    """
+    jobs = list(jobs)
+    workers = max(1, max_workers or default_workers())
+    used = set()
+    targets = [_report_target(report_dir, n, a, b, report_zip, used) if report_dir else None for n, a, b in jobs]
+    budgeted = settings.memory_budget_mb > 0
+    if len(jobs) <= 1 or workers == 1 or budgeted:
+        # 只有一組或有記憶體預算時平行度用在頁面上；workers == 1 時整批逐一處理
+        results = []
+        for (n, a, b), target in zip(jobs, targets):
+            results.append(diff_pdfs(a, b, settings, align, target, workers if len(jobs) == 1 or budgeted else 1, n,
+                                     store=store))
+            if on_progress:
+                on_progress(len(results), len(jobs), results[-1])
+        return results
+
+    results = [None] * len(jobs)
+    done = 0
+    with make_pool(min(workers, len(jobs))) as pool:
+        pending = {pool.submit(diff_pdfs, a, b, settings, align, target, 1, n, None, store): k
+                   for k, ((n, a, b), target) in enumerate(zip(jobs, targets))}
+        try:
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    k = pending.pop(fut)
+                    results[k] = fut.result()
+                    done += 1
+                    if on_progress:
+                        on_progress(done, len(jobs), results[k])
+        except BaseException:
+            for fut in pending:
+                fut.cancel()
+            raise
+    return results
+
+
+def chain_jobs(paths: List[str], first_last: bool = True, names: List[str] = None):
+    """多版本 → [(名稱, A, B), ...]：相鄰兩版依序比對，版本數 > 2 且 first_last 時再加第一版 vs 最後一版"""
+    names = names or [os.path.basename(p) for p in paths]
+    jobs = [(f"v{k+1} → v{k+2}（{names[k]} → {names[k+1]}）", paths[k], paths[k+1]) for k in range(len(paths) - 1)]
+    if first_last and len(paths) > 2:
+        jobs.append((f"v1 → v{len(paths)}（{names[0]} → {names[-1]}）", paths[0], paths[-1]))
+    return jobs
+
+
+def diff_chain(paths: List[str], settings: DiffSettings = DEFAULT, store: RenderStore = None,
+               first_last: bool = True, align: bool = True, report_dir: str = None, report_zip: bool = True,
+               max_workers: int = None, on_progress=None, on_page=None, names: List[str] = None) -> List[PairResult]:
+    """
+    多版本比對。各組依序執行（平行度用在每組的頁面上），前一組已渲染的版本留在 store 中，
+    中間版本不會被渲染兩次；store 省略時在暫存資料夾建立一個，結束後刪除。
+    report_dir 有值時每組一份報告（資料夾），另寫一份 index.html 總覽，以相對連結指向各組的 report.html；
+    report_zip=True 時把總覽與各組報告一起打包成 report_dir/diff_chain_report.zip（瀏覽器無法開啟 ZIP 內的連結，
+    因此不會逐組各自打包），解壓縮後開啟 index.html，各組的 PairResult.report 即為該 ZIP 的路徑。
+    on_progress(done, total, PairResult) 每組完成時呼叫；on_page(k, done, total, PageDiff) 每頁完成時呼叫。
+    """
+    if len(paths) < 2:
+        raise ValueError("多版本比對至少需要兩個檔案")
+    jobs = chain_jobs(paths, first_last, names)
+    if store is None:
+        with tempfile.TemporaryDirectory(prefix="pdf_diff_store_") as tmp:
+            return diff_chain(paths, settings, RenderStore(tmp), first_last, align, report_dir, report_zip,
+                              max_workers, on_progress, on_page, names)
+    if report_dir and report_zip:
+        os.makedirs(report_dir, exist_ok=True)
+        zip_path = os.path.join(report_dir, CHAIN_REPORT_ZIP)
+        with tempfile.TemporaryDirectory(prefix="pdf_chain_", dir=report_dir) as tmp:
+            results = diff_chain(paths, settings, store, first_last, align, tmp, False,
+                                 max_workers, on_progress, on_page, names)
+            shutil.make_archive(os.path.splitext(zip_path)[0], "zip", tmp)
+        for r in results:
+            if r.ok:
+                r.report = zip_path
+        return results
+    workers = max(1, max_workers or default_workers())
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    results, hrefs = [], []
+    for k, (name, a, b) in enumerate(jobs):
+        target = None
+        if report_dir:
+            rel = f"{k+1:02d}_" + os.path.splitext(report_output_name(os.path.basename(a), os.path.basename(b)))[0]
+            target = os.path.join(report_dir, rel)
+            hrefs.append(f"{rel}/report.html")
+        cb = (lambda done, total, p, k=k: on_page(k, done, total, p)) if on_page else None
+        results.append(diff_pdfs(a, b, settings, align, target, workers, name, cb, store))
+        if on_progress:
+            on_progress(len(results), len(jobs), results[-1])
+    if report_dir:
+        write_chain_index(report_dir, names or [os.path.basename(p) for p in paths], results,
+                          [h if r.ok else None for r, h in zip(results, hrefs)], settings.text_similarity_warn)
+    return results
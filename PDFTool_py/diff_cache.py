@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜渲染與分析快取（以檔案內容雜湊為鍵，跨 Streamlit rerun 重用）
+- 已開啟的文件、逐頁文字、頁面指紋、頁面對齊結果、依 (DPI, 模糊半徑) 渲染的頁面影像
+- 影像放進位元組上限的 LRU；指定 spill_dir 時，被淘汰的影像寫成 .npy 暫存到磁碟，下次直接讀回不重新渲染
+- 調整像素閾值、最小面積或合併 padding 時，只重跑遮罩與合併，不重新渲染
+"""
+import hashlib, os, threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from diff_core import (DiffSettings, extract_texts, page_fingerprints, align_pages, positional_pairs,
+                       render_page_gray, render_page_image, compute_overlay_gray, compute_overlay,
+                       compare_pages, BLANK_GRAY_SHAPE)
+
+
+class DiffCache:
+    """LRU 快取；影像 entry 以陣列位元組計，總量不超過 budget_bytes（磁碟暫存另計 spill_budget_bytes）"""
+
+    def __init__(self, budget_bytes: int = 512 * 1024 * 1024, max_docs: int = 4,
+                 spill_dir: str = None, spill_budget_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.budget = budget_bytes
+        self.max_docs = max_docs
+        self.spill_dir = spill_dir
+        self.spill_budget = spill_budget_bytes
+        self._docs = OrderedDict()      # key → fitz.Document
+        self._items = OrderedDict()     # (key, 類型, ...) → (值, size)
+        self._spilled = OrderedDict()   # (key, 類型, ...) → (路徑, size)
+        self._used = 0
+        self._spill_used = 0
+        self._lock = threading.RLock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    # ---------- LRU 基本操作 ----------
+    def _get(self, k):
+        hit = self._items.get(k)
+        if hit is not None:
+            self._items.move_to_end(k)
+            return hit[0]
+        spilled = self._spilled.pop(k, None)
+        if spilled is None:
+            return None
+        path, size = spilled
+        self._spill_used -= size
+        try:
+            arr = np.load(path)
+        except (OSError, ValueError):
+            return None
+        finally:
+            self._remove_file(path)
+        self._put(k, arr, arr.nbytes)
+        return arr
+
+    def _put(self, k, value, size: int):
+        if k in self._items:
+            self._used -= self._items.pop(k)[1]
+        self._items[k] = (value, size)
+        self._used += size
+        while self._used > self.budget and len(self._items) > 1:
+            old_k, (old_v, s) = self._items.popitem(last=False)
+            self._used -= s
+            if isinstance(old_v, np.ndarray):
+                self._spill(old_k, old_v)
+
+    def _spill(self, k, arr: np.ndarray):
+        """被淘汰的影像寫到磁碟；磁碟也超過上限時刪除最舊的暫存檔"""
+        if not self.spill_dir or arr.nbytes > self.spill_budget:
+            return
+        name = hashlib.sha1(repr(k).encode()).hexdigest() + ".npy"
+        path = os.path.join(self.spill_dir, name)
+        try:
+            np.save(path, np.ascontiguousarray(arr), allow_pickle=False)
+        except OSError:
+            return
+        self._spilled[k] = (path, arr.nbytes)
+        self._spill_used += arr.nbytes
+        while self._spill_used > self.spill_budget and self._spilled:
+            _, (p, s) = self._spilled.popitem(last=False)
+            self._spill_used -= s
+            self._remove_file(p)
+
+    @staticmethod
+    def _remove_file(path: str):
+        try: os.remove(path)
+        except OSError: pass
+
+    def _doc(self, key: str, data: bytes) -> fitz.Document:
+        doc = self._docs.get(key)
+        if doc is not None:
+            self._docs.move_to_end(key)
+            return doc
+        doc = fitz.open(stream=data, filetype="pdf")
+        self._docs[key] = doc
+        while len(self._docs) > self.max_docs:
+            _, old = self._docs.popitem(last=False)
+            old.close()
+        return doc
+
+    def clear(self):
+        with self._lock:
+            for doc in self._docs.values():
+                doc.close()
+            self._docs.clear()
+            self._items.clear()
+            for path, _ in self._spilled.values():
+                self._remove_file(path)
+            self._spilled.clear()
+            self._used = self._spill_used = 0
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    @property
+    def spilled_bytes(self) -> int:
+        return self._spill_used
+
+    # ---------- 文件層級分析 ----------
+    def page_count(self, key: str, data: bytes) -> int:
+        with self._lock:
+            return len(self._doc(key, data))
+
+    def texts(self, key: str, data: bytes, head_ratio: float, foot_ratio: float):
+        """逐頁正規化文字（快取）"""
+        with self._lock:
+            k = (key, "texts", head_ratio, foot_ratio)
+            v = self._get(k)
+            if v is None:
+                v = extract_texts(self._doc(key, data), head_ratio, foot_ratio)
+                self._put(k, v, 64 + sum(2 * len(t) for t in v))
+            return v
+
+    def fingerprints(self, key: str, data: bytes, head_ratio: float, foot_ratio: float):
+        """逐頁指紋（快取；指紋包含文字，因此也依頁首／頁尾比例區分）"""
+        with self._lock:
+            k = (key, "fps", head_ratio, foot_ratio)
+            v = self._get(k)
+            if v is None:
+                v = page_fingerprints(self._doc(key, data), self.texts(key, data, head_ratio, foot_ratio))
+                self._put(k, v, 64 + 48 * len(v))
+            return v
+
+    def pairs(self, key_a: str, data_a: bytes, key_b: str, data_b: bytes,
+              head_ratio: float, foot_ratio: float, align: bool = True):
+        """頁面對齊結果（快取）"""
+        with self._lock:
+            if not align:
+                return positional_pairs(self.page_count(key_a, data_a), self.page_count(key_b, data_b))
+            k = (key_a, "pairs", key_b, head_ratio, foot_ratio)
+            v = self._get(k)
+            if v is None:
+                v = align_pages(self.texts(key_a, data_a, head_ratio, foot_ratio),
+                                self.texts(key_b, data_b, head_ratio, foot_ratio))
+                self._put(k, v, 64 + 32 * len(v))
+            return v
+
+    # ---------- 頁面影像 ----------
+    def render(self, key: str, data: bytes, pno: int, dpi: int, max_side: int, blur: int,
+               grayscale: bool = True) -> np.ndarray:
+        """渲染單頁（快取）；灰階為 (h, w) uint8，彩色為 (h, w, 3)。回傳的陣列請勿修改"""
+        with self._lock:
+            k = (key, "gray" if grayscale else "rgb", pno, dpi, max_side, blur)
+            arr = self._get(k)
+            if arr is None:
+                page = self._doc(key, data).load_page(pno)
+                if grayscale:
+                    arr = np.ascontiguousarray(render_page_gray(page, dpi, max_side, blur))
+                else:
+                    arr = np.asarray(render_page_image(page, dpi, max_side, blur))
+                self._put(k, arr, arr.nbytes)
+            return arr
+
+    def compare(self, key_a: str, data_a: bytes, key_b: str, data_b: bytes, pno_a, pno_b,
+                settings: DiffSettings):
+        """
+        預覽用的單頁比對：渲染結果取自快取，只重跑遮罩、標記與合併。
+        pno_a / pno_b 可為 None（該側視為空白頁）。回傳值與 compare_pages 相同。
+        """
+        s = settings
+        if s.coarse_dpi > 0 and pno_a is not None and pno_b is not None:
+            # 由粗到細模式本身只渲染差異區塊，不經過整頁快取
+            with self._lock:
+                pa = self._doc(key_a, data_a).load_page(pno_a)
+                pb = self._doc(key_b, data_b).load_page(pno_b)
+                return compare_pages(pa, pb, s.dpi, s.max_image_side, s.blur_radius, s.pixel_threshold,
+                                     s.bbox_min_area, s.merge_padding, s.grayscale, s.coarse_dpi)
+        if s.grayscale:
+            blank = np.full(BLANK_GRAY_SHAPE, 255, dtype=np.uint8)
+            arr_a = self.render(key_a, data_a, pno_a, s.dpi, s.max_image_side, s.blur_radius) if pno_a is not None else blank
+            arr_b = self.render(key_b, data_b, pno_b, s.dpi, s.max_image_side, s.blur_radius) if pno_b is not None else blank
+            overlay, boxes = compute_overlay_gray(arr_a, arr_b, s.pixel_threshold, s.bbox_min_area, s.merge_padding)
+            return arr_a, arr_b, overlay, boxes
+        blank = Image.new("RGB", (BLANK_GRAY_SHAPE[1], BLANK_GRAY_SHAPE[0]), (255, 255, 255))
+        img_a = Image.fromarray(self.render(key_a, data_a, pno_a, s.dpi, s.max_image_side, s.blur_radius, False)) \
+            if pno_a is not None else blank
+        img_b = Image.fromarray(self.render(key_b, data_b, pno_b, s.dpi, s.max_image_side, s.blur_radius, False)) \
+            if pno_b is not None else blank
+        overlay, boxes = compute_overlay(img_a, img_b, s.pixel_threshold, s.bbox_min_area, s.merge_padding)
+        return img_a, img_b, overlay, boxes
+
+    def page(self, key: str, data: bytes, pno: int) -> fitz.Page:
+        """供向量模式等需要頁面物件的呼叫端使用（文件由快取持有，請勿關閉）"""
+        with self._lock:
+            return self._doc(key, data).load_page(pno)
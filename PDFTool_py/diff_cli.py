@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜命令列版（不需 Streamlit，可排入夜間批次或 CI）
+
+輸入方式（可混用）：
+- 直接給一組 A B：            python diff_cli.py old.pdf new.pdf
+- 清單檔（CSV/TSV：A,B[,名稱]；或 JSON / NDJSON：{"a": ..., "b": ..., "name": ...}），相對路徑以清單檔所在資料夾為準
+- 兩個資料夾依相對路徑配對：  --dir-a released/ --dir-b candidate/
+- 多版本（v1→v2→…，另加 v1 vs 最後一版）：--chain v1.pdf v2.pdf v3.pdf
+
+範例：
+    python diff_cli.py --manifest pairs.csv -j 8 --ndjson - --fail-on-change
+    python diff_cli.py --dir-a v1/ --dir-b v2/ --preset high --json summary.json --report-dir reports/
+    python diff_cli.py a.pdf b.pdf --mode vector --summary-only --json -
+    python diff_cli.py a.pdf b.pdf --profile --trace trace.json --json profile.json
+    python diff_cli.py --chain spec_v1.pdf spec_v2.pdf spec_v3.pdf --store ~/.cache/pdf_diff --report-dir out/
+
+結束碼見 --help（比對失敗與「有差異」使用不同的結束碼）
+"""
+import argparse, csv, json, os, sys, time
+from dataclasses import asdict
+
+from diff_core import DiffSettings
+from diff_batch import diff_batch, diff_chain, resolve_settings, PRESET_ALIASES
+from diff_store import RenderStore
+from diff_profile import chrome_trace
+from batch_util import default_workers, collect_inputs
+
+EXIT_OK, EXIT_CHANGED, EXIT_USAGE, EXIT_FAILED = 0, 1, 2, 3
+EXIT_HELP = f"""結束碼：
+  {EXIT_OK}  完成（有差異但未指定 --fail-on-change 時也是 {EXIT_OK}）
+  {EXIT_CHANGED}  有差異且指定了 --fail-on-change
+  {EXIT_USAGE}  參數或輸入錯誤
+  {EXIT_FAILED}  至少一組比對失敗（無法開檔、渲染錯誤等；優先於 {EXIT_CHANGED}）"""
+
+
+def read_manifest(path: str):
+    """清單檔 → [(名稱, A 路徑, B 路徑), ...]；# 開頭的行與空行略過"""
+    base = os.path.dirname(os.path.abspath(path))
+    resolve = lambda p: p if os.path.isabs(p) else os.path.join(base, p)
+    jobs = []
+    with open(path, encoding="utf-8-sig") as f:
+        if path.lower().endswith((".json", ".jsonl", ".ndjson")):
+            text = f.read()
+            try:
+                items = json.loads(text)
+            except json.JSONDecodeError:
+                items = [json.loads(line) for line in text.splitlines() if line.strip()]
+            if isinstance(items, dict):
+                items = [items]
+            for it in items:
+                jobs.append((it.get("name") or "", resolve(it["a"]), resolve(it["b"])))
+        else:
+            lines = [ln for ln in f if ln.strip() and not ln.lstrip().startswith("#")]
+            delim = "\t" if lines and "\t" in lines[0] else ","
+            for row in csv.reader(lines, delimiter=delim):
+                row = [c.strip() for c in row]
+                if len(row) < 2:
+                    raise ValueError(f"清單格式錯誤（至少需要 A,B 兩欄）：{row}")
+                if row[0].lower() in ("a", "path_a") and row[1].lower() in ("b", "path_b"):
+                    continue  # 標題列
+                jobs.append((row[2] if len(row) > 2 else "", resolve(row[0]), resolve(row[1])))
+    return jobs
+
+
+def pair_dirs(dir_a: str, dir_b: str, recursive: bool = True):
+    """兩個資料夾依相對路徑配對；回傳 (jobs, 只在 A 的檔案, 只在 B 的檔案)"""
+    a = dict(collect_inputs([dir_a], recursive))
+    b = dict(collect_inputs([dir_b], recursive))
+    jobs = [(rel, a[rel], b[rel]) for rel in sorted(a) if rel in b]
+    return jobs, sorted(set(a) - set(b)), sorted(set(b) - set(a))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="PDF 差異比對（命令列版）", epilog=EXIT_HELP,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("pair", nargs="*", metavar="PDF", help="一組 A B（兩個檔案）；搭配 --chain 時為依序排列的各版本")
+    ap.add_argument("--chain", action="store_true", help="多版本模式：相鄰版本依序比對")
+    ap.add_argument("--no-first-last", action="store_true", help="多版本模式不另外比對第一版 vs 最後一版")
+    ap.add_argument("--store", help="磁碟渲染快取資料夾（以檔案內容雜湊為鍵，可跨執行重用）")
+    ap.add_argument("--store-max-mb", type=int, default=0, help="結束時把快取修剪到此大小（MB，0 = 不修剪）")
+    ap.add_argument("-m", "--manifest", action="append", default=[], help="清單檔（CSV/TSV/JSON/NDJSON，可重複指定）")
+    ap.add_argument("--dir-a", help="A 資料夾（與 --dir-b 依相對路徑配對）")
+    ap.add_argument("--dir-b", help="B 資料夾")
+    ap.add_argument("--no-recursive", action="store_true", help="資料夾輸入時不遞迴子資料夾")
+    g = ap.add_argument_group("比對參數（未指定的沿用參數模式）")
+    g.add_argument("--preset", default="standard", help=f"參數模式：{'/'.join(PRESET_ALIASES)} 或中文名稱")
+    g.add_argument("--mode", choices=["raster", "vector"], help="比對方式")
+    g.add_argument("--dpi", type=int)
+    g.add_argument("--threshold", dest="pixel_threshold", type=int, help="像素差異閾值")
+    g.add_argument("--min-area", dest="bbox_min_area", type=int, help="最小差異框面積")
+    g.add_argument("--merge-padding", type=int, help="框合併 padding")
+    g.add_argument("--blur", dest="blur_radius", type=int, help="模糊半徑")
+    g.add_argument("--header", dest="header_ignore_ratio", type=float, help="忽略頁首比例")
+    g.add_argument("--footer", dest="footer_ignore_ratio", type=float, help="忽略頁尾比例")
+    g.add_argument("--coarse-dpi", type=int, help="由粗到細的粗略 DPI（0 = 關閉）")
+    g.add_argument("--color", action="store_true", help="彩色比對（預設灰階）")
+    g.add_argument("--no-align", action="store_true", help="不做頁面對齊，依頁碼位置配對")
+    ap.add_argument("-j", "--jobs", type=int, default=default_workers(), help="平行處理數")
+    ap.add_argument("--memory-budget", dest="memory_budget_mb", type=int,
+                    help="記憶體上限（MB）：改用串流模式逐頁處理大檔，平行數與渲染大小依此調整，各組依序處理")
+    ap.add_argument("--json", dest="json_path", help="全部完成後寫出 JSON 摘要（'-' 代表 stdout）")
+    ap.add_argument("--ndjson", dest="ndjson_path", help="每組完成就寫出一行 JSON（'-' 代表 stdout）")
+    ap.add_argument("--summary-only", action="store_true", help="JSON 不含逐頁明細")
+    ap.add_argument("--report-dir", help="每組輸出 HTML 報告（ZIP）到此資料夾；--chain 時各組報告與 index.html 打包成一個 ZIP；未指定則不產生影像")
+    ap.add_argument("--report-folder", action="store_true",
+                    help="報告輸出成資料夾而非 ZIP（--chain 時不打包，直接開啟 report-dir 內的 index.html）")
+    ap.add_argument("--profile", action="store_true", help="量測各階段耗時（結果放在 JSON 的 profile 欄位）")
+    ap.add_argument("--profile-memory", action="store_true", help="另量測各階段 Python／NumPy 峰值記憶體（較慢）")
+    ap.add_argument("--profile-events", action="store_true", help="JSON 中保留每個量測事件（預設只留摘要）")
+    ap.add_argument("--trace", help="把所有組的量測事件寫成 Chrome trace（chrome://tracing／Perfetto 開啟）")
+    ap.add_argument("--fail-on-change", action="store_true", help=f"任一組有差異時以結束碼 {EXIT_CHANGED} 結束（CI 用）")
+    ap.add_argument("-q", "--quiet", action="store_true", help="不顯示逐組進度")
+    return ap
+
+
+def _settings(args) -> DiffSettings:
+    overrides = {k: getattr(args, k) for k in ("mode", "dpi", "pixel_threshold", "bbox_min_area", "merge_padding",
+                                               "blur_radius", "header_ignore_ratio", "footer_ignore_ratio",
+                                               "coarse_dpi", "memory_budget_mb")}
+    if args.color:
+        overrides["grayscale"] = False
+    overrides["render_report"] = bool(args.report_dir)
+    if args.profile or args.profile_memory or args.trace:
+        overrides["profile"] = True
+        overrides["profile_memory"] = args.profile_memory
+    return resolve_settings(args.preset, **overrides)
+
+
+def _result_dict(r, summary_only: bool, events: bool = False) -> dict:
+    d = asdict(r)
+    if summary_only:
+        d.pop("pages")
+    if d.get("profile") and not events:
+        d["profile"] = {k: v for k, v in d["profile"].items() if k != "events"}
+    return d
+
+
+def _open_out(path: str):
+    return sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+
+def main(argv=None) -> int:
+    ap = build_parser()
+    args = ap.parse_args(argv)
+    if args.chain:
+        if len(args.pair) < 2 or args.manifest or args.dir_a:
+            ap.error("--chain 需要至少兩個依序排列的 PDF，且不能與 --manifest／--dir-a 混用")
+    elif len(args.pair) not in (0, 2):
+        ap.error("直接指定時需要剛好兩個 PDF（A B）")
+    if bool(args.dir_a) != bool(args.dir_b):
+        ap.error("--dir-a 與 --dir-b 需一起指定")
+    try:
+        settings = _settings(args)
+        jobs = [("", os.path.abspath(args.pair[0]), os.path.abspath(args.pair[1]))] if args.pair and not args.chain else []
+        for m in args.manifest:
+            jobs.extend(read_manifest(m))
+        only_a = only_b = []
+        if args.dir_a:
+            paired, only_a, only_b = pair_dirs(args.dir_a, args.dir_b, not args.no_recursive)
+            jobs.extend(paired)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"錯誤：{e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not jobs and not args.chain:
+        print("錯誤：沒有任何要比對的 A/B 組合", file=sys.stderr)
+        return EXIT_USAGE
+    if not args.quiet:
+        for rel in only_a:
+            print(f"[略過] 只在 A：{rel}", file=sys.stderr)
+        for rel in only_b:
+            print(f"[略過] 只在 B：{rel}", file=sys.stderr)
+    if args.report_dir:
+        os.makedirs(args.report_dir, exist_ok=True)
+
+    nd = _open_out(args.ndjson_path) if args.ndjson_path else None
+
+    def on_progress(done, total, r):
+        if nd is not None:
+            nd.write(json.dumps(_result_dict(r, args.summary_only, args.profile_events), ensure_ascii=False) + "\n")
+            nd.flush()
+        if args.quiet:
+            return
+        if r.ok:
+            mark = "DIFF" if r.changed else "SAME"
+            extra = (f"相似度 {r.similarity:.4f}、變更 {r.changed_pages} 頁、新增 {r.inserted_pages}、"
+                     f"刪除 {r.deleted_pages}、{r.seconds:.2f}s")
+        else:
+            mark, extra = "ERR ", r.error
+        print(f"[{done}/{total}] {mark} {r.name or os.path.basename(r.path_a)}  {extra}", file=sys.stderr)
+
+    store = RenderStore(args.store) if args.store else None
+    t0 = time.perf_counter()
+    try:
+        if args.chain:
+            results = diff_chain([os.path.abspath(p) for p in args.pair], settings, store,
+                                 first_last=not args.no_first_last, align=not args.no_align,
+                                 report_dir=args.report_dir, report_zip=not args.report_folder,
+                                 max_workers=args.jobs, on_progress=on_progress)
+        else:
+            results = diff_batch(jobs, settings, align=not args.no_align, report_dir=args.report_dir,
+                                 report_zip=not args.report_folder, max_workers=args.jobs,
+                                 on_progress=on_progress, store=store)
+    finally:
+        if nd is not None and nd is not sys.stdout:
+            nd.close()
+        if store is not None and args.store_max_mb > 0:
+            store.prune(args.store_max_mb * 1024 * 1024)
+    elapsed = time.perf_counter() - t0
+
+    if args.trace:
+        with open(args.trace, "w", encoding="utf-8") as f:
+            f.write(chrome_trace([e for r in results if r.profile for e in r.profile["events"]]))
+    failed = [r for r in results if not r.ok]
+    changed = [r for r in results if r.ok and r.changed]
+    if args.json_path:
+        summary = {
+            "settings": asdict(settings),
+            "pairs": len(results),
+            "changed": len(changed),
+            "failed": len(failed),
+            "unpaired_a": only_a,
+            "unpaired_b": only_b,
+            "seconds": round(elapsed, 3),
+            "pages": sum(r.pages_a for r in results),
+            "results": [_result_dict(r, args.summary_only, args.profile_events) for r in results],
+        }
+        out = _open_out(args.json_path)
+        try:
+            out.write(json.dumps(summary, ensure_ascii=False, indent=2) + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    if not args.quiet:
+        print(f"完成 {len(results) - len(failed)}/{len(results)} 組，有差異 {len(changed)} 組，"
+              f"耗時 {elapsed:.1f}s", file=sys.stderr)
+    if failed:
+        return EXIT_FAILED
+    return EXIT_CHANGED if args.fail_on_change and changed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
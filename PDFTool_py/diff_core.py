@@ -0,0 +1,1062 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜核心（不依賴 Streamlit，可供 UI、平行 worker 與命令列共用）
+"""
+import io, os, ctypes, difflib, hashlib, unicodedata, gc
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, features
+import numpy as np
+
+from diff_text import similarity_bounded, unified_diff_html, sequence_blocks, MAX_D_TOKENS
+from diff_profile import Profiler, profiled, stage
+
+
+# ---------------------- 設定 ----------------------
+@dataclass
+class DiffSettings:
+    dpi: int = 220
+    header_ignore_ratio: float = 0.05
+    footer_ignore_ratio: float = 0.05
+    pixel_threshold: int = 18
+    bbox_min_area: int = 250
+    text_similarity_warn: float = 0.985
+    max_image_side: int = 3000
+    blur_radius: int = 1
+    merge_padding: int = 10
+    grayscale: bool = True  # 灰階 NumPy 比對路徑（記憶體約為 RGB 路徑的 1/3）
+    coarse_dpi: int = 0     # >0 時啟用由粗到細：先以此 DPI 比對區塊，只在有差異的區塊以完整 DPI 重新渲染
+    report_image_format: str = "webp"  # 報告疊圖格式：webp / jpeg（Pillow 不支援 WebP 時自動改用 JPEG）
+    report_max_side: int = 1600        # 報告疊圖長邊上限（像素）
+    report_quality: int = 80
+    report_crops: int = 6              # 每頁最多附幾張「只含差異區域」的裁切圖（0 = 不附）
+    mode: str = "raster"               # raster：點陣比對；vector：以文字座標比對，圖片／向量圖形有變更的頁才改走點陣
+    render_report: bool = True         # False：不編碼疊圖／裁切圖、不產生文字 diff（只需要結構化結果時使用）
+    profile: bool = False              # 逐頁逐階段量測耗時，結果放在每列的 r["profile"]（見 diff_profile）
+    profile_memory: bool = False       # 另以 tracemalloc 量測各階段 Python／NumPy 峰值記憶體（較慢）
+    memory_budget_mb: int = 0          # >0 時以串流模式處理（見 diff_stream），整個比對的記憶體以此為上限
+
+
+DEFAULT = DiffSettings()
+
+# 三種預設模式（使用者不懂就用這些，不必展開進階設定）
+PRESETS = {
+    "標準（建議）": DiffSettings(
+        dpi=220, pixel_threshold=18, bbox_min_area=250,
+        header_ignore_ratio=0.05, footer_ignore_ratio=0.05,
+        blur_radius=1, merge_padding=10
+    ),
+    "高敏感（抓更多差異）": DiffSettings(
+        dpi=240, pixel_threshold=12, bbox_min_area=150,
+        header_ignore_ratio=0.04, footer_ignore_ratio=0.04,
+        blur_radius=1, merge_padding=8
+    ),
+    "低敏感（只看明顯差異）": DiffSettings(
+        dpi=180, pixel_threshold=28, bbox_min_area=400,
+        header_ignore_ratio=0.06, footer_ignore_ratio=0.06,
+        blur_radius=0, merge_padding=12
+    ),
+}
+
+
+# ---------------------- 工具函式 ----------------------
+def normalize_text(text: str) -> str:
+    if not text:
+        return ""
+    try:
+        text = unicodedata.normalize("NFKC", text)
+        for ch in ["\u00ad", "\ufeff", "\u200b", "\u200c", "\u200d", "\u2060"]:
+            text = text.replace(ch, "")
+        lines = []
+        for line in text.replace("\r\n","\n").replace("\r","\n").split("\n"):
+            lines.append(" ".join(line.split()))
+        return "\n".join(lines).strip()
+    except Exception:
+        return text.strip()
+
+
+def extract_page_text(page: fitz.Page, head_ratio: float, foot_ratio: float) -> str:
+    """單頁正規化文字（略過頁首／頁尾比例內的文字區塊）；失敗時回傳空字串"""
+    try:
+        ph = page.rect.height
+        top_cut = head_ratio * ph
+        bottom_cut = (1.0 - foot_ratio) * ph
+        blocks = page.get_text("blocks")
+        parts = []
+        for b in blocks:
+            if len(b) < 5:
+                continue
+            x0,y0,x1,y1,txt = b[:5]
+            if y1 <= top_cut or y0 >= bottom_cut:
+                continue
+            if txt and txt.strip():
+                parts.append(txt)
+        ptxt = "\n".join(parts) if parts else page.get_text("text")
+        return normalize_text(ptxt)
+    except Exception as e:
+        print(f"[warn] 第 {page.number+1} 頁取文失敗：{e}")
+        return ""
+
+
+@profiled("extract")
+def extract_texts(doc: fitz.Document, head_ratio: float, foot_ratio: float) -> List[str]:
+    texts = []
+    for i in range(len(doc)):
+        try:
+            page = doc.load_page(i)
+        except Exception as e:
+            print(f"[warn] 第 {i+1} 頁取文失敗：{e}")
+            texts.append("")
+            continue
+        texts.append(extract_page_text(page, head_ratio, foot_ratio))
+    return texts
+
+
+# ---------------------- 頁面指紋（快速判斷未變更頁） ----------------------
+def _xref_digest(doc: fitz.Document, xref: int, cache: dict) -> str:
+    """xref 原始串流的雜湊；xref 編號在兩份文件間不具意義，因此比對的是內容而不是編號"""
+    d = cache.get(xref)
+    if d is None:
+        try:
+            raw = doc.xref_stream_raw(xref) or b""
+        except Exception:
+            raw = doc.xref_object(xref, compressed=True).encode("utf-8", "replace")
+        d = hashlib.sha1(raw).hexdigest()
+        cache[xref] = d
+    return d
+
+
+def page_fingerprint(doc: fitz.Document, page: fitz.Page, text: str, cache: dict = None) -> str:
+    """
+    以正規化文字、頁面幾何、content stream、引用的影像／Form XObject 串流、字型與註解組成指紋。
+    兩頁指紋相同即視為渲染結果相同，可略過點陣比對；任何一項讀取失敗都回傳唯一值（一律視為有變更）。
+    """
+    cache = {} if cache is None else cache
+    h = hashlib.sha1()
+    try:
+        h.update(text.encode("utf-8"))
+        h.update(repr((tuple(page.rect), tuple(page.cropbox), page.rotation)).encode())
+        h.update(page.read_contents() or b"")
+        for img in page.get_images(full=True):
+            h.update(f"img:{img[7]}:{_xref_digest(doc, img[0], cache)}".encode())
+        for xo in page.get_xobjects():
+            h.update(f"form:{xo[1]}:{_xref_digest(doc, xo[0], cache)}".encode())
+        for f in page.get_fonts(full=True):
+            h.update(f"font:{f[4]}:{f[3]}:{_xref_digest(doc, f[0], cache) if f[0] else ''}".encode())
+        for annot in page.annots() or []:
+            h.update(repr((annot.type[0], tuple(annot.rect), annot.info.get("content", ""),
+                           annot.colors, annot.border)).encode("utf-8", "replace"))
+            ap = doc.xref_get_key(annot.xref, "AP/N")
+            if ap[0] == "xref":
+                h.update(_xref_digest(doc, int(ap[1].split()[0]), cache).encode())
+    except Exception as e:
+        print(f"[warn] 第 {page.number+1} 頁指紋計算失敗：{e}")
+        return f"error:{os.urandom(8).hex()}"
+    return h.hexdigest()
+
+
+@profiled("fingerprint")
+def page_fingerprints(doc: fitz.Document, texts: List[str]) -> List[str]:
+    """整份文件逐頁指紋；texts 為 extract_texts 的結果（與頁數對齊）"""
+    cache = {}
+    return [page_fingerprint(doc, doc.load_page(i), texts[i] if i < len(texts) else "", cache)
+            for i in range(len(doc))]
+
+
+def render_matrix(page: fitz.Page, dpi: int, max_side: int) -> fitz.Matrix:
+    zoom = dpi / 72.0
+    est_w = int(page.rect.width * zoom)
+    est_h = int(page.rect.height * zoom)
+    if max(est_w, est_h) > max_side:
+        zoom *= max_side / max(est_w, est_h)
+    return fitz.Matrix(zoom, zoom)
+
+
+@profiled("render")
+def render_page_image(page: fitz.Page, dpi: int, max_side: int, blur: int=0) -> Image.Image:
+    try:
+        mat = render_matrix(page, dpi, max_side)
+        pix = page.get_pixmap(matrix=mat, alpha=False)
+        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        if blur > 0:
+            img = img.filter(ImageFilter.GaussianBlur(blur))
+        return img
+    except Exception as e:
+        print(f"[warn] 渲染頁面失敗：{e}")
+        return Image.new("RGB", (800, 1000), (255,255,255))
+
+
+# ---------------------- 灰階 NumPy 比對路徑 ----------------------
+BLANK_GRAY_SHAPE = (1000, 800)
+
+
+def pixmap_array(pix: fitz.Pixmap) -> np.ndarray:
+    """把 pix.samples 包成 NumPy 陣列而不複製；陣列持有 pixmap 參考，底層記憶體不會先被釋放"""
+    buf = (ctypes.c_uint8 * (pix.stride * pix.height)).from_address(pix.samples_ptr)
+    buf._pixmap = pix
+    arr = np.frombuffer(buf, dtype=np.uint8).reshape(pix.height, pix.stride)
+    arr = arr[:, :pix.width * pix.n]
+    return arr if pix.n == 1 else arr.reshape(pix.height, pix.width, pix.n)
+
+
+def _gaussian_kernel(radius: float) -> np.ndarray:
+    half = max(1, int(np.ceil(3 * radius)))
+    x = np.arange(-half, half + 1, dtype=np.float32)
+    kernel = np.exp(-(x * x) / (2 * radius * radius))
+    return kernel / kernel.sum()
+
+
+def gaussian_blur_gray(arr: np.ndarray, radius: float, strip_rows: int = 256) -> np.ndarray:
+    """
+    可分離高斯模糊（sigma = radius，與 PIL GaussianBlur 相同定義），邊緣以複製邊界處理。
+    逐段（strip_rows 列）計算，float32 暫存只跟段高成正比，不會配置整頁大小的浮點陣列。
+    """
+    if radius <= 0:
+        return arr
+    kernel = _gaussian_kernel(radius)
+    half = len(kernel) // 2
+    h, w = arr.shape
+    out = np.empty((h, w), dtype=np.uint8)
+    for y0 in range(0, h, strip_rows):
+        y1 = min(h, y0 + strip_rows)
+        # 段落上下各多取 half 列當作垂直方向的鄰域（超出頁面以邊界列補）
+        rows = np.clip(np.arange(y0 - half, y1 + half), 0, h - 1)
+        src = np.pad(arr[rows], ((0, 0), (half, half)), mode="edge")
+        tmp = np.zeros((len(rows), w), dtype=np.float32)
+        for i, k in enumerate(kernel):
+            tmp += k * src[:, i:i + w]
+        acc = np.zeros((y1 - y0, w), dtype=np.float32)
+        for i, k in enumerate(kernel):
+            acc += k * tmp[i:i + y1 - y0]
+        np.clip(acc + 0.5, 0, 255, out=acc)
+        out[y0:y1] = acc
+    return out
+
+
+@profiled("render")
+def render_page_gray(page: fitz.Page, dpi: int, max_side: int, blur: int=0) -> np.ndarray:
+    """直接渲染成灰階 pixmap 並以 NumPy 陣列回傳（不模糊時零複製）"""
+    try:
+        pix = page.get_pixmap(matrix=render_matrix(page, dpi, max_side), colorspace=fitz.csGRAY, alpha=False)
+        return gaussian_blur_gray(pixmap_array(pix), blur)
+    except Exception as e:
+        print(f"[warn] 渲染頁面失敗：{e}")
+        return np.full(BLANK_GRAY_SHAPE, 255, dtype=np.uint8)
+
+
+@profiled("mask")
+def diff_mask_gray(a: np.ndarray, b: np.ndarray, thr: int) -> np.ndarray:
+    """
+    灰階差異遮罩（bool）。尺寸不同時，較小的一邊視為以白色補齊：
+    只在重疊區做 |a-b|，多出的區域直接與白色比較，不實際配置補白後的影像。
+    """
+    h = max(a.shape[0], b.shape[0]); w = max(a.shape[1], b.shape[1])
+    ch = min(a.shape[0], b.shape[0]); cw = min(a.shape[1], b.shape[1])
+    mask = np.zeros((h, w), dtype=bool)
+    ca, cb = a[:ch, :cw], b[:ch, :cw]
+    # uint8 下以 max - min 取絕對差，避免溢位也不必升成 int16
+    mask[:ch, :cw] = (np.maximum(ca, cb) - np.minimum(ca, cb)) >= thr
+    for img in (a, b):
+        ih, iw = img.shape
+        if iw > cw:
+            mask[:ih, cw:iw] |= (255 - img[:, cw:]) >= thr
+        if ih > ch:
+            mask[ch:ih, :iw] |= (255 - img[ch:, :]) >= thr
+    return mask
+
+
+def pad_gray(arr: np.ndarray, shape: Tuple[int,int]) -> np.ndarray:
+    if arr.shape == shape:
+        return arr
+    out = np.full(shape, 255, dtype=np.uint8)
+    out[:arr.shape[0], :arr.shape[1]] = arr
+    return out
+
+
+@profiled("overlay")
+def draw_overlay(base: Image.Image, boxes: List[Tuple[int,int,int,int]]) -> Image.Image:
+    """在底圖上畫出差異紅框（只用於最後要顯示／輸出的影像）"""
+    ov = base.convert("RGBA") if base.mode not in ("RGB", "RGBA") else base.copy()
+    dr = ImageDraw.Draw(ov, "RGBA")
+    for (x0,y0,x1,y1) in boxes:
+        dr.rectangle([x0,y0,x1,y1], outline=(255,0,0,255), width=2)
+        dr.rectangle([x0,y0,x1,y1], fill=(255,0,0,40))
+    return ov
+
+
+def compute_boxes_gray(arr_a: np.ndarray, arr_b: np.ndarray, thr: int, min_area: int, merge_pad_px: int) -> List[Tuple[int,int,int,int]]:
+    mask = diff_mask_gray(arr_a, arr_b, thr)
+    comps = find_components(mask, min_area)
+    del mask
+    return [b for b in merge_boxes(comps, merge_pad_px) if (b[2]-b[0])*(b[3]-b[1])>=min_area]
+
+
+def compute_overlay_gray(arr_a: np.ndarray, arr_b: np.ndarray, thr: int, min_area: int, merge_pad_px: int) -> Tuple[Image.Image, List[Tuple[int,int,int,int]]]:
+    """灰階版 compute_overlay：遮罩、標記、合併全在陣列上做，最後才建立一張 RGB 疊圖"""
+    boxes = compute_boxes_gray(arr_a, arr_b, thr, min_area, merge_pad_px)
+    shape = (max(arr_a.shape[0], arr_b.shape[0]), max(arr_a.shape[1], arr_b.shape[1]))
+    base = Image.fromarray(pad_gray(arr_b, shape), "L").convert("RGB")
+    return draw_overlay(base, boxes), boxes
+
+
+# ---------------------- 由粗到細的區塊比對 ----------------------
+TILE_PX = 32            # 粗略渲染下的區塊邊長（像素）
+COARSE_TOLERANCE = 2    # 粗略影像上灰階差 >= 此值的區塊才細看（反鋸齒會把小改動淡化，因此門檻要低）
+TILED_OVERLAY_DPI = 150 # 由粗到細模式下疊圖底圖的解析度（差異框仍以完整 DPI 計算）
+
+
+@profiled("render")
+def _render_gray_at(page: fitz.Page, zoom: float, clip: fitz.Rect = None) -> fitz.Pixmap:
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False, clip=clip)
+
+
+def _clip_canvas(page: fitz.Page, zoom: float, ix0: int, iy0: int, ix1: int, iy1: int, blur: int) -> np.ndarray:
+    """以完整解析度只渲染裝置座標 [ix0,ix1)×[iy0,iy1) 這一塊；超出頁面的部分補白，與整頁渲染後裁切對齊"""
+    canvas = np.full((iy1 - iy0, ix1 - ix0), 255, dtype=np.uint8)
+    clip = fitz.Rect(ix0 / zoom, iy0 / zoom, ix1 / zoom, iy1 / zoom) & page.rect
+    if not clip.is_empty:
+        pix = _render_gray_at(page, zoom, clip)
+        # pix.x / pix.y 為 pixmap 在裝置座標中的原點，用它定位可避免座標換算的捨入誤差
+        x0, y0 = max(pix.x, ix0), max(pix.y, iy0)
+        x1, y1 = min(pix.x + pix.width, ix1), min(pix.y + pix.height, iy1)
+        if x1 > x0 and y1 > y0:
+            arr = pixmap_array(pix)
+            canvas[y0-iy0:y1-iy0, x0-ix0:x1-ix0] = arr[y0-pix.y:y1-pix.y, x0-pix.x:x1-pix.x]
+    return gaussian_blur_gray(canvas, blur)
+
+
+@profiled("mask")
+def diff_tiles(coarse_a: np.ndarray, coarse_b: np.ndarray, tile: int = TILE_PX, tol: int = COARSE_TOLERANCE) -> np.ndarray:
+    """粗略影像逐區塊取最大灰階差，回傳區塊層級的 bool 矩陣（並向外擴一格，跨區塊邊界的差異才不會被切斷）"""
+    mask = diff_mask_gray(coarse_a, coarse_b, tol)
+    h, w = mask.shape
+    th, tw = -(-h // tile), -(-w // tile)
+    padded = np.zeros((th * tile, tw * tile), dtype=bool)
+    padded[:h, :w] = mask
+    flags = padded.reshape(th, tile, tw, tile).any(axis=(1, 3))
+    grown = flags.copy()
+    grown[1:, :] |= flags[:-1, :]; grown[:-1, :] |= flags[1:, :]
+    grown[:, 1:] |= grown[:, :-1].copy(); grown[:, :-1] |= grown[:, 1:].copy()
+    return grown
+
+
+def compute_boxes_tiled(page_a: fitz.Page, page_b: fitz.Page, dpi: int, max_side: int, blur: int, thr: int,
+                        min_area: int, merge_pad_px: int, coarse_dpi: int):
+    """
+    由粗到細：兩頁先以 coarse_dpi 渲染、逐區塊比對；有差異的相連區塊合成矩形，
+    再用 get_pixmap(clip=...) 以完整 DPI 只重新渲染這些矩形並在其中做 find_components。
+    回傳 (差異框（完整 DPI 像素座標）, 完整 DPI 的縮放倍率, 粗略影像 A, 粗略影像 B)。
+    """
+    zoom = min(render_matrix(page_a, dpi, max_side).a, render_matrix(page_b, dpi, max_side).a)
+    czoom = min(zoom, coarse_dpi / 72.0)
+    coarse_a = pixmap_array(_render_gray_at(page_a, czoom))
+    coarse_b = pixmap_array(_render_gray_at(page_b, czoom))
+    flags = diff_tiles(coarse_a, coarse_b)
+    full_w = int(round(max(page_a.rect.width, page_b.rect.width) * zoom))
+    full_h = int(round(max(page_a.rect.height, page_b.rect.height) * zoom))
+    scale = zoom / czoom
+    comps = []
+    # 相連的差異區塊合成矩形（區塊層級的 find_components）
+    for tx0, ty0, tx1, ty1 in find_components(flags, 1):
+        ix0 = int(tx0 * TILE_PX * scale); iy0 = int(ty0 * TILE_PX * scale)
+        ix1 = min(full_w, int(np.ceil((tx1 + 1) * TILE_PX * scale)))
+        iy1 = min(full_h, int(np.ceil((ty1 + 1) * TILE_PX * scale)))
+        if ix1 <= ix0 or iy1 <= iy0:
+            continue
+        ca = _clip_canvas(page_a, zoom, ix0, iy0, ix1, iy1, blur)
+        cb = _clip_canvas(page_b, zoom, ix0, iy0, ix1, iy1, blur)
+        mask = diff_mask_gray(ca, cb, thr)
+        comps.extend((x0+ix0, y0+iy0, x1+ix0, y1+iy0) for x0, y0, x1, y1 in find_components(mask, min_area))
+        del ca, cb, mask
+    boxes = [b for b in merge_boxes(comps, merge_pad_px) if (b[2]-b[0])*(b[3]-b[1])>=min_area]
+    return boxes, zoom, coarse_a, coarse_b
+
+
+def compare_pages_tiled(page_a: fitz.Page, page_b: fitz.Page, dpi: int, max_side: int, blur: int, thr: int,
+                        min_area: int, merge_pad_px: int, coarse_dpi: int):
+    """compare_pages 的由粗到細版本；疊圖以 TILED_OVERLAY_DPI 渲染 B 頁，框依比例縮放繪製"""
+    boxes, zoom, coarse_a, coarse_b = compute_boxes_tiled(page_a, page_b, dpi, max_side, blur, thr,
+                                                          min_area, merge_pad_px, coarse_dpi)
+    ozoom = min(zoom, TILED_OVERLAY_DPI / 72.0)
+    k = ozoom / zoom
+    base = Image.fromarray(pixmap_array(_render_gray_at(page_b, ozoom)), "L").convert("RGB")
+    scaled = [(int(x0*k), int(y0*k), int(np.ceil(x1*k)), int(np.ceil(y1*k))) for x0, y0, x1, y1 in boxes]
+    overlay = draw_overlay(base, scaled)
+    overlay.info["box_scale"] = k  # 疊圖與差異框座標的比例（裁切差異區域時用）
+    overlay.info["box_zoom"] = zoom  # 差異框座標每 PDF 點的像素數
+    return coarse_a, coarse_b, overlay, boxes
+
+
+def compare_pages(page_a, page_b, dpi: int, max_side: int, blur: int, thr: int, min_area: int,
+                  merge_pad_px: int, grayscale: bool = True, coarse_dpi: int = 0, renders=None):
+    """
+    渲染並比對一組頁面（任一邊可為 None，視為空白頁）。
+    回傳 (影像 A, 影像 B, 疊圖, 差異框)；灰階模式下 A/B 為 uint8 陣列，RGB 模式下為 PIL 影像。
+    coarse_dpi > 0 且兩頁都存在時改走由粗到細的區塊比對（一律灰階），A/B 為粗略影像。
+    renders 為 (render_a, render_b) 時改由它們取得整頁影像（例如 diff_store 的磁碟快取），
+    render(page) 需回傳與 render_page_gray / render_page_image 相同參數下的陣列。
+    """
+    if coarse_dpi > 0 and page_a is not None and page_b is not None:
+        try:
+            return compare_pages_tiled(page_a, page_b, dpi, max_side, blur, thr, min_area, merge_pad_px, coarse_dpi)
+        except Exception as e:
+            print(f"[warn] 由粗到細比對失敗，改用整頁比對：{e}")
+    render_a, render_b = renders or (None, None)
+    if grayscale:
+        blank = lambda: np.full(BLANK_GRAY_SHAPE, 255, dtype=np.uint8)
+        render = lambda page, r: r(page) if r else render_page_gray(page, dpi, max_side, blur)
+        img_a = render(page_a, render_a) if page_a else blank()
+        img_b = render(page_b, render_b) if page_b else blank()
+        overlay, boxes = compute_overlay_gray(img_a, img_b, thr, min_area, merge_pad_px)
+    else:
+        blank = lambda: Image.new("RGB", (BLANK_GRAY_SHAPE[1], BLANK_GRAY_SHAPE[0]), (255,255,255))
+        render = lambda page, r: Image.fromarray(np.asarray(r(page))) if r else render_page_image(page, dpi, max_side, blur)
+        img_a = render(page_a, render_a) if page_a else blank()
+        img_b = render(page_b, render_b) if page_b else blank()
+        overlay, boxes = compute_overlay(img_a, img_b, thr, min_area, merge_pad_px)
+    # 疊圖以 B 為底圖，框的像素座標依 B 的縮放倍率換回 PDF 點
+    ref = page_b or page_a
+    if ref is not None:
+        overlay.info["box_zoom"] = render_matrix(ref, dpi, max_side).a
+    return img_a, img_b, overlay, boxes
+
+
+def boxes_to_points(boxes, zoom: float, page: fitz.Page, side: str = "b") -> List[dict]:
+    """像素座標的差異框 → PDF 點座標（四捨五入到 0.01pt），格式為 {"page": "a"/"b", "bbox": [x0, y0, x1, y1]}"""
+    ox, oy = page.rect.x0, page.rect.y0
+    return [{"page": side, "bbox": [round(ox + x0 / zoom, 2), round(oy + y0 / zoom, 2),
+                                    round(ox + x1 / zoom, 2), round(oy + y1 / zoom, 2)]}
+            for x0, y0, x1, y1 in boxes]
+
+
+def rects_to_points(rects: List[fitz.Rect], side: str) -> List[dict]:
+    return [{"page": side, "bbox": [round(r.x0, 2), round(r.y0, 2), round(r.x1, 2), round(r.y1, 2)]} for r in rects]
+
+
+def pad_to_same(img1: Image.Image, img2: Image.Image) -> Tuple[Image.Image, Image.Image]:
+    w = max(img1.width, img2.width); h = max(img1.height, img2.height)
+    def pad(i):
+        if i.width==w and i.height==h: return i
+        c = Image.new("RGB",(w,h),(255,255,255)); c.paste(i,(0,0)); return c
+    return pad(img1), pad(img2)
+
+
+def _mask_runs(mask: np.ndarray):
+    """逐列找出前景連續區段，回傳 (列, 起始欄, 結束欄[含])，依列優先順序排列"""
+    fg = mask > 0
+    h, w = fg.shape
+    edges = np.zeros((h, w + 2), dtype=np.int8)
+    edges[:, 1:-1] = fg
+    edges = np.diff(edges, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return rows, starts, stops - 1
+
+
+def _link_runs(rows, starts, ends, width: int):
+    """找出上下相鄰列中 8 連通的區段配對；以 searchsorted 向量化，不逐像素掃描"""
+    stride = width + 2  # 保證不同列的鍵值不會重疊
+    start_key = rows * stride + starts
+    end_key = rows * stride + ends
+    prev = (rows - 1) * stride
+    lo = np.searchsorted(end_key, prev + starts - 1, side="left")
+    hi = np.searchsorted(start_key, prev + ends + 1, side="right")
+    counts = np.where(rows > 0, np.maximum(hi - lo, 0), 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    b = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    a = np.repeat(lo, counts) + offsets
+    return a, b
+
+
+def _union_labels(n: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """陣列版 union-find：反覆把較大的根掛到較小的根，再做 pointer jumping 直到收斂"""
+    parent = np.arange(n)
+    while len(a):
+        pa, pb = parent[a], parent[b]
+        diff = pa != pb
+        if not diff.any():
+            break
+        a, b = a[diff], b[diff]
+        pa, pb = pa[diff], pb[diff]
+        np.minimum.at(parent, np.maximum(pa, pb), np.minimum(pa, pb))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return parent
+
+
+@profiled("components")
+def find_components(mask_array: np.ndarray, min_area: int) -> List[Tuple[int,int,int,int]]:
+    """
+    8 連通元件的外接框（NumPy 版）：先把遮罩切成逐列區段（run-length），
+    再對區段做 union-find，面積以區段長度加總，不建立逐像素座標清單。
+    面積門檻沿用舊版：像素數 >= max(1, min_area//4)。
+    """
+    rows, starts, ends = _mask_runs(mask_array)
+    n = len(rows)
+    if n == 0:
+        return []
+    a, b = _link_runs(rows, starts, ends, mask_array.shape[1])
+    labels = _union_labels(n, a, b)
+    # 依標籤分組（穩定排序，組內第一個區段即該元件在掃描順序中最先出現的位置）
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    x0 = np.minimum.reduceat(starts[order], group_starts)
+    x1 = np.maximum.reduceat(ends[order], group_starts)
+    y0 = rows[order][group_starts]
+    y1 = np.maximum.reduceat(rows[order], group_starts)
+    area = np.add.reduceat((ends - starts + 1)[order], group_starts)
+    first = order[group_starts]
+    keep = area >= max(1, min_area // 4)
+    out = sorted(zip(first[keep].tolist(), x0[keep].tolist(), y0[keep].tolist(),
+                     x1[keep].tolist(), y1[keep].tolist()))
+    return [(bx0, by0, bx1, by1) for _, bx0, by0, bx1, by1 in out]
+
+
+def _merge_pass(boxes: List[Tuple[int,int,int,int]], pad: int) -> List[Tuple[int,int,int,int]]:
+    """一輪合併：網格找出距離在 pad 內的框，union-find 取連通群組後各自取外接框"""
+    n = len(boxes)
+    sizes = sorted(max(b[2]-b[0], b[3]-b[1]) for b in boxes)
+    cell = max(32, sizes[n//2] + pad)
+    grid = {}
+    for i, (x0,y0,x1,y1) in enumerate(boxes):
+        for cy in range((y0-pad)//cell, (y1+pad)//cell + 1):
+            for cx in range((x0-pad)//cell, (x1+pad)//cell + 1):
+                grid.setdefault((cx,cy), []).append(i)
+    parent = list(range(n))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for members in grid.values():
+        if len(members) < 2:
+            continue
+        for k, i in enumerate(members):
+            ax0,ay0,ax1,ay1 = boxes[i]
+            for j in members[k+1:]:
+                bx0,by0,bx1,by1 = boxes[j]
+                if ax1+pad<bx0 or bx1+pad<ax0 or ay1+pad<by0 or by1+pad<ay0:
+                    continue
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri,rj)] = min(ri,rj)
+    groups = {}
+    for i, b in enumerate(boxes):
+        r = find(i)
+        g = groups.get(r)
+        groups[r] = b if g is None else (min(g[0],b[0]), min(g[1],b[1]), max(g[2],b[2]), max(g[3],b[3]))
+    return list(groups.values())
+
+
+@profiled("merge")
+def merge_boxes(boxes: List[Tuple[int,int,int,int]], pad: int) -> List[Tuple[int,int,int,int]]:
+    """
+    距離在 pad 以內的框遞移合併，直到沒有框可再合併（合併後變大的框會再和其他框比較）。
+    以網格索引找鄰近框，結果與輸入順序無關（依 y0、x0 排序輸出）。
+    """
+    if not boxes: return []
+    cur = [tuple(int(v) for v in b) for b in boxes]
+    while True:
+        merged = _merge_pass(cur, pad)
+        if len(merged) == len(cur):
+            break
+        cur = merged
+    return sorted(cur, key=lambda b: (b[1], b[0], b[3], b[2]))
+
+
+def compute_overlay(img_a: Image.Image, img_b: Image.Image, thr: int, min_area: int, merge_pad_px: int) -> Tuple[Image.Image, List[Tuple[int,int,int,int]]]:
+    i1,i2 = pad_to_same(img_a,img_b)
+    diff = ImageChops.difference(i1,i2).convert("L")
+    mask = diff.point(lambda p: 255 if p>=thr else 0)
+    comps = find_components(np.array(mask), min_area)
+    boxes = [b for b in merge_boxes(comps, merge_pad_px) if (b[2]-b[0])*(b[3]-b[1])>=min_area]
+    return draw_overlay(i2.convert("RGBA"), boxes), boxes
+
+
+def report_image_format(fmt: str) -> str:
+    fmt = (fmt or "webp").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt == "webp" and not features.check("webp"):
+        fmt = "jpeg"
+    return fmt if fmt in ("webp", "jpeg", "png") else "jpeg"
+
+
+def encode_image(img: Image.Image, fmt: str, max_side: int, quality: int) -> bytes:
+    """縮到長邊不超過 max_side 後編碼成 WebP / JPEG / PNG"""
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if max(img.size) > max_side:
+        img = img.copy()
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=quality, method=4)
+    elif fmt == "jpeg":
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    else:
+        img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+CROP_MARGIN = 24       # 差異區域裁切圖四周保留的邊界（疊圖像素）
+CROP_MAX_SIDE = 900
+
+
+@profiled("encode")
+def encode_report_images(overlay: Image.Image, boxes, settings: DiffSettings):
+    """
+    報告用影像：縮小後的整頁疊圖 + 最多 report_crops 張差異區域裁切圖（從原解析度疊圖裁切，細節不會被縮掉）。
+    回傳 (副檔名, 疊圖 bytes, [裁切圖 bytes, ...])。
+    """
+    fmt = report_image_format(settings.report_image_format)
+    data = encode_image(overlay, fmt, settings.report_max_side, settings.report_quality)
+    crops = []
+    k = overlay.info.get("box_scale", 1.0)
+    for x0, y0, x1, y1 in boxes[:max(0, settings.report_crops)]:
+        box = (max(0, int(x0*k) - CROP_MARGIN), max(0, int(y0*k) - CROP_MARGIN),
+               min(overlay.width, int(np.ceil(x1*k)) + CROP_MARGIN), min(overlay.height, int(np.ceil(y1*k)) + CROP_MARGIN))
+        if box[2] > box[0] and box[3] > box[1]:
+            crops.append(encode_image(overlay.crop(box), fmt, CROP_MAX_SIDE, settings.report_quality))
+    return ("jpg" if fmt == "jpeg" else fmt), data, crops
+
+
+# ---------------------- 頁面對齊（插入／刪除頁不會讓後面所有頁錯位） ----------------------
+SHINGLE_WORDS = 3         # 以空白分詞時的 shingle 長度（詞）
+SHINGLE_CHARS = 5         # 中文等無空白文字的 shingle 長度（字元）
+ALIGN_MIN_JACCARD = 0.3   # 低於此相似度的兩頁不視為同一頁的修改版
+ALIGN_MAX_CELLS = 250_000 # 差異區段的 DP 表上限；超過就退回依位置配對
+
+
+def page_shingles(text: str) -> frozenset:
+    """頁面文字 → shingle 雜湊集合；有空白的文字以詞為單位，否則以字元為單位"""
+    words = text.split()
+    flat = "".join(words)
+    # 平均詞長很長代表文字幾乎沒有空白（中文、日文），改用字元 shingle
+    if len(words) >= SHINGLE_WORDS and len(flat) <= 12 * len(words):
+        grams = (" ".join(words[k:k+SHINGLE_WORDS]) for k in range(len(words) - SHINGLE_WORDS + 1))
+    else:
+        n = min(SHINGLE_CHARS, len(flat)) or 1
+        grams = (flat[k:k+n] for k in range(max(1, len(flat) - n + 1)))
+    return frozenset(hash(g) for g in grams)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+# MinHash 草圖：串流模式不保留整份文字，以每頁固定大小的草圖估計 Jaccard 相似度做頁面對齊
+SKETCH_SIZE = 64
+_sketch_rng = np.random.default_rng(0x5EED)
+_SKETCH_MUL = _sketch_rng.integers(1, 2**63, SKETCH_SIZE, dtype=np.uint64) | np.uint64(1)
+_SKETCH_ADD = _sketch_rng.integers(0, 2**63, SKETCH_SIZE, dtype=np.uint64)
+del _sketch_rng
+
+
+def page_sketch(text: str) -> np.ndarray:
+    """
+    頁面文字 → SKETCH_SIZE 個 uint32 的 MinHash 草圖（multiply-shift 雜湊族）。
+    shingle 以 Python hash() 計算，同一程序內算出的草圖才能互相比較。
+    """
+    sh = page_shingles(text)
+    if not sh:
+        return np.full(SKETCH_SIZE, 0xFFFFFFFF, dtype=np.uint32)
+    h = np.fromiter(sh, dtype=np.int64, count=len(sh)).view(np.uint64)
+    return ((h[:, None] * _SKETCH_MUL + _SKETCH_ADD) >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+
+def sketch_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """兩個草圖相同位置相等的比例（Jaccard 相似度的估計值）"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def _align_gap(sim_fn, a0: int, a1: int, b0: int, b1: int) -> List[Tuple[int,int]]:
+    """差異區段內以 DP 找出相似度總和最大、且不交叉的頁面配對（類似加權 LCS）；sim_fn(A 頁索引, B 頁索引)"""
+    m, n = a1 - a0, b1 - b0
+    if m == 0 or n == 0:
+        return []
+    if m * n > ALIGN_MAX_CELLS:
+        return [(a0 + k, b0 + k) for k in range(min(m, n))]
+    sim = [[sim_fn(a0+i, b0+j) for j in range(n)] for i in range(m)]
+    best = [[0.0] * (n + 1) for _ in range(m + 1)]
+    for i in range(m - 1, -1, -1):
+        row, nxt = best[i], best[i+1]
+        for j in range(n - 1, -1, -1):
+            v = max(nxt[j], row[j+1])
+            if sim[i][j] >= ALIGN_MIN_JACCARD:
+                v = max(v, sim[i][j] + nxt[j+1])
+            row[j] = v
+    pairs, i, j = [], 0, 0
+    while i < m and j < n:
+        if sim[i][j] >= ALIGN_MIN_JACCARD and best[i][j] == sim[i][j] + best[i+1][j+1]:
+            pairs.append((a0 + i, b0 + j)); i += 1; j += 1
+        elif best[i][j] == best[i+1][j]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+
+def _fill_positional(pairs: List[Tuple[int,int]], n_a: int, n_b: int) -> List[Tuple[int,int]]:
+    """相鄰兩個配對之間若 A、B 剩下的頁數相同，視為原地改寫而依位置配對（不拆成刪除＋插入）"""
+    out = []
+    prev_a, prev_b = -1, -1
+    for ia, ib in pairs + [(n_a, n_b)]:
+        if ia - prev_a == ib - prev_b:
+            out.extend((prev_a + k, prev_b + k) for k in range(1, ia - prev_a))
+        if ia < n_a:
+            out.append((ia, ib))
+        prev_a, prev_b = ia, ib
+    return out
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+def _align_keys(keys_a: list, keys_b: list, sim_fn) -> List[Tuple[int,int]]:
+    """
+    依每頁的文字雜湊找錨點（difflib），錨點之間的區段以 sim_fn(A 頁索引, B 頁索引) 做 DP 配對，
+    回傳 [(A 頁索引 | None, B 頁索引 | None), ...]（依閱讀順序）
+    """
+    sm = difflib.SequenceMatcher(None, keys_a, keys_b, autojunk=False)
+    matched = []
+    for tag, a0, a1, b0, b1 in sm.get_opcodes():
+        if tag == "equal":
+            matched.extend(zip(range(a0, a1), range(b0, b1)))
+            continue
+        matched.extend(_align_gap(sim_fn, a0, a1, b0, b1))
+    matched = _fill_positional(matched, len(keys_a), len(keys_b))
+
+    rows, ia, ib = [], 0, 0
+    for ma, mb in matched + [(len(keys_a), len(keys_b))]:
+        rows.extend((k, None) for k in range(ia, ma))
+        rows.extend((None, k) for k in range(ib, mb))
+        if ma < len(keys_a):
+            rows.append((ma, mb))
+        ia, ib = ma + 1, mb + 1
+    return rows
+
+
+@profiled("align")
+def align_pages(texts_a: List[str], texts_b: List[str]) -> List[Tuple[int,int]]:
+    """
+    對齊兩份文件的頁序，回傳 [(A 頁索引 | None, B 頁索引 | None), ...]（依閱讀順序）。
+    先以 difflib 對「文字完全相同」的頁找錨點，錨點之間的區段再用 shingle 相似度做 DP 配對；
+    沒配到的頁即為刪除（只有 A）或插入（只有B）。
+    """
+    sh_a, sh_b = {}, {}
+
+    def sim(i, j):
+        if i not in sh_a:
+            sh_a[i] = page_shingles(texts_a[i])
+        if j not in sh_b:
+            sh_b[j] = page_shingles(texts_b[j])
+        return jaccard(sh_a[i], sh_b[j])
+
+    return _align_keys([text_digest(t) for t in texts_a], [text_digest(t) for t in texts_b], sim)
+
+
+@profiled("align")
+def align_sketches(keys_a: list, keys_b: list, sketches_a: np.ndarray, sketches_b: np.ndarray) -> List[Tuple[int,int]]:
+    """與 align_pages 相同，但只用每頁的文字雜湊（text_digest）與 MinHash 草圖，不需要整份文字"""
+    return _align_keys(keys_a, keys_b, lambda i, j: sketch_similarity(sketches_a[i], sketches_b[j]))
+
+
+def positional_pairs(n_a: int, n_b: int) -> List[Tuple[int,int]]:
+    """不對齊時的舊行為：第 i 頁對第 i 頁，較短一方不足的頁視為空白"""
+    return [(i, i) for i in range(max(n_a, n_b))]
+
+
+# ---------------------- 向量文字比對（不渲染整頁點陣） ----------------------
+VECTOR_OVERLAY_DPI = 110       # 向量模式疊圖的解析度（只用於顯示）
+DELETED_COLOR = (220, 0, 0)    # A 中被刪除／修改的字
+INSERTED_COLOR = (0, 150, 60)  # B 中新增／修改的字
+
+
+def page_words(page: fitz.Page, head_ratio: float, foot_ratio: float):
+    """
+    頁面上的字與座標（閱讀順序），略過頁首／頁尾區域，與 extract_texts 的規則一致。
+    回傳 [(字, fitz.Rect, (block, line)), ...]
+    """
+    ph = page.rect.height
+    top_cut, bottom_cut = head_ratio * ph, (1.0 - foot_ratio) * ph
+    out = []
+    for x0, y0, x1, y1, word, block, line, _ in page.get_text("words", sort=False):
+        if y1 <= top_cut or y0 >= bottom_cut:
+            continue
+        w = unicodedata.normalize("NFKC", word).strip()
+        if w:
+            out.append((w, fitz.Rect(x0, y0, x1, y1), (block, line)))
+    return out
+
+
+def _round_pts(values, q: float = 0.5):
+    return tuple(round(v / q) for v in values)
+
+
+def graphics_signature(page: fitz.Page) -> str:
+    """
+    頁面上「非文字」內容的簽章：影像（MuPDF 算的內容雜湊 + 位置）與向量圖形路徑（座標取 0.5pt）。
+    兩頁簽章相同時，差異只可能來自文字，向量模式即可完整處理。
+    """
+    h = hashlib.sha1()
+    for info in page.get_image_info(hashes=True):
+        h.update(info.get("digest") or b"")
+        h.update(repr(_round_pts(info["bbox"])).encode())
+    for d in page.get_drawings():
+        items = []
+        for it in d.get("items", ()):
+            pts = []
+            for p in it[1:]:
+                if isinstance(p, fitz.Point):
+                    pts.extend((p.x, p.y))
+                elif isinstance(p, fitz.Rect):
+                    pts.extend((p.x0, p.y0, p.x1, p.y1))
+                elif isinstance(p, fitz.Quad):
+                    pts.extend(c for pt in p for c in (pt.x, pt.y))
+            items.append((it[0], _round_pts(pts)))
+        h.update(repr((d.get("type"), d.get("color"), d.get("fill"), d.get("width"), items)).encode())
+    return h.hexdigest()
+
+
+def _span_rects(words, indices) -> List[fitz.Rect]:
+    """連續且在同一行的字合併成一個矩形"""
+    rects, cur, cur_line, prev = [], None, None, None
+    for i in indices:
+        _, r, line = words[i]
+        if cur is not None and line == cur_line and i == prev + 1:
+            cur |= r
+        else:
+            if cur is not None:
+                rects.append(cur)
+            cur, cur_line = fitz.Rect(r), line
+        prev = i
+    if cur is not None:
+        rects.append(cur)
+    return rects
+
+
+def word_diff(words_a, words_b) -> Tuple[List[fitz.Rect], List[fitz.Rect]]:
+    """
+    以字為單位比對（Myers，與文字相似度同一套引擎），回傳 (A 中刪除／被取代的字區, B 中新增／取代的字區)。
+    座標為 PDF 點（未縮放）。
+    """
+    blocks = sequence_blocks([w for w, _, _ in words_a], [w for w, _, _ in words_b], MAX_D_TOKENS)
+    keep_a, keep_b = set(), set()
+    for i, j, size in blocks:
+        keep_a.update(range(i, i + size)); keep_b.update(range(j, j + size))
+    deleted = [i for i in range(len(words_a)) if i not in keep_a]
+    inserted = [j for j in range(len(words_b)) if j not in keep_b]
+    return _span_rects(words_a, deleted), _span_rects(words_b, inserted)
+
+
+def _draw_word_boxes(canvas: Image.Image, rects: List[fitz.Rect], zoom: float, color, x_off: int):
+    dr = ImageDraw.Draw(canvas, "RGBA")
+    boxes = []
+    for r in rects:
+        box = (int(r.x0 * zoom) - 2 + x_off, int(r.y0 * zoom) - 2,
+               int(np.ceil(r.x1 * zoom)) + 2 + x_off, int(np.ceil(r.y1 * zoom)) + 2)
+        dr.rectangle(box, outline=color + (255,), width=2)
+        dr.rectangle(box, fill=color + (50,))
+        boxes.append(box)
+    return boxes
+
+
+@profiled("overlay")
+def vector_overlay(page_a: fitz.Page, page_b: fitz.Page, deleted, inserted, dpi: int = VECTOR_OVERLAY_DPI):
+    """左 A、右 B 並排的疊圖：A 標出刪除的字（紅），B 標出新增的字（綠）。回傳 (疊圖, 疊圖座標中的框)"""
+    zoom = dpi / 72.0
+    pix_a = page_a.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    pix_b = page_b.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    gap = 16
+    canvas = Image.new("RGB", (pix_a.width + gap + pix_b.width, max(pix_a.height, pix_b.height)), (255, 255, 255))
+    canvas.paste(Image.frombytes("RGB", (pix_a.width, pix_a.height), pix_a.samples), (0, 0))
+    canvas.paste(Image.frombytes("RGB", (pix_b.width, pix_b.height), pix_b.samples), (pix_a.width + gap, 0))
+    boxes = _draw_word_boxes(canvas, deleted, zoom, DELETED_COLOR, 0)
+    boxes += _draw_word_boxes(canvas, inserted, zoom, INSERTED_COLOR, pix_a.width + gap)
+    return canvas, boxes
+
+
+@profiled("vector")
+def vector_word_rects(page_a: fitz.Page, page_b: fitz.Page, settings: DiffSettings):
+    """
+    向量模式的字層級差異，不渲染。圖片或向量圖形有變更時回傳 None（呼叫端改走點陣）；
+    否則回傳 (A 中刪除的字區, B 中新增的字區)，座標為 PDF 點。
+    """
+    if graphics_signature(page_a) != graphics_signature(page_b):
+        return None
+    return word_diff(page_words(page_a, settings.header_ignore_ratio, settings.footer_ignore_ratio),
+                     page_words(page_b, settings.header_ignore_ratio, settings.footer_ignore_ratio))
+
+
+def compare_pages_vector(page_a: fitz.Page, page_b: fitz.Page, settings: DiffSettings):
+    """
+    向量模式比對一組頁面。圖片或向量圖形有變更時回傳 None（呼叫端改走點陣）；
+    否則回傳 (疊圖或 None, 差異框)。沒有任何字被改動時不渲染。
+    """
+    rects = vector_word_rects(page_a, page_b, settings)
+    if rects is None:
+        return None
+    deleted, inserted = rects
+    if not deleted and not inserted:
+        return None, []
+    return vector_overlay(page_a, page_b, deleted, inserted)
+
+
+# ---------------------- 記憶體 ----------------------
+try:
+    _libc = ctypes.CDLL("libc.so.6")
+except OSError:  # 非 glibc（macOS、Windows）
+    _libc = None
+
+
+def rss_mb() -> float:
+    """目前程序的常駐記憶體（MB）；無法取得時回傳 0"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+def release_memory():
+    """Python 垃圾回收、清空 MuPDF 的資源快取（字型、已解碼影像），glibc 下再把空閒的 heap 還給系統"""
+    gc.collect()
+    fitz.TOOLS.store_shrink(100)
+    if _libc is not None:
+        _libc.malloc_trim(0)
+
+
+# ---------------------- 逐頁比對（序列與平行共用） ----------------------
+SIM_FLOOR = 0.5  # 相似度上界低於此值的頁不算精確值（報告顯示為「≤ 上界」）
+
+
+def _row(idx: int, ia, ib, status: str, **kw) -> dict:
+    r = {"idx": idx, "page_a": None if ia is None else ia+1, "page_b": None if ib is None else ib+1,
+         "status": status, "sim": 1.0 if status == "unchanged" else 0.0, "sim_exact": True, "boxes_count": 0,
+         "unchanged": status == "unchanged", "method": None, "boxes_pt": [], "image_ext": None, "overlay": None,
+         "crops": [], "text_diff_html": ""}
+    r.update(kw)
+    return r
+
+
+def quick_row_result(idx: int, ia, ib, n_a: int, n_b: int, fps_a: List[str], fps_b: List[str]):
+    """
+    不需點陣比對就能決定的列：指紋相同（未變更）、只有 A（刪除）、只有 B（插入）。
+    需要實際比對時回傳 None。ia / ib 超出頁數時視為該頁不存在。
+    """
+    ia = ia if ia is not None and ia < n_a else None
+    ib = ib if ib is not None and ib < n_b else None
+    if ia is not None and ib is not None:
+        return _row(idx, ia, ib, "unchanged") if fps_a[ia] == fps_b[ib] else None
+    return _row(idx, ia, ib, "deleted" if ib is None else "inserted")
+
+
+def store_renders(store, keys, settings: DiffSettings):
+    """
+    store（diff_store.RenderStore）與兩份文件的內容雜湊 → compare_pages 的 renders 參數。
+    store 為 None 時回傳 None（直接渲染）。
+    """
+    if store is None:
+        return None
+    s = settings
+    return tuple((lambda page, k=k: store.render(k, page, s.dpi, s.max_image_side, s.blur_radius, s.grayscale))
+                 for k in keys)
+
+
+def diff_page(page_a, page_b, idx: int, ta: str, tb: str, settings: DiffSettings, renders=None) -> dict:
+    """
+    比對一組已配對的頁面，回傳精簡結果（含 PDF 點座標的差異框 boxes_pt）；序列與平行路徑都呼叫這個函式，結果一致。
+    settings.render_report 為 False 時不編碼影像、不產生文字 diff。renders 見 compare_pages。
+    settings.profile 為 True 時，這一頁各階段的量測事件放在 r["profile"]。
+    """
+    if not settings.profile:
+        return _diff_page(page_a, page_b, idx, ta, tb, settings, renders)
+    with Profiler(settings.profile_memory) as prof:
+        with prof.stage("page", idx):
+            r = _diff_page(page_a, page_b, idx, ta, tb, settings, renders)
+    r["profile"] = prof.events
+    return r
+
+
+def _diff_page(page_a, page_b, idx: int, ta: str, tb: str, settings: DiffSettings, renders=None) -> dict:
+    ia, ib = page_a.number, page_b.number
+    with stage("similarity"):
+        sim, sim_exact = similarity_bounded(ta, tb, SIM_FLOOR)
+    report = settings.render_report
+    with stage("text_diff"):
+        text_diff_html = unified_diff_html(ta, tb, f"A:page{ia+1}", f"B:page{ib+1}") if report else ""
+    if settings.mode == "vector":
+        rects = vector_word_rects(page_a, page_b, settings)
+        if rects is not None:
+            deleted, inserted = rects
+            boxes_pt = rects_to_points(deleted, "a") + rects_to_points(inserted, "b")
+            if not boxes_pt or not report:
+                return _row(idx, ia, ib, "changed", sim=sim, sim_exact=sim_exact, boxes_count=len(boxes_pt),
+                            boxes_pt=boxes_pt, text_diff_html=text_diff_html, method="vector")
+            overlay, boxes = vector_overlay(page_a, page_b, deleted, inserted)
+            ext, data, crops = encode_report_images(overlay, boxes, settings)
+            return _row(idx, ia, ib, "changed", sim=sim, sim_exact=sim_exact, boxes_count=len(boxes),
+                        boxes_pt=boxes_pt, image_ext=ext, overlay=data, crops=crops,
+                        text_diff_html=text_diff_html, method="vector")
+    _, _, overlay, boxes = compare_pages(page_a, page_b, settings.dpi, settings.max_image_side,
+                                         settings.blur_radius, settings.pixel_threshold,
+                                         settings.bbox_min_area, settings.merge_padding, settings.grayscale,
+                                         settings.coarse_dpi, renders)
+    boxes_pt = boxes_to_points(boxes, overlay.info["box_zoom"], page_b)
+    ext, data, crops = encode_report_images(overlay, boxes, settings) if report else (None, None, [])
+    del overlay
+    return _row(idx, ia, ib, "changed", sim=sim, sim_exact=sim_exact, boxes_count=len(boxes), boxes_pt=boxes_pt,
+                image_ext=ext, overlay=data, crops=crops, text_diff_html=text_diff_html, method="raster")
+
+
+def diff_pair(doc_a: fitz.Document, doc_b: fitz.Document, idx: int, ia: int, ib: int, ta, tb,
+              settings: DiffSettings, renders=None) -> dict:
+    """
+    載入一組頁面後比對；ta / tb 為 None 時才從頁面抽取文字（串流模式不預先保留整份文字）。
+    頁面物件在函式結束時即釋放，不跨頁保留。
+    """
+    page_a, page_b = doc_a.load_page(ia), doc_b.load_page(ib)
+    if ta is None:
+        ta = extract_page_text(page_a, settings.header_ignore_ratio, settings.footer_ignore_ratio)
+    if tb is None:
+        tb = extract_page_text(page_b, settings.header_ignore_ratio, settings.footer_ignore_ratio)
+    r = diff_page(page_a, page_b, idx, ta, tb, settings, renders)
+    del page_a, page_b
+    return r
+
+
+def diff_documents(doc_a: fitz.Document, doc_b: fitz.Document, texts_a: List[str], texts_b: List[str],
+                   fps_a: List[str], fps_b: List[str], settings: DiffSettings, on_progress=None,
+                   pairs: List[Tuple[int,int]] = None, renders=None) -> List[dict]:
+    """
+    序列比對。pairs 為 align_pages 的結果（省略時依頁碼位置配對）；
+    指紋相同的配對直接列為未變更，只在單一文件出現的頁列為插入／刪除，都不渲染。
+    texts_a / texts_b 為 None 時逐頁現抽文字（見 diff_pair）。
+    on_progress(done, total, result) 每完成一列呼叫一次。renders 見 compare_pages。
+    """
+    pairs = pairs if pairs is not None else positional_pairs(len(doc_a), len(doc_b))
+    per_page = []
+    for k, (ia, ib) in enumerate(pairs):
+        r = quick_row_result(k+1, ia, ib, len(doc_a), len(doc_b), fps_a, fps_b)
+        if r is None:
+            r = diff_pair(doc_a, doc_b, k+1, ia, ib, texts_a[ia] if texts_a is not None else None,
+                          texts_b[ib] if texts_b is not None else None, settings, renders)
+            if (k+1) % 10 == 0:
+                gc.collect()
+        per_page.append(r)
+        if on_progress:
+            on_progress(k+1, len(pairs), r)
+    return per_page
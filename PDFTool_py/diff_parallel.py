@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜平行處理引擎
+- 兩份 PDF 先寫成暫存檔，worker 各自依路徑開檔（不把整份 PDF 傳進每個任務）
+- 頁碼切成小段分給 worker，每段只回傳精簡結果（相似度、差異框數、編碼後的疊圖、文字 diff）
+- 指紋相同的配對與插入／刪除頁不送進 worker，直接在主程序產生結果
+"""
+import os, tempfile, traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import List
+
+import fitz  # PyMuPDF
+
+from diff_core import (DiffSettings, diff_pair, diff_documents, quick_row_result, positional_pairs, store_renders,
+                       release_memory)
+from batch_util import default_workers, make_pool, spill_to_file
+
+# worker 端已開啟的文件（同一個 worker 處理多段時重用，不重複開檔）
+_worker_docs = {}
+
+
+def _worker_doc(path: str) -> fitz.Document:
+    doc = _worker_docs.get(path)
+    if doc is None:
+        if len(_worker_docs) >= 2:
+            for old in _worker_docs.values():
+                old.close()
+            _worker_docs.clear()
+        doc = _worker_docs[path] = fitz.open(path)
+    return doc
+
+
+def _diff_chunk(path_a: str, path_b: str, jobs, settings: DiffSettings, store=None, keys=None) -> List[dict]:
+    """worker：jobs 為 [(列序 1-based, A 頁索引, B 頁索引, 文字 A, 文字 B), ...]；文字為 None 時在 worker 現抽"""
+    doc_a, doc_b = _worker_doc(path_a), _worker_doc(path_b)
+    renders = store_renders(store, keys, settings)
+    out = [diff_pair(doc_a, doc_b, idx, ia, ib, ta, tb, settings, renders) for idx, ia, ib, ta, tb in jobs]
+    if settings.memory_budget_mb > 0:
+        # 串流模式：每段結束就清掉 MuPDF 快取與空閒 heap，worker 的常駐記憶體不隨頁數成長
+        release_memory()
+    return out
+
+
+def _chunks(indices: List[int], workers: int, chunk_pages: int = None) -> List[List[int]]:
+    # 預設每個 worker 約分到 4 段，進度列才會平順更新，又不會有太多小任務
+    size = chunk_pages or max(1, min(16, -(-len(indices) // (workers * 4))))
+    return [indices[k:k+size] for k in range(0, len(indices), size)]
+
+
+def diff_pages_parallel(src_a, src_b, texts_a: List[str], texts_b: List[str],
+                        fps_a: List[str], fps_b: List[str], settings: DiffSettings,
+                        max_workers: int = None, chunk_pages: int = None, on_progress=None,
+                        pairs=None, store=None, keys=None, max_in_flight: int = None) -> List[dict]:
+    """
+    src_a / src_b：bytes、檔案物件或路徑；pairs 為 align_pages 的結果（省略時依頁碼位置配對）。
+    texts_a / texts_b 可為 None：文字在比對時才由 worker 逐頁抽取，不經由任務傳遞。
+    store（diff_store.RenderStore）與 keys（兩份文件的內容雜湊）有值時，整頁渲染結果取自／寫入磁碟快取。
+    max_in_flight 限制同時送出（尚未取回結果）的段數；省略時一次全部送出。
+    回傳依列序排列的結果（與 diff_documents 相同）。
+    on_progress(done, total, result) 在每一列結果回到主程序時呼叫（完成順序不一定依列序）。
+    """
+    with tempfile.TemporaryDirectory(prefix="pdf_diff_") as tmp:
+        paths = []
+        for tag, src in (("a", src_a), ("b", src_b)):
+            if isinstance(src, (str, os.PathLike)):
+                paths.append(os.fspath(src))
+            else:
+                p = os.path.join(tmp, f"{tag}.pdf")
+                spill_to_file(src, p)
+                paths.append(p)
+        path_a, path_b = paths
+
+        with fitz.open(path_a) as da, fitz.open(path_b) as db:
+            n_a, n_b = len(da), len(db)
+            workers = max(1, max_workers or default_workers())
+            pairs = pairs if pairs is not None else positional_pairs(n_a, n_b)
+            if workers == 1:
+                return diff_documents(da, db, texts_a, texts_b, fps_a, fps_b, settings, on_progress, pairs,
+                                      store_renders(store, keys, settings))
+
+        n_rows = len(pairs)
+        results = {}
+        done = 0
+        todo = []
+        for k, (ia, ib) in enumerate(pairs):
+            r = quick_row_result(k+1, ia, ib, n_a, n_b, fps_a, fps_b)
+            if r is None:
+                todo.append(k)
+                continue
+            results[k] = r
+            done += 1
+            if on_progress:
+                on_progress(done, n_rows, r)
+        if todo:
+            chunks = _chunks(todo, workers, chunk_pages)
+            limit = max_in_flight or len(chunks)
+            queue = iter(chunks)
+            with make_pool(min(workers, len(chunks))) as pool:
+                pending = {}
+
+                def fill():
+                    # 任務（含文字）只在有空位時才建立，主程序不會一次持有所有段的資料
+                    while len(pending) < limit:
+                        chunk = next(queue, None)
+                        if chunk is None:
+                            return
+                        jobs = [(k+1, pairs[k][0], pairs[k][1],
+                                 texts_a[pairs[k][0]] if texts_a is not None else None,
+                                 texts_b[pairs[k][1]] if texts_b is not None else None) for k in chunk]
+                        pending[pool.submit(_diff_chunk, path_a, path_b, jobs, settings, store, keys)] = chunk
+
+                try:
+                    fill()
+                    while pending:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for fut in finished:
+                            pending.pop(fut)
+                            for r in fut.result():
+                                results[r["idx"] - 1] = r
+                                done += 1
+                                if on_progress:
+                                    on_progress(done, n_rows, r)
+                        fill()
+                except Exception:
+                    traceback.print_exc()
+                    for fut in pending:
+                        fut.cancel()
+                    raise
+        return [results[k] for k in range(n_rows)]
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜串流報告輸出
+- 每頁結果一完成就寫出：疊圖與差異區域裁切圖直接寫進 ZIP（或資料夾）的 assets/，逐頁詳情寫到暫存檔
+- HTML 以 <img loading="lazy"> 引用外部檔案，不再內嵌 base64
+- 結束時才寫摘要並依頁序串接詳情，記憶體用量與頁數無關
+"""
+import datetime, os, tempfile, zipfile
+from html import escape
+
+from diff_profile import profiled
+
+STATUS_LABELS = {"unchanged": "未變更", "changed": "已比對", "inserted": "新增頁（僅 B）", "deleted": "刪除頁（僅 A）"}
+METHOD_LABELS = {"raster": "點陣比對", "vector": "向量文字比對（左 A 紅：刪除；右 B 綠：新增）"}
+
+_HTML_HEAD = """<!doctype html>
+<html lang="zh-Hant">
+<head>
+<meta charset="utf-8"/>
+<title>PDF 差異比對報告 - {name_a} vs {name_b}</title>
+<meta name="viewport" content="width=device-width, initial-scale=1"/>
+<style>
+body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Noto Sans TC", Arial, "PingFang TC", "Microsoft JhengHei", sans-serif; line-height:1.6; color:#111; margin:0; }}
+.container {{ max-width: 1080px; margin: 0 auto; padding: 24px; }}
+h1,h2,h3 {{ margin: 8px 0; }}
+.small {{ color:#666; font-size: 0.95rem; }}
+kbd {{ background:#eee; border-radius:4px; padding:1px 6px; }}
+.crops img {{ max-width:48%; margin:4px; border:1px solid #eee; border-radius:6px; vertical-align:top; }}
+</style>
+</head>
+<body>
+<div class="container">
+  <h1>PDF 差異比對報告</h1>
+  <p class="small">檔案 A：<kbd>{name_a}</kbd>；檔案 B：<kbd>{name_b}</kbd></p>
+  <p class="small">時間：{now}</p>
+"""
+
+_HTML_TAIL = """
+</div>
+</body>
+</html>
+"""
+
+
+def _page_label(n) -> str:
+    return "—" if n is None else str(n)
+
+
+def _row_title(r: dict) -> str:
+    pa, pb = r.get("page_a", r["idx"]), r.get("page_b", r["idx"])
+    if pa is None:
+        return f"B 第 {pb} 頁（新增）"
+    if pb is None:
+        return f"A 第 {pa} 頁（刪除）"
+    return f"第 {pa} 頁" if pa == pb else f"A 第 {pa} 頁 ↔ B 第 {pb} 頁"
+
+
+def _is_paired(r: dict) -> bool:
+    return r.get("status") not in ("inserted", "deleted")
+
+
+def _sim_text(r: dict) -> str:
+    # 上界已低於門檻而未精確計算的頁，以「≤」標示
+    return f"{'' if r.get('sim_exact', True) else '≤'}{r['sim']:.4f}"
+
+
+def report_output_name(name_a: str, name_b: str) -> str:
+    return f"diff_report_{os.path.splitext(name_a)[0]}_vs_{os.path.splitext(name_b)[0]}.zip"
+
+
+class ReportWriter:
+    """
+    串流寫出報告。target 以 .zip 結尾時輸出成單一 ZIP（report.html + assets/），否則視為資料夾。
+    add(r) 每完成一列呼叫一次（順序不限）；寫出後會移除 r 內的影像與文字 diff，只留摘要欄位。
+    finish(overall_sim) 寫出摘要並依列序串接詳情。
+    """
+
+    def __init__(self, target: str, name_a: str, name_b: str, warn_threshold: float):
+        self.target = target
+        self.name_a, self.name_b = name_a, name_b
+        self.warn = warn_threshold
+        self.as_zip = target.lower().endswith(".zip")
+        self._rows = {}       # 列序 → 摘要欄位（不含影像）
+        self._offsets = {}    # 列序 → (暫存檔位移, 長度)
+        self._tmp = tempfile.TemporaryFile(mode="w+b", prefix="diff_sections_")
+        if self.as_zip:
+            self._zip = zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+        else:
+            self._zip = None
+            os.makedirs(os.path.join(target, "assets"), exist_ok=True)
+
+    # ---------- 輸出目的地 ----------
+    def _write_asset(self, name: str, data: bytes):
+        if self._zip is not None:
+            # 影像已壓縮過，不再 deflate
+            self._zip.writestr(name, data, compress_type=zipfile.ZIP_STORED)
+        else:
+            with open(os.path.join(self.target, name), "wb") as f:
+                f.write(data)
+
+    def _open_html(self):
+        if self._zip is not None:
+            return self._zip.open("report.html", "w", force_zip64=True)
+        return open(os.path.join(self.target, "report.html"), "wb")
+
+    # ---------- 逐頁 ----------
+    @profiled("report")
+    def add(self, r: dict):
+        idx = r["idx"]
+        img_tags = ""
+        if r.get("overlay"):
+            name = f"assets/p{idx:05d}.{r['image_ext']}"
+            self._write_asset(name, r["overlay"])
+            img_tags = (f'<div style="margin:10px 0"><img loading="lazy" src="{name}" alt="差異疊圖 {idx}" '
+                        f'style="max-width:100%;border:1px solid #eee;border-radius:6px"/></div>')
+            crop_tags = []
+            for k, data in enumerate(r.get("crops") or []):
+                cname = f"assets/p{idx:05d}_c{k+1}.{r['image_ext']}"
+                self._write_asset(cname, data)
+                crop_tags.append(f'<img loading="lazy" src="{cname}" alt="差異區域 {idx}-{k+1}"/>')
+            if crop_tags:
+                img_tags += ("<details open><summary style='cursor:pointer'>差異區域放大</summary>"
+                             f"<div class='crops'>{''.join(crop_tags)}</div></details>")
+        self._write_section(idx, self._section_html(r, img_tags))
+        for k in ("overlay", "crops", "text_diff_html", "profile"):
+            r.pop(k, None)
+        self._rows[idx] = {k: r.get(k) for k in ("idx", "page_a", "page_b", "status", "sim", "sim_exact",
+                                                  "boxes_count", "unchanged")}
+
+    def _section_html(self, r: dict, img_tags: str) -> str:
+        if r.get("unchanged") or not _is_paired(r):
+            note = ("✅ 內容指紋相同，未變更（略過點陣比對）" if r.get("unchanged")
+                    else "➕ 只出現在 B（新增頁）" if r.get("status") == "inserted" else "➖ 只出現在 A（刪除頁）")
+            return f"""
+<section style="margin:24px 0">
+  <h3 style="margin:6px 0">{_row_title(r)}</h3>
+  <div style="color:#555;margin:4px 0">{note}</div>
+</section>
+"""
+        return f"""
+<section style="margin:24px 0">
+  <h3 style="margin:6px 0">{_row_title(r)}</h3>
+  <div style="color:#555;margin:4px 0">文字相似度：{_sim_text(r)}{' ⚠️' if r['sim']<self.warn else ''}、差異框數：{r['boxes_count']}{'、' + METHOD_LABELS[r['method']] if r.get('method') in METHOD_LABELS else ''}</div>
+  {img_tags}
+  <details style="background:#fcfcfc;border:1px solid #eee;border-radius:6px;padding:8px">
+    <summary style="cursor:pointer;font-weight:600">文字 unified diff（A vs B）</summary>
+    {r['text_diff_html']}
+  </details>
+</section>
+"""
+
+    def _write_section(self, idx: int, html: str):
+        data = html.encode("utf-8")
+        self._tmp.seek(0, os.SEEK_END)
+        self._offsets[idx] = (self._tmp.tell(), len(data))
+        self._tmp.write(data)
+
+    # ---------- 收尾 ----------
+    def _summary_html(self, overall_sim: float) -> str:
+        rows = [self._rows[k] for k in sorted(self._rows)]
+        paired = [r for r in rows if _is_paired(r)]
+        low_pages = sum(1 for r in paired if r["sim"] < self.warn)
+        table = []
+        for r in rows:
+            p = _is_paired(r)
+            warn = " ⚠️" if p and r["sim"] < self.warn else ""
+            sim_cell = f"{_sim_text(r)}{warn}" if p else "—"
+            table.append(f"<tr><td style='text-align:right'>{_page_label(r['page_a'])}</td>"
+                         f"<td style='text-align:right'>{_page_label(r['page_b'])}</td>"
+                         f"<td style='text-align:right'>{sim_cell}</td>"
+                         f"<td style='text-align:right'>{r['boxes_count']}</td>"
+                         f"<td style='text-align:right'>{STATUS_LABELS.get(r['status'], '已比對')}</td></tr>")
+        return f"""
+  <h2>整體分析</h2>
+  <ul>
+    <li>整體文字相似度：<strong>{overall_sim:.4f}</strong> {"⚠️ 可能有重大變更" if overall_sim < self.warn else "✅ 高度相似"}</li>
+    <li>低相似度頁面數：<strong>{low_pages}/{len(paired)}</strong></li>
+    <li>新增頁／刪除頁：<strong>{sum(1 for r in rows if r['status'] == 'inserted')}／{sum(1 for r in rows if r['status'] == 'deleted')}</strong></li>
+    <li>總差異框數：<strong>{sum(r['boxes_count'] for r in rows)}</strong></li>
+    <li>未變更頁面數（指紋相同）：<strong>{sum(1 for r in rows if r['unchanged'])}/{len(rows)}</strong></li>
+  </ul>
+
+  <h2>逐頁摘要</h2>
+  <table style='border-collapse:collapse;width:100%'>
+  <thead><tr>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:80px'>A 頁碼</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:80px'>B 頁碼</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:160px'>文字相似度</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:160px'>差異框數</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:120px'>狀態</th>
+  </tr></thead><tbody>
+  {"".join(table)}
+  </tbody></table>
+
+  <h2>逐頁詳情</h2>
+"""
+
+    def _profile_html(self, profile: dict) -> str:
+        """附錄：各階段耗時合計與最慢的頁（profile 為 diff_profile.Profiler.summary()）"""
+        mem = profile.get("memory")
+        stage_rows = "".join(
+            f"<tr><td>{escape(name)}</td><td style='text-align:right'>{s['count']}</td>"
+            f"<td style='text-align:right'>{s['total_s']:.3f}</td><td style='text-align:right'>{s['mean_s']*1000:.1f}</td>"
+            f"<td style='text-align:right'>{s['max_s']*1000:.1f}</td>"
+            + (f"<td style='text-align:right'>{'' if s['peak_mb'] is None else s['peak_mb']}</td>" if mem else "")
+            + "</tr>" for name, s in profile["stages"].items())
+        page_rows = "".join(
+            f"<tr><td style='text-align:right'>{p['page']}</td><td style='text-align:right'>{p['total_s']:.3f}</td>"
+            f"<td>{escape('、'.join(f'{k} {v:.3f}s' for k, v in sorted(p['stages'].items(), key=lambda kv: -kv[1])))}</td></tr>"
+            for p in profile["slowest_pages"])
+        return f"""
+  <h2>附錄：效能分析</h2>
+  <p class="small">各階段為所有頁面的合計；平行處理時各 worker 的時間會重疊，合計可能大於總耗時。{"峰值記憶體僅含 Python／NumPy 配置。" if mem else ""}</p>
+  <table style='border-collapse:collapse;width:100%'>
+  <thead><tr><th style='text-align:left'>階段</th><th style='text-align:right'>次數</th><th style='text-align:right'>合計 (s)</th>
+  <th style='text-align:right'>平均 (ms)</th><th style='text-align:right'>最大 (ms)</th>{"<th style='text-align:right'>峰值 (MB)</th>" if mem else ""}</tr></thead>
+  <tbody>{stage_rows}</tbody></table>
+  <h3>最慢的頁</h3>
+  <table style='border-collapse:collapse;width:100%'>
+  <thead><tr><th style='text-align:right;width:80px'>列序</th><th style='text-align:right;width:100px'>耗時 (s)</th><th style='text-align:left'>各階段</th></tr></thead>
+  <tbody>{page_rows}</tbody></table>
+"""
+
+    def finish(self, overall_sim: float, profile: dict = None) -> str:
+        """寫出 report.html 並關閉；回傳 target。profile（Profiler.summary()）有值時附上效能分析附錄"""
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with self._open_html() as out:
+                out.write(_HTML_HEAD.format(name_a=escape(self.name_a), name_b=escape(self.name_b),
+                                            now=now).encode("utf-8"))
+                out.write(self._summary_html(overall_sim).encode("utf-8"))
+                for idx in sorted(self._offsets):
+                    off, length = self._offsets[idx]
+                    self._tmp.seek(off)
+                    out.write(self._tmp.read(length))
+                if profile:
+                    out.write(self._profile_html(profile).encode("utf-8"))
+                out.write(_HTML_TAIL.encode("utf-8"))
+        finally:
+            self.close()
+        return self.target
+
+    def close(self):
+        if self._tmp is not None:
+            self._tmp.close()
+            self._tmp = None
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def abort(self):
+        """處理失敗時呼叫：關閉並刪除未完成的 ZIP（資料夾輸出不刪除，避免誤刪使用者既有檔案）"""
+        self.close()
+        if self.as_zip:
+            try: os.remove(self.target)
+            except OSError: pass
+
+
+# ---------------------- 多版本索引 ----------------------
+def write_chain_index(report_dir: str, versions, results, hrefs, warn_threshold: float) -> str:
+    """
+    多版本比對的總覽頁 index.html：每組一列，連到各自的 report.html。
+    versions 為各版本檔名（依版本順序），results 為 diff_batch.PairResult 序列，
+    hrefs 為對應報告相對於 report_dir 的路徑（失敗的組為 None）。
+    """
+    rows = []
+    for r, href in zip(results, hrefs):
+        title = escape(r.name)
+        if not r.ok:
+            rows.append(f"<tr><td>{title}</td><td colspan='4' style='color:#b00'>失敗：{escape(r.error)}</td></tr>")
+            continue
+        link = f"<a href='{escape(href)}'>{title}</a>" if href else title
+        warn = " ⚠️" if r.similarity < warn_threshold else ""
+        rows.append(f"<tr><td>{link}</td><td style='text-align:right'>{r.similarity:.4f}{warn}</td>"
+                    f"<td style='text-align:right'>{r.changed_pages}</td>"
+                    f"<td style='text-align:right'>{r.inserted_pages}／{r.deleted_pages}</td>"
+                    f"<td style='text-align:right'>{r.boxes}</td></tr>")
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    head = _HTML_HEAD.format(name_a=escape(versions[0]), name_b=escape(versions[-1]), now=now)
+    chain = " → ".join(f"<kbd>v{k+1} {escape(v)}</kbd>" for k, v in enumerate(versions))
+    html = head.replace("<h1>PDF 差異比對報告</h1>", "<h1>PDF 多版本差異比對</h1>") + f"""
+  <p class="small">版本順序：{chain}</p>
+  <table style='border-collapse:collapse;width:100%'>
+  <thead><tr>
+  <th style='border-bottom:1px solid #ddd;text-align:left'>比對</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:140px'>整體相似度</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:120px'>變更頁數</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:140px'>新增／刪除頁</th>
+  <th style='border-bottom:1px solid #ddd;text-align:right;width:120px'>差異框數</th>
+  </tr></thead><tbody>
+  {"".join(rows)}
+  </tbody></table>
+""" + _HTML_TAIL
+    path = os.path.join(report_dir, "index.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return path
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜磁碟上的內容定址快取（多版本比對共用）
+- 以檔案內容的 SHA-1 為鍵：渲染影像依 (檔案雜湊, 頁碼, DPI, 長邊上限, 模糊半徑, 灰階/彩色) 存成 .npy，
+  逐頁文字與指紋依 (檔案雜湊, 頁首/頁尾比例) 存成 JSON
+- 寫入先寫暫存檔再 os.replace，多個 worker 同時寫同一個 entry 也不會讀到半個檔案
+- 同一版本出現在多組比對中（v1→v2→v3 的 v2）時只渲染、只抽字一次
+- 命中時更新檔案的修改時間，prune 依最近使用時間（LRU）淘汰，常被重用的版本留得最久
+"""
+import hashlib, json, os, tempfile
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from diff_core import extract_texts, page_fingerprints, render_page_gray, render_page_image
+from diff_profile import stage
+
+
+def file_key(path: str, chunk: int = 1024 * 1024) -> str:
+    """檔案內容的 SHA-1（分塊讀取，不把整個檔案讀進記憶體）"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class RenderStore:
+    """只保存根目錄路徑，可直接傳進 spawn worker"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    # ---------- 路徑與原子寫入 ----------
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _write_atomic(self, path: str, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try: os.remove(tmp)
+            except OSError: pass
+            raise
+
+    @staticmethod
+    def _mark_used(path: str):
+        """命中時把修改時間設為現在，prune 才會依最近使用而非寫入順序淘汰"""
+        try: os.utime(path)
+        except OSError: pass
+
+    # ---------- 文字與指紋 ----------
+    def analysis(self, key: str, doc: fitz.Document, head_ratio: float, foot_ratio: float):
+        """回傳 (逐頁文字, 逐頁指紋)；已存在就直接讀檔，不開頁面"""
+        path = os.path.join(self._dir(key), f"text_h{head_ratio:g}_f{foot_ratio:g}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if len(data["texts"]) == len(doc):
+                self._mark_used(path)
+                return data["texts"], data["fingerprints"]
+        except (OSError, ValueError, KeyError):
+            pass
+        texts = extract_texts(doc, head_ratio, foot_ratio)
+        fps = page_fingerprints(doc, texts)
+        payload = json.dumps({"texts": texts, "fingerprints": fps}, ensure_ascii=False).encode("utf-8")
+        self._write_atomic(path, lambda f: f.write(payload))
+        return texts, fps
+
+    # ---------- 渲染 ----------
+    def render(self, key: str, page: fitz.Page, dpi: int, max_side: int, blur: int,
+               grayscale: bool = True) -> np.ndarray:
+        """
+        渲染單頁；命中時以 mmap 唯讀讀回（不實際載入整張影像，比對時才分頁讀取）。
+        灰階為 (h, w) uint8，彩色為 (h, w, 3) uint8。
+        """
+        name = f"p{page.number:05d}_d{dpi}_m{max_side}_b{blur}_{'g' if grayscale else 'rgb'}.npy"
+        path = os.path.join(self._dir(key), name)
+        if os.path.exists(path):
+            try:
+                with stage("render_cache"):
+                    arr = np.load(path, mmap_mode="r")
+                self._mark_used(path)
+                return arr
+            except (OSError, ValueError):
+                pass
+        if grayscale:
+            arr = np.ascontiguousarray(render_page_gray(page, dpi, max_side, blur))
+        else:
+            arr = np.asarray(render_page_image(page, dpi, max_side, blur))
+        self._write_atomic(path, lambda f: np.save(f, arr, allow_pickle=False))
+        return arr
+
+    # ---------- 容量管理 ----------
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(self.root) for f in files)
+
+    def prune(self, max_bytes: int) -> int:
+        """總量超過 max_bytes 時，依最後使用時間（寫入或命中時更新的修改時間）由舊到新刪除；回傳刪除的檔案數"""
+        entries = []
+        for d, _, files in os.walk(self.root):
+            for f in files:
+                p = os.path.join(d, f)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+        total = sum(s for _, s, _ in entries)
+        removed = 0
+        for _, size, p in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(p)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜記憶體受限的串流模式（數千頁的大檔）
+- 兩份 PDF 都以路徑開檔（上傳檔先分塊寫成暫存檔），不在記憶體裡保留整份 bytes
+- 第一輪逐頁掃描只留下精簡資訊：指紋、文字雜湊與字元數、MinHash 草圖（頁面對齊用），不保留整份文字
+- 比對時才逐頁抽取文字；頁面物件與 pixmap 用完即丟，結果交給 on_progress（寫進報告）後只留摘要欄位
+- 依記憶體預算（DiffSettings.memory_budget_mb）決定 worker 數、渲染長邊上限與同時在途的任務數；
+  主程序常駐記憶體接近上限時清掉 MuPDF 快取並把空閒 heap 還給系統
+預算是估算值：實際峰值取決於頁面內容（大型影像、複雜向量圖形），請預留餘裕。
+"""
+import math
+from dataclasses import dataclass, replace
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from diff_core import (DiffSettings, SKETCH_SIZE, extract_page_text, page_fingerprint, page_sketch, text_digest,
+                       align_sketches, positional_pairs, rss_mb, release_memory)
+from diff_parallel import diff_pages_parallel
+from diff_profile import stage
+from diff_text import weighted_similarity
+from batch_util import spill_to_file
+
+# 估算用常數（MB／每像素位元組），以 220 DPI Letter 頁實測再加上 MuPDF 與 Pillow 端不計入 tracemalloc 的配置
+MAIN_BASE_MB = 120       # 主程序常駐：Python + PyMuPDF + NumPy + Pillow（Streamlit 另計）
+WORKER_BASE_MB = 90      # 每個 spawn worker 的常駐記憶體
+BYTES_PER_PX = {True: 10, False: 20}  # 比對一頁的峰值（灰階／彩色路徑；兩頁渲染、遮罩、疊圖與編碼）
+MIN_RENDER_SIDE = 1000   # 預算再小也不把渲染長邊壓到這個值以下（差異框會失準）
+RELEASE_AT = 0.85        # 主程序常駐記憶體超過預算的這個比例時釋放快取
+RELEASE_STEP_MB = 32     # 釋放後至少再成長這麼多才再釋放一次（常駐量本來就接近上限時不會每頁都做 GC）
+HEAVY_KEYS = ("overlay", "crops", "text_diff_html", "profile")
+
+
+@dataclass
+class DocScan:
+    """第一輪掃描的精簡結果（與頁數對齊）"""
+    fingerprints: List[str]
+    digests: List[bytes]
+    lengths: List[int]
+    sketches: np.ndarray = None        # (頁數, SKETCH_SIZE) uint32；不對齊時為 None
+    page_size: Tuple[float, float] = (612.0, 792.0)  # 面積最大的頁（點），估算渲染大小用
+
+
+@dataclass
+class BudgetPlan:
+    workers: int
+    max_image_side: int
+    in_flight: int        # 同時送出的段數
+    chunk_pages: int
+    page_mb: float        # 估計每頁比對的峰值（MB）
+
+
+@dataclass
+class StreamResult:
+    rows: List[dict]      # 依列序排列；影像與文字 diff 已交給 on_progress 後移除
+    similarity: float
+    pages_a: int
+    pages_b: int
+    plan: BudgetPlan
+    peak_rss_mb: float    # 主程序觀察到的最大常駐記憶體
+    releases: int         # 觸發釋放快取的次數
+
+
+class MemoryGuard:
+    """每處理一頁呼叫 check()：主程序常駐記憶體接近預算時釋放可回收的記憶體"""
+
+    def __init__(self, budget_mb: int):
+        self.budget_mb = budget_mb
+        self.peak_mb = 0.0
+        self.releases = 0
+        self._floor = 0.0   # 上次釋放後的常駐量
+
+    def check(self):
+        rss = rss_mb()
+        self.peak_mb = max(self.peak_mb, rss)
+        if self.budget_mb > 0 and rss > max(self.budget_mb * RELEASE_AT, self._floor + RELEASE_STEP_MB):
+            release_memory()
+            self.releases += 1
+            self._floor = rss_mb()
+
+
+def spill_upload(f, path: str) -> str:
+    """上傳檔（檔案物件）分塊寫到 path，不經由 getvalue() 另外複製一份 bytes；回傳 path"""
+    return spill_to_file(f, path)
+
+
+# ---------- 第一輪：逐頁掃描 ----------
+def scan_document(path: str, head_ratio: float, foot_ratio: float, sketches: bool = True,
+                  guard: MemoryGuard = None) -> DocScan:
+    """逐頁抽字、算指紋與草圖後立即丟掉文字與頁面，記憶體只隨頁數線性成長（每頁數百 bytes）"""
+    with fitz.open(path) as doc:
+        n = len(doc)
+        scan = DocScan([], [], [], np.empty((n, SKETCH_SIZE), dtype=np.uint32) if sketches else None)
+        cache, area = {}, 0.0
+        for i in range(n):
+            page = doc.load_page(i)
+            with stage("extract"):
+                text = extract_page_text(page, head_ratio, foot_ratio)
+            with stage("fingerprint"):
+                scan.fingerprints.append(page_fingerprint(doc, page, text, cache))
+            scan.digests.append(text_digest(text))
+            scan.lengths.append(len(text))
+            if sketches:
+                scan.sketches[i] = page_sketch(text)
+            w, h = page.rect.width, page.rect.height
+            if w * h > area:
+                area, scan.page_size = w * h, (w, h)
+            del page, text
+            if guard is not None:
+                guard.check()
+    return scan
+
+
+# ---------- 預算 ----------
+def _render_px(page_size, dpi: int, max_side: int) -> int:
+    """與 render_matrix 相同的縮放規則下，整頁渲染的像素數"""
+    w, h = page_size
+    zoom = dpi / 72.0
+    longest = max(int(w * zoom), int(h * zoom))
+    if longest > max_side:
+        zoom *= max_side / longest
+    return int(w * zoom) * int(h * zoom)
+
+
+def plan_budget(settings: DiffSettings, page_size, max_workers: int = 1) -> BudgetPlan:
+    """
+    依 settings.memory_budget_mb 決定平行數與渲染長邊上限：
+    平行時每個 worker 需要常駐記憶體 + 一頁的峰值；連一個 worker 都放不下時改在主程序逐頁處理，
+    仍然放不下就降低渲染長邊（不低於 MIN_RENDER_SIDE）。
+    """
+    s = settings
+    bpp = BYTES_PER_PX[bool(s.grayscale)]
+    side = s.max_image_side
+    page_mb = _render_px(page_size, s.dpi, side) * bpp / (1024 * 1024)
+    if s.memory_budget_mb <= 0:
+        workers = max(1, max_workers or 1)
+        return BudgetPlan(workers, side, workers * 2, 2, round(page_mb, 1))
+    avail = s.memory_budget_mb - MAIN_BASE_MB
+    workers = min(max(1, max_workers or 1), int(avail // (WORKER_BASE_MB + page_mb)) if avail > 0 else 1)
+    if workers < 2:
+        workers = 1
+        if page_mb > avail:
+            # 長邊縮放 k 倍，像素數約縮 k² 倍
+            k = math.sqrt(max(avail, 1) / page_mb)
+            side = max(MIN_RENDER_SIDE, min(side, int(max(page_size) * s.dpi / 72 * k)))
+            page_mb = _render_px(page_size, s.dpi, side) * bpp / (1024 * 1024)
+    return BudgetPlan(workers=workers, max_image_side=side, in_flight=workers * 2, chunk_pages=2,
+                      page_mb=round(page_mb, 1))
+
+
+# ---------- 執行 ----------
+def diff_stream(path_a: str, path_b: str, settings: DiffSettings, align: bool = True, max_workers: int = 1,
+                on_progress=None, store=None, keys=None) -> StreamResult:
+    """
+    以串流模式比對兩份 PDF（路徑）。on_progress(done, total, r) 每完成一列呼叫一次，
+    呼叫後 r 內的影像、文字 diff 與量測事件即被移除，呼叫端需要時請在 on_progress 內寫出（例如 ReportWriter.add）。
+    settings.memory_budget_mb 為 0 時不限制平行數與渲染大小，但仍以串流方式處理。
+    """
+    guard = MemoryGuard(settings.memory_budget_mb)
+    h, f = settings.header_ignore_ratio, settings.footer_ignore_ratio
+    scan_a = scan_document(path_a, h, f, align, guard)
+    scan_b = scan_document(path_b, h, f, align, guard)
+    n_a, n_b = len(scan_a.fingerprints), len(scan_b.fingerprints)
+    if align:
+        pairs = align_sketches(scan_a.digests, scan_b.digests, scan_a.sketches, scan_b.sketches)
+    else:
+        pairs = positional_pairs(n_a, n_b)
+    scan_a.sketches = scan_b.sketches = None
+    scan_a.digests = scan_b.digests = None
+
+    size = max(scan_a.page_size, scan_b.page_size, key=lambda wh: wh[0] * wh[1])
+    plan = plan_budget(settings, size, max_workers)
+    settings = replace(settings, max_image_side=plan.max_image_side)
+
+    def progress(done, total, r):
+        if on_progress:
+            on_progress(done, total, r)
+        for k in HEAVY_KEYS:
+            r.pop(k, None)
+        guard.check()
+
+    rows = diff_pages_parallel(path_a, path_b, None, None, scan_a.fingerprints, scan_b.fingerprints, settings,
+                               max_workers=plan.workers, chunk_pages=plan.chunk_pages, on_progress=progress,
+                               pairs=pairs, store=store, keys=keys, max_in_flight=plan.in_flight)
+    overall = weighted_similarity(scan_a.lengths, scan_b.lengths, pairs, [r["sim"] for r in rows])
+    return StreamResult(rows, overall, n_a, n_b, plan, round(guard.peak_mb, 1), guard.releases)
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 差異比對｜文字差異引擎
+- 文字先切成 token（英數字詞、單一中日韓字元、標點）或整行，再把每個 token／行轉成整數 id
+- 在 id 序列上跑 Myers O((N+M)·D) 差異演算法；D 超過上限時改用 difflib（相似度仍以 token 為單位，不降為行層級）
+- 相似度 = 2 × 相同部分的字元數 ÷ 兩邊字元總數（與 SequenceMatcher.ratio 同一定義，但以 token 為單位）
+- 先用長度與多重集合交集算出上界（同 quick_ratio 的概念），上界已經足以判斷時就不跑精確比對
+- unified diff 的 HTML 有總行數上限，並分段收合顯示
+"""
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import List, Optional, Sequence, Tuple
+
+MAX_D_TOKENS = 400      # token 層級允許的最大編輯距離；超過改在同一組 token id 上跑 difflib
+MAX_D_LINES = 2000      # 行層級允許的最大編輯距離；超過改走 difflib
+DIFF_CONTEXT = 3
+DIFF_MAX_LINES = 4000   # 單頁 unified diff 最多輸出的行數
+DIFF_PAGE_LINES = 400   # 每段（可收合）顯示的行數
+
+_CJK = "぀-ヿ㐀-䶿一-鿿豈-﫿가-힯"
+_TOKEN_RE = re.compile(rf"[{_CJK}]|[^\W{_CJK}]+|[^\w\s]")
+
+Block = Tuple[int, int, int]  # (a 起點, b 起點, 長度)，與 difflib 的 matching block 相同
+
+
+# ---------------------- 切分與編碼 ----------------------
+def _intern(items: Sequence[str], table: dict) -> List[int]:
+    return [table.setdefault(s, len(table)) for s in items]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text)
+
+
+def _encode_pair(a_items: Sequence[str], b_items: Sequence[str]):
+    table = {}
+    return _intern(a_items, table), _intern(b_items, table)
+
+
+# ---------------------- Myers 差異演算法 ----------------------
+def _myers_blocks(a: Sequence[int], b: Sequence[int], max_d: int) -> Optional[List[Block]]:
+    """
+    回傳 a、b 之間的 matching blocks（不含結尾哨兵）；編輯距離超過 max_d 時回傳 None。
+    每一步只保存 2d+1 個對角線的位置，回溯用的記憶體為 O(D²)。
+    """
+    n, m = len(a), len(b)
+    if n == 0 or m == 0:
+        return [] if n + m <= max_d else None
+    v = {1: 0}
+    trace = []
+    for d in range(max_d + 1):
+        cur = {}
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1; y += 1
+            cur[k] = x
+            if x >= n and y >= m:
+                trace.append(cur)
+                return _backtrack(trace, n, m)
+        trace.append(cur)
+        v = cur
+    return None
+
+
+def _backtrack(trace, n: int, m: int) -> List[Block]:
+    blocks = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        prev = trace[d - 1]
+        k = x - y
+        if k == -d or (k != d and prev[k - 1] < prev[k + 1]):
+            pk = k + 1
+            px = prev[pk]; py = px - pk
+            sx, sy = px, py + 1       # 向下（插入 b 的元素）
+        else:
+            pk = k - 1
+            px = prev[pk]; py = px - pk
+            sx, sy = px + 1, py       # 向右（刪除 a 的元素）
+        if x > sx:
+            blocks.append((sx, sy, x - sx))
+        x, y = px, py
+    if x > 0:
+        blocks.append((0, 0, x))
+    blocks.reverse()
+    return blocks
+
+
+def matching_blocks(a: Sequence[int], b: Sequence[int], max_d: int) -> Optional[List[Block]]:
+    """先去掉共同的前綴、後綴（修訂版文件通常只改中間一小段），再對中間跑 Myers"""
+    n, m = len(a), len(b)
+    p = 0
+    while p < n and p < m and a[p] == b[p]:
+        p += 1
+    s = 0
+    while s < n - p and s < m - p and a[n - 1 - s] == b[m - 1 - s]:
+        s += 1
+    mid = _myers_blocks(a[p:n - s], b[p:m - s], max_d)
+    if mid is None:
+        return None
+    blocks = [(0, 0, p)] if p else []
+    blocks.extend((i + p, j + p, size) for i, j, size in mid)
+    if s:
+        blocks.append((n - s, m - s, s))
+    # 相鄰的 block 合併，與 difflib 的輸出形式一致
+    merged = []
+    for blk in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == blk[0] and merged[-1][1] + merged[-1][2] == blk[1]:
+            i, j, size = merged[-1]
+            merged[-1] = (i, j, size + blk[2])
+        elif blk[2]:
+            merged.append(blk)
+    return merged
+
+
+def _difflib_blocks(a: Sequence[int], b: Sequence[int]) -> List[Block]:
+    return [blk for blk in SequenceMatcher(None, a, b, autojunk=False).get_matching_blocks() if blk[2]]
+
+
+def sequence_blocks(a_items: Sequence[str], b_items: Sequence[str], max_d: int) -> List[Block]:
+    """任意字串序列的 matching blocks：Myers，超過上限改用 difflib（在整數 id 上執行，比字串快）"""
+    a, b = _encode_pair(a_items, b_items)
+    blocks = matching_blocks(a, b, max_d)
+    return blocks if blocks is not None else _difflib_blocks(a, b)
+
+
+def line_blocks(a_lines: Sequence[str], b_lines: Sequence[str]) -> List[Block]:
+    return sequence_blocks(a_lines, b_lines, MAX_D_LINES)
+
+
+# ---------------------- 相似度 ----------------------
+def _weights(items: Sequence[str]) -> List[int]:
+    return [len(s) for s in items]
+
+
+def _matched_weight(blocks: List[Block], wa: List[int]) -> int:
+    return sum(sum(wa[i:i + size]) for i, _, size in blocks)
+
+
+def upper_bound(a_items: Sequence[str], b_items: Sequence[str]) -> float:
+    """不看順序的相似度上界：兩邊 token 的多重集合交集（依字元數加權），類似 SequenceMatcher.quick_ratio"""
+    total = sum(map(len, a_items)) + sum(map(len, b_items))
+    if total == 0:
+        return 1.0
+    common = Counter(a_items) & Counter(b_items)
+    return 2.0 * sum(len(t) * c for t, c in common.items()) / total
+
+
+def similarity_bounded(a: str, b: str, floor: float = 0.0) -> Tuple[float, bool]:
+    """
+    token 層級相似度（0~1），回傳 (值, 是否為精確值)。
+    floor > 0 時，長度上界或多重集合上界一旦低於 floor 就不跑精確比對，直接回傳該上界（精確值只會更低）。
+    """
+    if a == b:
+        return 1.0, True
+    if not a or not b:
+        return 0.0, True
+    ta, tb = tokenize(a), tokenize(b)
+    wa, wb = _weights(ta), _weights(tb)
+    sa, sb = sum(wa), sum(wb)
+    total = sa + sb
+    if total == 0:
+        return (1.0 if a.split() == b.split() else 0.0), True
+    if floor:
+        # 長度上界：較短一方全部相同也只能到這裡；其次才算多重集合交集
+        ub = 2.0 * min(sa, sb) / total
+        if ub < floor:
+            return ub, False
+        ub = upper_bound(ta, tb)
+        if ub < floor:
+            return ub, False
+    ia, ib = _encode_pair(ta, tb)
+    blocks = matching_blocks(ia, ib, MAX_D_TOKENS)
+    if blocks is None:
+        # 改寫幅度大：在同一組 token id 上改用 difflib（不退回行層級，否則重排過的段落會被算成幾乎全不同）。
+        # difflib 的 matching blocks 與 SequenceMatcher.ratio 同一定義，因此仍視為精確值
+        blocks = _difflib_blocks(ia, ib)
+    return 2.0 * _matched_weight(blocks, wa) / total, True
+
+
+def weighted_similarity(lens_a: Sequence[int], lens_b: Sequence[int], pairs, page_sims) -> float:
+    """以各頁字元數（lens_a / lens_b）加權平均逐頁相似度；串流模式只保留字元數，不保留文字"""
+    num = den = 0.0
+    for (ia, ib), sim in zip(pairs, page_sims):
+        w = (lens_a[ia] if ia is not None and ia < len(lens_a) else 0) + \
+            (lens_b[ib] if ib is not None and ib < len(lens_b) else 0)
+        num += sim * w
+        den += w
+    return num / den if den else 1.0
+
+
+def document_similarity(texts_a: List[str], texts_b: List[str], pairs=None, page_sims=None) -> float:
+    """
+    整份文件的相似度。
+    有逐頁結果時（pairs 與 page_sims 對應），以各頁字元數加權平均逐頁相似度，不再對整份文字重算；
+    否則以行為單位對整份文件跑一次差異。
+    """
+    if pairs is not None and page_sims is not None:
+        return weighted_similarity([len(t) for t in texts_a], [len(t) for t in texts_b], pairs, page_sims)
+    al = [ln for t in texts_a for ln in t.splitlines()]
+    bl = [ln for t in texts_b for ln in t.splitlines()]
+    total = sum(map(len, al)) + sum(map(len, bl))
+    if total == 0:
+        return 1.0
+    return 2.0 * _matched_weight(line_blocks(al, bl), _weights(al)) / total
+
+
+# ---------------------- unified diff ----------------------
+def _grouped_opcodes(blocks: List[Block], n: int, m: int, context: int):
+    """把 matching blocks 轉成 difflib 風格的 grouped opcodes"""
+    sm = SequenceMatcher(None, "", "")
+    sm.a, sm.b = range(n), range(m)
+    sm.matching_blocks = list(blocks) + [(n, m, 0)]
+    sm.opcodes = None
+    return sm.get_grouped_opcodes(context)
+
+
+def _format_range(start: int, stop: int) -> str:
+    """與 difflib.unified_diff 相同的範圍表示法"""
+    beginning, length = start + 1, stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def unified_diff_lines(a_lines: List[str], b_lines: List[str], from_label: str, to_label: str,
+                       context: int = DIFF_CONTEXT):
+    """與 difflib.unified_diff 相同格式的逐行輸出（產生器，不含換行）"""
+    blocks = line_blocks(a_lines, b_lines)
+    started = False
+    for group in _grouped_opcodes(blocks, len(a_lines), len(b_lines), context):
+        if not started:
+            started = True
+            yield f"--- {from_label}"
+            yield f"+++ {to_label}"
+        first, last = group[0], group[-1]
+        yield f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@"
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for ln in a_lines[i1:i2]:
+                    yield " " + ln
+                continue
+            if tag in ("replace", "delete"):
+                for ln in a_lines[i1:i2]:
+                    yield "-" + ln
+            if tag in ("replace", "insert"):
+                for ln in b_lines[j1:j2]:
+                    yield "+" + ln
+
+
+def _escape(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+_PRE_STYLE = "background:#fafafa;border:1px solid #eee;padding:12px;white-space:pre-wrap;overflow:auto;"
+
+
+def unified_diff_html(a_text: str, b_text: str, from_label: str, to_label: str,
+                      max_lines: int = DIFF_MAX_LINES, page_lines: int = DIFF_PAGE_LINES) -> str:
+    """
+    unified diff 的 HTML。輸出超過 page_lines 行時分段，第一段展開、其餘收合；
+    超過 max_lines 行的部分不輸出，只註明省略的行數。
+    """
+    if a_text == b_text:
+        return f"<pre style='{_PRE_STYLE}'></pre>"
+    out, buf, shown, omitted = [], [], 0, 0
+    for ln in unified_diff_lines(a_text.splitlines(), b_text.splitlines(), from_label, to_label):
+        if shown >= max_lines:
+            omitted += 1
+            continue
+        buf.append(_escape(ln))
+        shown += 1
+        if len(buf) >= page_lines:
+            out.append(buf); buf = []
+    if buf:
+        out.append(buf)
+    if not out:
+        return f"<pre style='{_PRE_STYLE}'></pre>"
+    if len(out) == 1:
+        html = f"<pre style='{_PRE_STYLE}'>" + "\n".join(out[0]) + "</pre>"
+    else:
+        parts = []
+        for k, chunk in enumerate(out):
+            lo = k * page_lines + 1
+            parts.append(f"<details{' open' if k == 0 else ''}><summary style='cursor:pointer'>"
+                         f"第 {lo}–{lo + len(chunk) - 1} 行</summary>"
+                         f"<pre style='{_PRE_STYLE}'>" + "\n".join(chunk) + "</pre></details>")
+        html = "".join(parts)
+    if omitted:
+        html += f"<p style='color:#a00'>（差異過長，已省略其餘 {omitted} 行）</p>"
+    return html
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 關鍵字遮罩｜平行處理引擎
+- 多檔批次：process pool 平行處理，結果逐檔寫入磁碟上的 ZIP
+- 單一大檔：依頁碼區段分給多個 worker，再以 insert_pdf 合併
+"""
+import io, os, tempfile, time, zipfile, traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import dataclass
+
+import fitz  # PyMuPDF
+
+from redact_core import redact_pdf, redact_page, RedactStats, SAVE_OPTIONS
+from batch_util import default_workers, make_pool, spill_to_file, unique_arcname
+
+
+@dataclass
+class BatchItemResult:
+    name: str
+    out_name: str
+    ok: bool
+    error: str = ""
+    seconds: float = 0.0
+    size: int = 0
+    stats: RedactStats = None
+
+
+def output_name(name: str) -> str:
+    """原檔名 → 遮罩後檔名"""
+    return f"{os.path.splitext(os.path.basename(name))[0]}_redacted.pdf"
+
+
+def _redact_one(src_path: str, out_path: str, keywords, ignore_case: bool, whole_word: bool, patterns):
+    """worker：依路徑開檔 → 遮罩 → 直接寫到 out_path，只回傳小型結果給主程序"""
+    t0 = time.perf_counter()
+    stats = RedactStats()
+    redact_pdf(src_path, keywords, ignore_case, whole_word, stats, out_path=out_path, patterns=patterns)
+    return time.perf_counter() - t0, os.path.getsize(out_path), stats
+
+
+def _iter_batch(sources, keywords, ignore_case, whole_word, patterns, max_workers, tmp, target_for):
+    """
+    共用的排程迴圈：依序送出工作、完成一個就產生 (BatchItemResult, out_path, cleanup)。
+    路徑來源直接交給 worker 開檔；bytes / 檔案物件才先寫成暫存檔。
+    同時在途的檔案數上限為 2 × worker 數，因此記憶體用量只跟 worker 數有關，與批次大小無關。
+    """
+    total = len(sources)
+    workers = max(1, min(max_workers or default_workers(), total or 1))
+    window = workers * 2
+    with make_pool(workers) as pool:
+        pending = {}
+        next_i = 0
+        while next_i < total or pending:
+            while next_i < total and len(pending) < window:
+                name, src = sources[next_i]
+                out_name, out_path = target_for(next_i, name)
+                cleanup = []
+                try:
+                    if isinstance(src, (str, os.PathLike)):
+                        src_path = os.fspath(src)
+                    else:
+                        src_path = os.path.join(tmp, f"{next_i}_in.pdf")
+                        cleanup.append(src_path)
+                        spill_to_file(src, src_path)
+                    fut = pool.submit(_redact_one, src_path, out_path, keywords, ignore_case, whole_word, patterns)
+                    pending[fut] = (name, out_name, out_path, cleanup)
+                except Exception as e:
+                    yield BatchItemResult(name, out_name, False, f"{type(e).__name__}: {e}"), None, cleanup
+                next_i += 1
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name, out_name, out_path, cleanup = pending.pop(fut)
+                try:
+                    seconds, size, stats = fut.result()
+                    item = BatchItemResult(name, out_name, True, seconds=seconds, size=size, stats=stats)
+                except Exception as e:
+                    traceback.print_exc()
+                    item = BatchItemResult(name, out_name, False, f"{type(e).__name__}: {e}")
+                    out_path = None
+                yield item, out_path, cleanup
+
+
+def _remove_quietly(paths):
+    for p in paths:
+        try: os.remove(p)
+        except OSError: pass
+
+
+def redact_batch(sources, zip_path: str, keywords, ignore_case=True, whole_word=False,
+                 max_workers: int = None, on_progress=None, patterns=None):
+    """
+    sources：[(檔名, bytes | 檔案物件 | 路徑), ...]
+    每個檔案完成就寫進 zip_path 並刪除暫存。
+    on_progress(done, total, BatchItemResult) 每完成一個檔案呼叫一次。
+    """
+    sources = list(sources)
+    results = []
+    used_names = set()
+    with tempfile.TemporaryDirectory(prefix="redact_batch_") as tmp, \
+            zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        def target_for(i, name):
+            return unique_arcname(output_name(name), used_names), os.path.join(tmp, f"{i}_out.pdf")
+        for item, out_path, cleanup in _iter_batch(sources, keywords, ignore_case, whole_word, patterns,
+                                                   max_workers, tmp, target_for):
+            if out_path:
+                try:
+                    zf.write(out_path, item.out_name)
+                except Exception as e:
+                    item.ok, item.error = False, f"{type(e).__name__}: {e}"
+                cleanup = cleanup + [out_path]
+            _remove_quietly(cleanup)
+            results.append(item)
+            if on_progress:
+                on_progress(len(results), len(sources), item)
+    return results
+
+
+def redact_batch_to_dir(sources, out_dir: str, keywords, ignore_case=True, whole_word=False,
+                        max_workers: int = None, on_progress=None, patterns=None):
+    """
+    與 redact_batch 相同，但 worker 直接把結果寫進 out_dir（不經暫存、不打包）。
+    檔名可含相對目錄（例如 "sub/a.pdf"），輸出時保留該目錄結構。
+    """
+    sources = list(sources)
+    results = []
+    used_paths = set()
+    with tempfile.TemporaryDirectory(prefix="redact_batch_") as tmp:
+        def target_for(i, name):
+            rel = os.path.join(os.path.dirname(name), output_name(name))
+            rel = unique_arcname(os.path.normpath(rel), used_paths)
+            out_path = os.path.join(out_dir, rel)
+            os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+            return rel, out_path
+        for item, _, cleanup in _iter_batch(sources, keywords, ignore_case, whole_word, patterns,
+                                            max_workers, tmp, target_for):
+            _remove_quietly(cleanup)
+            results.append(item)
+            if on_progress:
+                on_progress(len(results), len(sources), item)
+    return results
+
+
+# ---------------------- 單一大檔：頁碼區段平行 ----------------------
+_METADATA_KEYS = ("title", "author", "subject", "keywords", "creator", "producer",
+                  "creationDate", "modDate", "trapped")
+
+
+def _redact_shard(src_path: str, shard_path: str, start: int, stop: int,
+                  keywords, ignore_case: bool, whole_word: bool, patterns):
+    """worker：開啟原檔、只遮罩 [start, stop) 頁，另存成只含這些頁的分段檔"""
+    stats = RedactStats()
+    doc = fitz.open(src_path)
+    try:
+        for pno in range(start, stop):
+            redact_page(doc.load_page(pno), keywords, ignore_case, whole_word, stats, patterns)
+        # 在完整文件中讀取連結，目標頁碼即為合併後的頁碼（跨分段連結也不會遺失）
+        links = [doc.load_page(pno).get_links() for pno in range(start, stop)]
+        doc.select(list(range(start, stop)))
+        t0 = time.perf_counter()
+        doc.save(shard_path, garbage=1)
+        stats.add_time("shard_save", time.perf_counter() - t0)
+        return links, stats
+    finally:
+        doc.close()
+
+
+def _shard_ranges(n_pages: int, shard_pages: int):
+    return [(s, min(s + shard_pages, n_pages)) for s in range(0, n_pages, shard_pages)]
+
+
+def _restore_link(page: fitz.Page, lnk: dict):
+    lnk = dict(lnk, xref=0)  # 原檔的 annot xref 在新文件中無效
+    if lnk.get("kind") == fitz.LINK_NAMED and lnk.get("page", -1) >= 0:
+        # 具名目的地不會隨 insert_pdf 帶過來，改成直接跳頁
+        lnk["kind"] = fitz.LINK_GOTO
+    page.insert_link(lnk)
+
+
+def _copy_document_level(src: fitz.Document, out: fitz.Document):
+    """把書籤、metadata、頁碼標籤與顯示設定從原檔搬到合併後的文件"""
+    out.set_metadata({k: v for k, v in (src.metadata or {}).items() if k in _METADATA_KEYS and v})
+    xml = src.get_xml_metadata()
+    if xml:
+        out.set_xml_metadata(xml)
+    toc = src.get_toc(simple=False)
+    if toc:
+        out.set_toc(toc)
+    labels = src.get_page_labels()
+    if labels:
+        out.set_page_labels(labels)
+    if src.pagelayout:
+        out.set_pagelayout(src.pagelayout)
+    if src.pagemode:
+        out.set_pagemode(src.pagemode)
+
+
+def can_shard(doc: fitz.Document) -> bool:
+    """表單欄位與內嵌檔案無法逐段搬移，這類文件改走序列路徑"""
+    return not (doc.needs_pass or doc.is_form_pdf or doc.embfile_count())
+
+
+def redact_pdf_sharded(src, keywords, ignore_case=True, whole_word=False,
+                       shard_pages: int = 200, max_workers: int = None,
+                       stats: RedactStats = None, out_path: str = None, patterns=None):
+    """
+    src：bytes 或檔案路徑。每個 worker 遮罩一段連續頁碼，最後依序以 insert_pdf 合併，
+    並補回連結、書籤與 metadata；頁數不足兩段或無法分段的文件直接走 redact_pdf。
+    回傳值與 redact_pdf 相同：指定 out_path 時寫檔並回傳 None，否則回傳 PDF bytes。
+    """
+    shard_pages = max(1, int(shard_pages))
+    with tempfile.TemporaryDirectory(prefix="redact_shard_") as tmp:
+        if isinstance(src, (str, os.PathLike)):
+            src_path = os.fspath(src)
+        else:
+            src_path = os.path.join(tmp, "src.pdf")
+            spill_to_file(src, src_path)
+
+        with fitz.open(src_path) as probe:
+            n_pages = len(probe)
+            shardable = can_shard(probe)
+        ranges = _shard_ranges(n_pages, shard_pages)
+        if len(ranges) < 2 or not shardable:
+            return redact_pdf(src_path, keywords, ignore_case, whole_word, stats,
+                              out_path=out_path, patterns=patterns)
+
+        workers = max(1, min(max_workers or default_workers(), len(ranges)))
+        shard_paths = [os.path.join(tmp, f"shard_{i}.pdf") for i in range(len(ranges))]
+        with make_pool(workers) as pool:
+            futs = [pool.submit(_redact_shard, src_path, shard_paths[i], start, stop,
+                                keywords, ignore_case, whole_word, patterns)
+                    for i, (start, stop) in enumerate(ranges)]
+            shard_links = []
+            for f in futs:
+                links, shard_stats = f.result()
+                shard_links.append(links)
+                if stats is not None:
+                    stats.merge(shard_stats)
+
+        t0 = time.perf_counter()
+        src_doc = fitz.open(src_path)
+        out_doc = fitz.open()
+        try:
+            for path in shard_paths:
+                with fitz.open(path) as shard:
+                    out_doc.insert_pdf(shard, links=False, annots=True)
+            pno = 0
+            for links in shard_links:
+                for page_links in links:
+                    if page_links:
+                        page = out_doc.load_page(pno)
+                        for lnk in page_links:
+                            _restore_link(page, lnk)
+                    pno += 1
+            _copy_document_level(src_doc, out_doc)
+            out = out_path or io.BytesIO()
+            out_doc.save(out, **SAVE_OPTIONS)
+            if stats is not None:
+                stats.add_time("merge_save", time.perf_counter() - t0)
+            return None if out_path else out.getvalue()
+        finally:
+            out_doc.close()
+            src_doc.close()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 關鍵字遮罩｜命令列版（不需 Streamlit，可排入夜間批次）
+
+範例：
+    python redact_cli.py "contracts/**/*.pdf" -o out/ -K blacklist.txt -j 8 --json summary.json
+    python redact_cli.py big.pdf -o out/ -k 身分證字號 --shard-pages 200
+    python redact_cli.py in/ -o out/ --builtin tw_id --builtin email -p "PRD-\\d{6}"
+"""
+import argparse, json, os, sys, time
+from dataclasses import asdict
+
+from redact_core import (normalize_keywords, normalize_patterns, load_keywords_file,
+                         get_pattern_set, RedactStats, BUILTIN_PATTERNS)
+from redact_batch import redact_batch_to_dir, redact_pdf_sharded, output_name, BatchItemResult
+from batch_util import default_workers, collect_inputs, unique_arcname
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="PDF 關鍵字遮罩（命令列版）")
+    ap.add_argument("inputs", nargs="+", help="PDF 檔、資料夾或 glob（例如 'in/**/*.pdf'）")
+    ap.add_argument("-o", "--out-dir", required=True, help="輸出資料夾")
+    ap.add_argument("-k", "--keyword", action="append", default=[], help="關鍵字（可重複指定）")
+    ap.add_argument("-K", "--keywords-file", action="append", default=[], help="關鍵字檔（每行一個，可重複指定）")
+    ap.add_argument("-p", "--pattern", action="append", default=[], help="正規表示式樣式（可重複指定）")
+    ap.add_argument("--builtin", action="append", default=[], choices=sorted(BUILTIN_PATTERNS),
+                    help="內建樣式：" + "、".join(f"{k}={v[0]}" for k, v in BUILTIN_PATTERNS.items()))
+    ap.add_argument("--case-sensitive", action="store_true", help="區分大小寫（預設忽略大小寫）")
+    ap.add_argument("--whole-word", action="store_true", help="整字匹配")
+    ap.add_argument("--no-recursive", action="store_true", help="資料夾輸入時不遞迴子資料夾")
+    ap.add_argument("-j", "--jobs", type=int, default=default_workers(), help="平行處理數")
+    ap.add_argument("--shard-pages", type=int, default=0,
+                    help="大於 0 時改為逐檔分段平行（每段頁數），適合少量超大檔")
+    ap.add_argument("--json", dest="json_path", help="把結果摘要寫成 JSON（'-' 代表輸出到 stdout）")
+    ap.add_argument("-q", "--quiet", action="store_true", help="不顯示逐檔進度")
+    return ap
+
+
+def _load_keywords(args):
+    kws = list(args.keyword)
+    for path in args.keywords_file:
+        kws.extend(load_keywords_file(path))
+    return normalize_keywords("\n".join(kws))
+
+
+def _run_sharded(inputs, out_dir, keywords, patterns, args, on_progress):
+    results, used = [], set()
+    for rel, path in inputs:
+        out_rel = unique_arcname(os.path.normpath(os.path.join(os.path.dirname(rel), output_name(rel))), used)
+        out_path = os.path.join(out_dir, out_rel)
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        stats = RedactStats()
+        t0 = time.perf_counter()
+        try:
+            redact_pdf_sharded(path, keywords, not args.case_sensitive, args.whole_word,
+                               shard_pages=args.shard_pages, max_workers=args.jobs,
+                               stats=stats, out_path=out_path, patterns=patterns)
+            item = BatchItemResult(rel, out_rel, True, seconds=time.perf_counter() - t0,
+                                   size=os.path.getsize(out_path), stats=stats)
+        except Exception as e:
+            item = BatchItemResult(rel, out_rel, False, f"{type(e).__name__}: {e}")
+        results.append(item)
+        on_progress(len(results), len(inputs), item)
+    return results
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    keywords = _load_keywords(args)
+    patterns = normalize_patterns("\n".join(args.pattern), args.builtin)
+    if not keywords and not patterns:
+        print("錯誤：沒有任何關鍵字或樣式（請用 -k、-K、-p 或 --builtin 指定）", file=sys.stderr)
+        return 2
+    try:
+        get_pattern_set(patterns, not args.case_sensitive)
+    except ValueError as e:
+        print(f"錯誤：{e}", file=sys.stderr)
+        return 2
+    inputs = collect_inputs(args.inputs, recursive=not args.no_recursive)
+    if not inputs:
+        print("錯誤：找不到任何 PDF", file=sys.stderr)
+        return 2
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    def on_progress(done, total, item):
+        if args.quiet:
+            return
+        mark = "OK " if item.ok else "ERR"
+        extra = f"{item.seconds:.2f}s" if item.ok else item.error
+        print(f"[{done}/{total}] {mark} {item.name} → {item.out_name}  {extra}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    if args.shard_pages > 0:
+        results = _run_sharded(inputs, args.out_dir, keywords, patterns, args, on_progress)
+    else:
+        results = redact_batch_to_dir(inputs, args.out_dir, keywords, not args.case_sensitive,
+                                      args.whole_word, max_workers=args.jobs, on_progress=on_progress,
+                                      patterns=patterns)
+    elapsed = time.perf_counter() - t0
+
+    failed = [r for r in results if not r.ok]
+    if args.json_path:
+        summary = {
+            "keywords": len(keywords),
+            "patterns": len(patterns),
+            "files": len(results),
+            "failed": len(failed),
+            "seconds": round(elapsed, 3),
+            "pages": sum(r.stats.pages for r in results if r.stats),
+            "pages_skipped": sum(r.stats.pages_skipped for r in results if r.stats),
+            "results": [asdict(r) for r in results],
+        }
+        text = json.dumps(summary, ensure_ascii=False, indent=2)
+        if args.json_path == "-":
+            print(text)
+        else:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                f.write(text)
+    if not args.quiet:
+        print(f"完成 {len(results) - len(failed)}/{len(results)} 個檔案，耗時 {elapsed:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
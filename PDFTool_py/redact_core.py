@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 關鍵字遮罩核心（不依賴 Streamlit，可被 UI、批次程序與 worker process 匯入）
+"""
+import io, os, re, time
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import fitz  # PyMuPDF
+
+# ================== 關鍵字處理 ==================
+def normalize_keywords(raw_text: str):
+    """將多行輸入轉成去重清單（保留順序）"""
+    kws = [line.strip() for line in (raw_text or "").splitlines() if line.strip()]
+    # 去重但保留原順序
+    seen, out = set(), []
+    for k in kws:
+        if k not in seen:
+            seen.add(k)
+            out.append(k)
+    return out
+
+def load_keywords_file(path: str):
+    """讀取關鍵字檔（UTF-8，每行一個；# 開頭為註解）"""
+    with open(path, encoding="utf-8-sig") as f:
+        lines = [ln for ln in f.read().splitlines() if not ln.lstrip().startswith("#")]
+    return normalize_keywords("\n".join(lines))
+
+# ================== 開檔 ==================
+def open_pdf(src) -> fitz.Document:
+    """src 可為 bytes 或路徑；路徑交給 MuPDF 直接讀檔（按需讀取，不先整份複製成 Python bytes）"""
+    if isinstance(src, (str, os.PathLike)):
+        return fitz.open(os.fspath(src), filetype="pdf")
+    return fitz.open(stream=src, filetype="pdf")
+
+# ================== 頁面字元索引 ==================
+class PageText:
+    """單頁字元層級文字與座標（整頁只抽取一次，供所有關鍵字共用）"""
+
+    def __init__(self, text: str, boxes, line_ids):
+        self.text = text          # 串接後的頁面文字（行間補空白、區塊間補換行）
+        self.boxes = boxes        # 每個字元的 (x0,y0,x1,y1)；補上的分隔字元為 None
+        self.line_ids = line_ids  # 每個字元所屬的行序號；分隔字元為 -1
+        self._folded = {}
+
+    def folded(self, ignore_case: bool):
+        """回傳 (比對用文字, 對回原文的索引表)；索引表為 None 代表一對一"""
+        if ignore_case not in self._folded:
+            self._folded[ignore_case] = _fold_text(self.text, ignore_case)
+        return self._folded[ignore_case]
+
+
+def _fold_text(text: str, ignore_case: bool):
+    """casefold 可能改變長度（ß → ss），因此同時建立折疊後字元 → 原字元的索引"""
+    if not ignore_case:
+        return text, None
+    if text.isascii():
+        return text.lower(), None
+    parts, index = [], []
+    for i, ch in enumerate(text):
+        f = ch.casefold()
+        parts.append(f)
+        index.extend([i] * len(f))
+    return "".join(parts), index
+
+
+def extract_page_text(page: fitz.Page) -> PageText:
+    """用 rawdict 一次取出整頁字元與座標"""
+    chars, boxes, line_ids = [], [], []
+    line_no = 0
+    raw = page.get_text("rawdict", flags=fitz.TEXTFLAGS_SEARCH)
+    for block in raw.get("blocks", []):
+        if block.get("type", 0) != 0:
+            continue
+        if chars and chars[-1] != "\n":
+            chars.append("\n"); boxes.append(None); line_ids.append(-1)
+        for li, line in enumerate(block.get("lines", [])):
+            if li > 0:
+                # 同一區塊內換行視為空白，讓跨行片語仍能比對
+                chars.append(" "); boxes.append(None); line_ids.append(-1)
+            for span in line.get("spans", []):
+                for ch in span.get("chars", []):
+                    for c in ch["c"]:
+                        chars.append(c)
+                        boxes.append(tuple(ch["bbox"]))
+                        line_ids.append(line_no)
+            line_no += 1
+    return PageText("".join(chars), boxes, line_ids)
+
+# ================== 多關鍵字比對引擎 ==================
+class KeywordMatcher:
+    """Aho-Corasick 自動機：整組關鍵字對頁面文字只掃描一次"""
+
+    def __init__(self, keywords, ignore_case: bool = True):
+        self.keywords = list(keywords)
+        self.ignore_case = ignore_case
+        goto, fail, out = [{}], [0], [[]]
+        for ki, kw in enumerate(self.keywords):
+            key = kw.casefold() if ignore_case else kw
+            if not key:
+                continue
+            s = 0
+            for ch in key:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[s][ch] = nxt
+                    goto.append({}); fail.append(0); out.append([])
+                s = nxt
+            out[s].append((ki, len(key)))
+        # BFS 建立失敗連結，並把失敗節點的輸出併進來
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for ch, t in goto[s].items():
+                queue.append(t)
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[t] = goto[f].get(ch, 0)
+                if out[fail[t]]:
+                    out[t] = out[t] + out[fail[t]]
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def finditer(self, text: str):
+        """產生 (start, end, keyword_index)，end 不含；重疊的命中也會回報"""
+        goto, fail, out = self._goto, self._fail, self._out
+        s = 0
+        for i, ch in enumerate(text):
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                for ki, n in out[s]:
+                    yield i + 1 - n, i + 1, ki
+
+    def contains_any(self, text: str) -> bool:
+        """只判斷是否有任一關鍵字出現（text 需已依 ignore_case 折疊），命中即停"""
+        goto, fail, out = self._goto, self._fail, self._out
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                return True
+        return False
+
+
+@lru_cache(maxsize=32)
+def _cached_matcher(keywords: tuple, ignore_case: bool) -> KeywordMatcher:
+    return KeywordMatcher(keywords, ignore_case)
+
+
+def get_matcher(keywords, ignore_case: bool) -> KeywordMatcher:
+    """同一組關鍵字只建一次自動機（整份文件、跨頁共用）"""
+    return _cached_matcher(tuple(keywords), ignore_case)
+
+
+def _span_rects(pt: PageText, start: int, end: int):
+    """把原文 [start,end) 的字元依行合併成矩形（跨行命中會得到多個矩形）"""
+    rects = []
+    cur, box = None, None
+    for i in range(start, end):
+        b = pt.boxes[i]
+        if b is None:
+            continue
+        ln = pt.line_ids[i]
+        if ln != cur:
+            if box:
+                rects.append(fitz.Rect(box))
+            cur, box = ln, list(b)
+        else:
+            box[0] = min(box[0], b[0]); box[1] = min(box[1], b[1])
+            box[2] = max(box[2], b[2]); box[3] = max(box[3], b[3])
+    if box:
+        rects.append(fitz.Rect(box))
+    return rects
+
+
+def find_keyword_hits(pt: PageText, matcher: KeywordMatcher):
+    """回傳 [(keyword_index, [Rect, ...]), ...]，每筆為一次命中"""
+    text, index = pt.folded(matcher.ignore_case)
+    hits = []
+    for s, e, ki in matcher.finditer(text):
+        if index is not None:
+            s, e = index[s], index[e - 1] + 1
+        rects = _span_rects(pt, s, e)
+        if rects:
+            hits.append((ki, rects))
+    return hits
+
+# ================== 樣式（正規表示式）遮罩 ==================
+# 內建樣式：id → (顯示名稱, 正規表示式)
+BUILTIN_PATTERNS = {
+    "tw_id": ("台灣身分證／居留證號", r"(?<![A-Za-z0-9])[A-Za-z][1289]\d{8}(?!\d)"),
+    "tw_mobile": ("台灣手機號碼", r"(?<![\d+])(?:\+886[-\s]?|0)9\d{2}[-\s]?\d{3}[-\s]?\d{3}(?!\d)"),
+    "tw_phone": ("台灣市話號碼", r"(?<![\d+])(?:\(0\d{1,2}\)|0\d{1,2}[-\s])\s?\d{3,4}[-\s]?\d{4}(?!\d)"),
+    "email": ("E-mail", r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}"),
+}
+
+def normalize_patterns(raw_text: str = "", builtin_ids=()):
+    """內建樣式 id 與多行自訂樣式合併成去重清單（保留順序）"""
+    pats = [BUILTIN_PATTERNS[i][1] for i in builtin_ids]
+    pats.extend(normalize_keywords(raw_text))
+    return list(dict.fromkeys(pats))
+
+
+class PatternSet:
+    """一組預先編譯的正規表示式；直接在頁面串接文字上比對，不必逐一呼叫 search_for"""
+
+    def __init__(self, patterns, ignore_case: bool = True):
+        flags = re.IGNORECASE if ignore_case else 0
+        self.patterns = list(patterns)
+        self.compiled = []
+        for p in self.patterns:
+            try:
+                self.compiled.append(re.compile(p, flags))
+            except re.error as e:
+                raise ValueError(f"無效的正規表示式 {p!r}：{e}") from e
+
+    def finditer(self, text: str):
+        """產生 (start, end, pattern_index)；空字串命中略過"""
+        for pi, rx in enumerate(self.compiled):
+            for m in rx.finditer(text):
+                if m.end() > m.start():
+                    yield m.start(), m.end(), pi
+
+    def search_any(self, text: str) -> bool:
+        return any(rx.search(text) for rx in self.compiled)
+
+
+@lru_cache(maxsize=32)
+def _cached_pattern_set(patterns: tuple, ignore_case: bool) -> PatternSet:
+    return PatternSet(patterns, ignore_case)
+
+
+def get_pattern_set(patterns, ignore_case: bool) -> PatternSet:
+    """同一組樣式只編譯一次（整份文件、跨頁共用）"""
+    return _cached_pattern_set(tuple(patterns), ignore_case)
+
+
+def find_pattern_hits(pt: PageText, pattern_set: PatternSet):
+    """回傳 [(pattern_index, [Rect, ...]), ...]；比對原文（非折疊文字），索引可直接對回字元座標"""
+    hits = []
+    for s, e, pi in pattern_set.finditer(pt.text):
+        rects = _span_rects(pt, s, e)
+        if rects:
+            hits.append((pi, rects))
+    return hits
+
+# ================== 整字比對：單頁文字詞空間索引 ==================
+_CJK_RANGES = (
+    ("\u2e80", "\u9fff"),          # CJK 部首、標點、假名、注音、統一漢字
+    ("\uac00", "\ud7af"),          # 韓文音節
+    ("\uf900", "\ufaff"),          # 相容漢字
+    ("\uff00", "\uffef"),          # 全形字元
+    ("\U00020000", "\U0003134f"),  # 擴充漢字
+)
+
+def _is_cjk(ch: str) -> bool:
+    return any(lo <= ch <= hi for lo, hi in _CJK_RANGES)
+
+def _is_boundary(outside: str, edge: str) -> bool:
+    """outside 為命中範圍外側相鄰字元，edge 為命中範圍邊緣字元"""
+    if not outside:
+        return True
+    if not (outside.isalnum() or outside == "_") or not (edge.isalnum() or edge == "_"):
+        return True
+    # 中日韓文字沒有空白分詞，與其相鄰一律視為詞界
+    return _is_cjk(outside) or _is_cjk(edge)
+
+
+class PageWordIndex:
+    """單頁 words 的網格索引；每頁只建一次，所有關鍵字共用"""
+
+    def __init__(self, words, cell: float = 48.0):
+        self.cell = cell
+        # 依閱讀順序排好，並把 casefold 後的文字存在旁邊
+        self.words = sorted(words, key=lambda w: (w[5], w[6], w[7]))
+        self.folded = [w[4].casefold() for w in self.words]
+        self.grid = {}
+        for i, w in enumerate(self.words):
+            for key in self._cells(w[0], w[1], w[2], w[3]):
+                self.grid.setdefault(key, []).append(i)
+
+    @classmethod
+    def from_page(cls, page: fitz.Page, cell: float = 48.0):
+        return cls(page.get_text("words"), cell)  # [x0,y0,x1,y1,"text", block, line, word_no]
+
+    def _cells(self, x0, y0, x1, y1):
+        c = self.cell
+        for cy in range(int(y0 // c), int(y1 // c) + 1):
+            for cx in range(int(x0 // c), int(x1 // c) + 1):
+                yield cx, cy
+
+    def intersecting(self, rect):
+        """回傳與 rect 重疊的 word 索引（依閱讀順序）"""
+        x0, y0, x1, y1 = rect[0], rect[1], rect[2], rect[3]
+        found = set()
+        for key in self._cells(x0, y0, x1, y1):
+            for i in self.grid.get(key, ()):
+                if i in found:
+                    continue
+                w = self.words[i]
+                if x0 < w[2] and w[0] < x1 and y0 < w[3] and w[1] < y1:
+                    found.add(i)
+        return sorted(found)
+
+    def is_whole_word(self, rects, kw: str, ignore_case: bool) -> bool:
+        """命中範圍（可跨多個詞、多行）前後都落在詞界上才算整字"""
+        ids = sorted({i for r in rects for i in self.intersecting(r)})
+        if not ids:
+            return True  # 抽不到 words 時不過濾，與舊版一致
+        if ignore_case:
+            joined = " ".join(self.folded[i] for i in ids)
+            key = " ".join(kw.casefold().split())
+        else:
+            joined = " ".join(self.words[i][4] for i in ids)
+            key = " ".join(kw.split())
+        if not key:
+            return False
+        pos = joined.find(key)
+        while pos >= 0:
+            end = pos + len(key)
+            before = joined[pos - 1] if pos > 0 else ""
+            after = joined[end] if end < len(joined) else ""
+            if _is_boundary(before, key[0]) and _is_boundary(after, key[-1]):
+                return True
+            pos = joined.find(key, pos + 1)
+        return False
+
+# ================== 搜尋 / 遮罩核心 ==================
+def collect_redaction_rects(page: fitz.Page, keywords, ignore_case: bool, whole_word: bool,
+                            page_text: PageText = None, word_index: PageWordIndex = None,
+                            patterns=None):
+    """
+    依關鍵字與樣式回傳要遮罩的矩形陣列（整組關鍵字一次掃描、樣式各掃一次頁面文字）。
+    整字匹配只套用在關鍵字；樣式的邊界由正規表示式自行決定。
+    """
+    if not keywords and not patterns:
+        return []
+    pt = page_text if page_text is not None else extract_page_text(page)
+    all_rects = []
+    if keywords:
+        matcher = get_matcher(keywords, ignore_case)
+        for ki, rects in find_keyword_hits(pt, matcher):
+            if whole_word:
+                if word_index is None:
+                    word_index = PageWordIndex.from_page(page)
+                if not word_index.is_whole_word(rects, matcher.keywords[ki], ignore_case):
+                    continue
+            all_rects.extend(rects)
+    if patterns:
+        for _, rects in find_pattern_hits(pt, get_pattern_set(patterns, ignore_case)):
+            all_rects.extend(rects)
+    # 最終再去重
+    uniq = []
+    seen = set()
+    for r in all_rects:
+        key = (round(r.x0,1), round(r.y0,1), round(r.x1,1), round(r.y1,1))
+        if key not in seen:
+            seen.add(key)
+            uniq.append(r)
+    return uniq
+
+# 大型輸出的存檔參數：清掉無用物件並合併重複物件、壓縮未壓縮的串流、使用 object streams。
+# garbage=4 會逐一比對串流內容，對大檔太慢，因此停在 3。
+SAVE_OPTIONS = dict(garbage=3, deflate=True, use_objstms=1)
+
+@dataclass
+class RedactStats:
+    """一次遮罩作業的統計：頁數與各階段耗時（秒）"""
+    pages: int = 0
+    pages_skipped: int = 0
+    pages_redacted: int = 0
+    rects: int = 0
+    timings: dict = field(default_factory=dict)
+
+    def add_time(self, stage: str, seconds: float):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def merge(self, other: "RedactStats"):
+        self.pages += other.pages
+        self.pages_skipped += other.pages_skipped
+        self.pages_redacted += other.pages_redacted
+        self.rects += other.rects
+        for k, v in other.timings.items():
+            self.add_time(k, v)
+
+    def summary(self) -> str:
+        stages = "、".join(f"{k} {v:.2f}s" for k, v in self.timings.items())
+        return (f"共 {self.pages} 頁，遮罩 {self.pages_redacted} 頁（{self.rects} 處），"
+                f"略過 {self.pages_skipped} 頁；{stages}")
+
+def page_may_match(page: fitz.Page, keywords, ignore_case=True, patterns=None) -> bool:
+    """預篩：整頁純文字做一次折疊後的多關鍵字包含測試（及樣式搜尋）；沒命中的頁面不必做字元層級搜尋"""
+    text = page.get_text("text", flags=fitz.TEXTFLAGS_SEARCH).replace("\n", " ")
+    if patterns and get_pattern_set(patterns, ignore_case).search_any(text):
+        return True
+    if not keywords:
+        return False
+    if ignore_case:
+        text = text.casefold()
+    return get_matcher(keywords, ignore_case).contains_any(text)
+
+def redact_page(page: fitz.Page, keywords, ignore_case=True, whole_word=False,
+                stats: RedactStats = None, patterns=None) -> int:
+    """對單頁加上遮罩並套用，回傳遮罩矩形數（序列與分段平行路徑共用）"""
+    stats = stats if stats is not None else RedactStats()
+    stats.pages += 1
+    t0 = time.perf_counter()
+    hit = bool(keywords or patterns) and page_may_match(page, keywords, ignore_case, patterns)
+    t1 = time.perf_counter()
+    stats.add_time("prescreen", t1 - t0)
+    rects = collect_redaction_rects(page, keywords, ignore_case, whole_word, patterns=patterns) if hit else []
+    t2 = time.perf_counter()
+    stats.add_time("search", t2 - t1)
+    if not rects:
+        # 沒有任何遮罩就不呼叫 apply_redactions，避免重寫內容串流
+        stats.pages_skipped += 1
+        return 0
+    for r in rects:
+        page.add_redact_annot(r, fill=(0, 0, 0))
+    page.apply_redactions()
+    stats.add_time("apply", time.perf_counter() - t2)
+    stats.pages_redacted += 1
+    stats.rects += len(rects)
+    return len(rects)
+
+def redact_pdf(src, keywords, ignore_case=True, whole_word=False,
+               stats: RedactStats = None, out_path: str = None, patterns=None):
+    """
+    實際寫入紅色遮罩並輸出 PDF。src 為 bytes 或路徑；patterns 為正規表示式清單（可省略）。
+    指定 out_path 時直接寫檔並回傳 None，否則回傳 PDF bytes。傳入 stats 可取得頁數與各階段耗時。
+    """
+    stats = stats if stats is not None else RedactStats()
+    t0 = time.perf_counter()
+    doc = open_pdf(src)
+    stats.add_time("open", time.perf_counter() - t0)
+    try:
+        for page in doc:
+            redact_page(page, keywords, ignore_case, whole_word, stats, patterns)
+        t0 = time.perf_counter()
+        if out_path:
+            doc.save(out_path, **SAVE_OPTIONS)
+            stats.add_time("save", time.perf_counter() - t0)
+            return None
+        out = io.BytesIO()
+        doc.save(out, **SAVE_OPTIONS)
+        stats.add_time("save", time.perf_counter() - t0)
+        return out.getvalue()
+    finally:
+        doc.close()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+PDF 關鍵字遮罩｜預覽快取（以檔案內容雜湊為鍵，跨 Streamlit rerun 重用）
+- 已渲染的頁面影像與每頁字元／詞索引放進 LRU，超過記憶體上限就淘汰最久未用者
+- 關鍵字或選項改變時只重畫紅框，不重新渲染、不重新抽字
+- 頁面一律按需處理：沒被看到的頁不會被渲染
+"""
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+from redact_core import open_pdf, extract_page_text, collect_redaction_rects, PageWordIndex
+
+PREVIEW_ZOOM = 1.0
+THUMB_ZOOM = 0.25
+
+
+def _image_size(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class PreviewCache:
+    """LRU 快取；entry 大小以估計的位元組計，總量不超過 budget_bytes"""
+
+    def __init__(self, budget_bytes: int = 256 * 1024 * 1024, max_docs: int = 4):
+        self.budget = budget_bytes
+        self.max_docs = max_docs
+        self._docs = OrderedDict()      # key → fitz.Document
+        self._items = OrderedDict()     # (key, 類型, 頁碼, ...) → (值, size)
+        self._used = 0
+        self._lock = threading.RLock()
+
+    # ---------- LRU 基本操作 ----------
+    def _get(self, k):
+        hit = self._items.get(k)
+        if hit is None:
+            return None
+        self._items.move_to_end(k)
+        return hit[0]
+
+    def _put(self, k, value, size: int):
+        if k in self._items:
+            self._used -= self._items.pop(k)[1]
+        self._items[k] = (value, size)
+        self._used += size
+        while self._used > self.budget and len(self._items) > 1:
+            _, (_, s) = self._items.popitem(last=False)
+            self._used -= s
+
+    def _doc(self, key: str, data: bytes):
+        doc = self._docs.get(key)
+        if doc is not None:
+            self._docs.move_to_end(key)
+            return doc
+        doc = open_pdf(data)
+        self._docs[key] = doc
+        while len(self._docs) > self.max_docs:
+            _, old = self._docs.popitem(last=False)
+            old.close()
+        return doc
+
+    def clear(self):
+        with self._lock:
+            for doc in self._docs.values():
+                doc.close()
+            self._docs.clear()
+            self._items.clear()
+            self._used = 0
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    # ---------- 對外 API ----------
+    def page_count(self, key: str, data: bytes) -> int:
+        with self._lock:
+            return len(self._doc(key, data))
+
+    def render(self, key: str, data: bytes, pno: int, zoom: float = PREVIEW_ZOOM) -> Image.Image:
+        """渲染單頁（快取）；回傳的影像請勿直接修改"""
+        with self._lock:
+            k = (key, "img", pno, zoom)
+            img = self._get(k)
+            if img is None:
+                page = self._doc(key, data).load_page(pno)
+                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                self._put(k, img, _image_size(img))
+            return img
+
+    def page_text(self, key: str, data: bytes, pno: int):
+        """單頁字元索引（快取）"""
+        with self._lock:
+            k = (key, "text", pno)
+            pt = self._get(k)
+            if pt is None:
+                pt = extract_page_text(self._doc(key, data).load_page(pno))
+                self._put(k, pt, 64 + 120 * len(pt.text))
+            return pt
+
+    def word_index(self, key: str, data: bytes, pno: int) -> PageWordIndex:
+        """單頁詞索引（快取）；只有整字匹配時才會用到"""
+        with self._lock:
+            k = (key, "words", pno)
+            wi = self._get(k)
+            if wi is None:
+                wi = PageWordIndex.from_page(self._doc(key, data).load_page(pno))
+                self._put(k, wi, 64 + 200 * len(wi.words))
+            return wi
+
+    def rects(self, key: str, data: bytes, pno: int, keywords, ignore_case=True,
+              whole_word=False, patterns=None):
+        """用快取的字元／詞索引重新計算遮罩矩形（便宜，不重新抽字）"""
+        with self._lock:
+            pt = self.page_text(key, data, pno)
+            wi = self.word_index(key, data, pno) if whole_word and keywords else None
+            page = self._doc(key, data).load_page(pno)
+            return collect_redaction_rects(page, keywords, ignore_case, whole_word,
+                                           page_text=pt, word_index=wi, patterns=patterns)
+
+    def overlay(self, key: str, data: bytes, pno: int, keywords, ignore_case=True,
+                whole_word=False, patterns=None, zoom: float = PREVIEW_ZOOM) -> Image.Image:
+        """快取的頁面影像 + 依目前選項重畫的紅框"""
+        base = self.render(key, data, pno, zoom)
+        rects = self.rects(key, data, pno, keywords, ignore_case, whole_word, patterns)
+        return draw_rects(base, rects, zoom)
+
+
+def draw_rects(base: Image.Image, rects, zoom: float = 1.0) -> Image.Image:
+    """在影像副本上畫出將被遮罩的紅框（不改原圖）"""
+    img = base.copy()
+    draw = ImageDraw.Draw(img, "RGBA")
+    width = max(1, int(round(3 * zoom)))
+    for r in rects:
+        box = [r.x0 * zoom, r.y0 * zoom, r.x1 * zoom, r.y1 * zoom]
+        draw.rectangle(box, outline=(255, 0, 0, 255), width=width)
+        draw.rectangle(box, fill=(255, 0, 0, 50))
+    return img
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+diff_core 的遮罩元件標記與差異框合併，對照逐像素／逐對比較的暴力版
+"""
+from collections import deque
+
+import numpy as np
+import pytest
+
+from diff_core import find_components, merge_boxes
+
+
+# ---------- 暴力版 ----------
+def _reference_components(mask: np.ndarray, min_area: int):
+    """逐像素 BFS（8 連通），依每個元件第一個像素的掃描順序輸出"""
+    h, w = mask.shape
+    seen = np.zeros(mask.shape, dtype=bool)
+    out = []
+    for y in range(h):
+        for x in range(w):
+            if not mask[y, x] or seen[y, x]:
+                continue
+            seen[y, x] = True
+            queue, pts = deque([(y, x)]), []
+            while queue:
+                cy, cx = queue.popleft()
+                pts.append((cx, cy))
+                for ny in range(max(0, cy - 1), min(h, cy + 2)):
+                    for nx in range(max(0, cx - 1), min(w, cx + 2)):
+                        if mask[ny, nx] and not seen[ny, nx]:
+                            seen[ny, nx] = True
+                            queue.append((ny, nx))
+            if len(pts) >= max(1, min_area // 4):
+                xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+                out.append((min(xs), min(ys), max(xs), max(ys)))
+    return out
+
+
+def _reference_merge(boxes, pad: int):
+    """任兩框距離在 pad 內就合併，重複到沒有可合併的框為止（不動點）"""
+    cur = [tuple(b) for b in boxes]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(cur)):
+            for j in range(i + 1, len(cur)):
+                a, b = cur[i], cur[j]
+                if a[2] + pad < b[0] or b[2] + pad < a[0] or a[3] + pad < b[1] or b[3] + pad < a[1]:
+                    continue
+                cur[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                del cur[j]
+                changed = True
+                break
+            if changed:
+                break
+    return sorted(cur, key=lambda b: (b[1], b[0], b[3], b[2]))
+
+
+# ---------- find_components ----------
+@pytest.mark.parametrize("seed", range(12))
+@pytest.mark.parametrize("density", [0.05, 0.3, 0.55])
+def test_find_components_matches_bfs(seed, density):
+    rng = np.random.default_rng(seed)
+    h, w = rng.integers(1, 40, size=2)
+    mask = np.where(rng.random((h, w)) < density, 255, 0).astype(np.uint8)
+    for min_area in (0, 4, 12):
+        assert find_components(mask, min_area) == _reference_components(mask, min_area)
+
+
+def test_find_components_shapes():
+    mask = np.zeros((9, 9), dtype=np.uint8)
+    mask[0, 0] = mask[1, 1] = mask[2, 2] = 255      # 斜線：8 連通為同一元件
+    mask[0, 8] = 255
+    mask[4:9, 4] = mask[8, 4:9] = mask[4, 8] = 255  # U 形：兩臂在底部才相連
+    mask[4:8, 8] = 255
+    assert find_components(mask, 0) == [(0, 0, 2, 2), (8, 0, 8, 0), (4, 4, 8, 8)]
+    assert find_components(np.zeros((5, 5), dtype=np.uint8), 0) == []
+
+
+# ---------- merge_boxes ----------
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("pad", [0, 3, 15])
+def test_merge_boxes_matches_fixed_point(seed, pad):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 60))
+    x0, y0 = rng.integers(0, 400, size=n), rng.integers(0, 400, size=n)
+    w, h = rng.integers(0, 40, size=n), rng.integers(0, 40, size=n)
+    boxes = [(int(a), int(b), int(a + c), int(b + d)) for a, b, c, d in zip(x0, y0, w, h)]
+    expected = _reference_merge(boxes, pad)
+    assert merge_boxes(boxes, pad) == expected
+    # 結果與輸入順序無關
+    assert merge_boxes(boxes[::-1], pad) == expected
+
+
+def test_merge_boxes_transitive():
+    # a 與 c 不相鄰，但 a+b 合併後的框會碰到 c
+    boxes = [(0, 0, 10, 10), (12, 0, 20, 30), (0, 31, 5, 40), (100, 100, 110, 110)]
+    assert merge_boxes(boxes, 2) == [(0, 0, 20, 40), (100, 100, 110, 110)]
+    assert merge_boxes([], 5) == []
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+RenderStore.prune 依最近使用（而非寫入順序）淘汰：命中的 entry 留到最後
+"""
+import os
+
+import fitz  # PyMuPDF
+
+from diff_store import RenderStore
+
+
+def _doc(pages: int = 2) -> fitz.Document:
+    doc = fitz.open()
+    for k in range(pages):
+        doc.new_page(width=200, height=200).insert_text((20, 40), f"page {k}")
+    return doc
+
+
+def _files(root):
+    return sorted(f for _, _, files in os.walk(root) for f in files)
+
+
+def _age_all(root, seconds: int = 3600):
+    for d, _, files in os.walk(root):
+        for f in files:
+            p = os.path.join(d, f)
+            t = os.stat(p).st_mtime - seconds
+            os.utime(p, (t, t))
+
+
+def test_prune_keeps_recent_render_hit(tmp_path):
+    store = RenderStore(str(tmp_path))
+    doc = _doc()
+    for page in doc:
+        store.render("k" * 40, page, 72, 400, 0)
+    _age_all(tmp_path)
+    # 第 1 頁先寫入，但剛被命中，應該留下
+    store.render("k" * 40, doc[0], 72, 400, 0)
+    one = os.path.getsize(os.path.join(store._dir("k" * 40), _files(tmp_path)[0]))
+    assert store.prune(one) == 1
+    assert _files(tmp_path) == ["p00000_d72_m400_b0_g.npy"]
+
+
+def test_prune_keeps_recent_analysis_hit(tmp_path):
+    store = RenderStore(str(tmp_path))
+    old, new = _doc(), _doc(3)
+    store.analysis("a" * 40, old, 0.0, 0.0)
+    store.analysis("b" * 40, new, 0.0, 0.0)
+    _age_all(tmp_path)
+    texts, _ = store.analysis("a" * 40, old, 0.0, 0.0)
+    assert texts[0].strip() == "page 0"
+    assert store.prune(os.path.getsize(os.path.join(store._dir("a" * 40), "text_h0_f0.json"))) == 1
+    assert os.listdir(store._dir("a" * 40)) == ["text_h0_f0.json"]
+    assert not os.path.exists(os.path.join(store._dir("b" * 40), "text_h0_f0.json"))
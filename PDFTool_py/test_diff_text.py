@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+similarity_bounded 對照 difflib.SequenceMatcher.ratio 與逐格動態規劃的 LCS
+單字元 token（中日韓字元）時 token 加權等於字元數，可直接和 ratio 比較：
+Myers 找到的是最長共同子序列，因此不會低於 ratio（difflib 取最長區塊，不保證最佳）；
+超過 MAX_D_TOKENS 改走 difflib 時則應與 ratio 完全相同。
+"""
+import random
+import textwrap
+from difflib import SequenceMatcher
+
+import pytest
+
+import diff_text
+from diff_text import similarity_bounded, tokenize
+
+ALPHABET = "甲乙丙丁戊己"
+WORDS = ["the", "a", "contract", "party", "shall", "x", "12", "。", ",", "甲"]
+SAME_LEN_WORDS = ["that", "shal", "part", "2024", "abcd", "term"]  # 權重相同時，token 數最佳即字元數最佳
+
+
+def _lcs_weight(a, b) -> int:
+    """以字元數加權的最長共同子序列（O(N·M) 動態規劃）"""
+    prev = [0] * (len(b) + 1)
+    for ta in a:
+        cur = [0]
+        for j, tb in enumerate(b):
+            cur.append(prev[j] + len(ta) if ta == tb else max(prev[j + 1], cur[j]))
+        prev = cur
+    return prev[-1]
+
+
+def _lcs_ratio(a: str, b: str) -> float:
+    ta, tb = tokenize(a), tokenize(b)
+    total = sum(map(len, ta)) + sum(map(len, tb))
+    return 2.0 * _lcs_weight(ta, tb) / total if total else 1.0
+
+
+def _random_text(rnd, alphabet, n):
+    return "".join(rnd.choice(alphabet) for _ in range(n))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_single_char_tokens_vs_ratio(seed):
+    rnd = random.Random(seed)
+    a = _random_text(rnd, ALPHABET, rnd.randint(1, 30))
+    b = _random_text(rnd, ALPHABET, rnd.randint(1, 30))
+    sim, exact = similarity_bounded(a, b)
+    assert exact
+    assert sim == pytest.approx(_lcs_ratio(a, b))
+    assert sim >= SequenceMatcher(None, a, b, autojunk=False).ratio() - 1e-12
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_difflib_fallback_equals_ratio(monkeypatch, seed):
+    # 強制超過 Myers 上限，改走同一組 token 上的 difflib
+    monkeypatch.setattr(diff_text, "MAX_D_TOKENS", 0)
+    rnd = random.Random(seed)
+    a = _random_text(rnd, ALPHABET, rnd.randint(1, 30))
+    b = _random_text(rnd, ALPHABET, rnd.randint(1, 30))
+    sim, exact = similarity_bounded(a, b)
+    assert exact
+    assert sim == pytest.approx(SequenceMatcher(None, a, b, autojunk=False).ratio())
+
+
+def test_fallback_keeps_token_granularity(monkeypatch):
+    # 同一段文字重新換行並改掉少數詞：行層級幾乎完全不同，token 層級應仍然很高
+    rnd = random.Random(0)
+    words = [rnd.choice(WORDS[:6]) for _ in range(200)]
+    edited = ["zz" if k % 10 == 0 else w for k, w in enumerate(words)]
+    a = "\n".join(textwrap.wrap(" ".join(words), 50))
+    b = "\n".join(textwrap.wrap(" ".join(edited), 70))
+    monkeypatch.setattr(diff_text, "MAX_D_TOKENS", 0)
+    sim, exact = similarity_bounded(a, b)
+    assert exact and sim > 0.8
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_word_tokens_vs_lcs(seed):
+    rnd = random.Random(seed)
+    a = " ".join(rnd.choice(SAME_LEN_WORDS) for _ in range(rnd.randint(1, 25)))
+    b = " ".join(rnd.choice(SAME_LEN_WORDS) for _ in range(rnd.randint(1, 25)))
+    sim, exact = similarity_bounded(a, b)
+    assert exact and sim == pytest.approx(_lcs_ratio(a, b))
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_weighted_tokens_and_floor(seed):
+    # token 長短不一時 Myers 最佳化的是 token 數，字元加權的 LCS 只是上界
+    rnd = random.Random(seed)
+    a = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 25)))
+    b = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 25)))
+    sim, exact = similarity_bounded(a, b)
+    assert exact and 0.0 <= sim <= _lcs_ratio(a, b) + 1e-12
+    # floor 只會讓結果變成上界（不低於精確值）
+    for floor in (0.2, 0.5, 0.9):
+        bound, bound_exact = similarity_bounded(a, b, floor)
+        if bound_exact:
+            assert bound == pytest.approx(sim)
+        else:
+            assert bound < floor and bound >= sim - 1e-12
+
+
+def test_edge_cases():
+    assert similarity_bounded("", "") == (1.0, True)
+    assert similarity_bounded("abc", "") == (0.0, True)
+    assert similarity_bounded("同一段", "同一段") == (1.0, True)
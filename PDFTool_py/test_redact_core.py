@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+redact_page 與原本逐關鍵字 page.search_for 實作的矩形等價性
+舊實作（_reference_rects）照搬自改寫前的 tool1_redactor.py，只在它本身正確的範圍內比較：
+- 忽略大小寫（search_for 一律忽略大小寫，舊版的「區分大小寫」其實沒有作用）
+- 整字匹配只用單一詞關鍵字（舊版對含空白的片語不做整字過濾）
+"""
+import random
+
+import fitz  # PyMuPDF
+import pytest
+
+from redact_core import redact_page
+
+WORDS = ["alpha", "beta", "Gamma", "secret", "Secret", "SECRET", "secretive", "top", "id", "A-12", "x", "12345"]
+TOL = 0.5  # 點；兩種做法的字元框來源不同，容許些微誤差
+
+
+# ---------- 舊實作 ----------
+def _dedupe(rects):
+    out, seen = [], set()
+    for r in rects:
+        key = (round(r.x0, 1), round(r.y0, 1), round(r.x1, 1), round(r.y1, 1))
+        if key not in seen:
+            seen.add(key)
+            out.append(r)
+    return out
+
+
+def _reference_rects(page, keywords, whole_word):
+    found = []
+    for kw in keywords:
+        rects = []
+        for var in {kw, kw.lower(), kw.upper(), kw.title(), kw.casefold()}:
+            rects.extend(page.search_for(var) or [])
+        rects = _dedupe(rects)
+        if whole_word:
+            words = page.get_text("words")
+            rects = [r for r in rects
+                     if any(r.intersects(fitz.Rect(w[:4])) and w[4].casefold() == kw.casefold() for w in words)]
+        found.extend(rects)
+    return _dedupe(found)
+
+
+# ---------- 工具 ----------
+def _make_pdf(seed: int, pages: int = 2) -> bytes:
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        for ln in range(30):
+            page.insert_text((40, 40 + ln * 20), " ".join(rnd.choice(WORDS) for _ in range(8)), fontsize=10)
+        page.insert_text((40, 700), "機密 資料 機密文件", fontname="china-t", fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _redacted_rects(monkeypatch, page, *args, **kwargs):
+    """執行 redact_page，記錄它加上的遮罩矩形"""
+    got = []
+    monkeypatch.setattr(fitz.Page, "add_redact_annot", lambda self, r, **kw: got.append(fitz.Rect(r)))
+    n = redact_page(page, *args, **kwargs)
+    monkeypatch.undo()
+    assert n == len(got)
+    return got
+
+
+def _covered(rects, others):
+    return all(any(max(abs(r.x0 - o.x0), abs(r.y0 - o.y0), abs(r.x1 - o.x1), abs(r.y1 - o.y1)) < TOL
+                   for o in others) for r in rects)
+
+
+# ---------- 測試 ----------
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("keywords,whole_word", [
+    (["secret"], False),
+    (["secret"], True),
+    (["secret", "top"], False),
+    (["A-12", "機密"], False),
+    (["x", "id"], True),
+    (["12345", "Gamma"], True),
+])
+def test_matches_reference(monkeypatch, seed, keywords, whole_word):
+    data = _make_pdf(seed)
+    ref_doc, doc = fitz.open("pdf", data), fitz.open("pdf", data)
+    for ref_page, page in zip(ref_doc, doc):
+        expected = _reference_rects(ref_page, keywords, whole_word)
+        got = _redacted_rects(monkeypatch, page, keywords, True, whole_word)
+        assert len(got) == len(expected)
+        assert _covered(expected, got) and _covered(got, expected)
+
+
+def test_case_sensitive_only_exact_case(monkeypatch):
+    doc = fitz.open("pdf", _make_pdf(3))
+    page = doc[0]
+    got = _redacted_rects(monkeypatch, page, ["Secret"], False, True)
+    assert got
+    assert all(page.get_textbox(r).strip() == "Secret" for r in got)
+
+
+def test_phrase_whole_word(monkeypatch):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((40, 40), "top secret top secretive", fontsize=10)
+    got = _redacted_rects(monkeypatch, page, ["top secret"], True, True)
+    assert len(got) == 1
+
+
+def test_no_match_leaves_page(monkeypatch):
+    doc = fitz.open("pdf", _make_pdf(4, pages=1))
+    assert _redacted_rects(monkeypatch, doc[0], ["nothing-here"], True, False) == []
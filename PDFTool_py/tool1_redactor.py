@@ -1,131 +1,16 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-import fitz  # PyMuPDF
-import io, zipfile, os
-from PIL import Image, ImageDraw
-
-# ================== 關鍵字處理 ==================
-def normalize_keywords(raw_text: str):
-    """將多行輸入轉成去重清單（保留順序）"""
-    kws = [line.strip() for line in (raw_text or "").splitlines() if line.strip()]
-    # 去重但保留原順序
-    seen, out = set(), []
-    for k in kws:
-        if k not in seen:
-            seen.add(k)
-            out.append(k)
-    return out
-
-def keyword_variants(kw: str):
-    """產生多種大小寫變體，近似 ignore-case 搜尋"""
-    v = {kw, kw.lower(), kw.upper(), kw.title(), kw.casefold()}
-    return list(v)
-
-# ================== 搜尋 / 遮罩核心 ==================
-def _collect_rects_basic(page: fitz.Page, kw: str, ignore_case: bool):
-    """用 page.search_for 找到 kw 的矩形，回傳 list[Rect]"""
-    rects = []
-    if ignore_case:
-        # PyMuPDF 沒原生 ignore-case；用多種變體嘗試
-        tried = set()
-        for var in keyword_variants(kw):
-            if var in tried:
-                continue
-            tried.add(var)
-            rects.extend(page.search_for(var) or [])
-    else:
-        rects.extend(page.search_for(kw) or [])
-    # 去重（以座標四捨五入做粗略去重）
-    uniq = []
-    seen = set()
-    for r in rects:
-        key = (round(r.x0,1), round(r.y0,1), round(r.x1,1), round(r.y1,1))
-        if key not in seen:
-            seen.add(key)
-            uniq.append(r)
-    return uniq
-
-def _filter_whole_word(page: fitz.Page, rects, kw: str, ignore_case: bool):
-    """對單詞型 kw 做整字匹配過濾（用 words 邊界）"""
-    # 只對不含空白的「單一詞」做整字匹配
-    if " " in kw or "\t" in kw or "\u3000" in kw:
-        return rects
-    words = page.get_text("words")  # [x0,y0,x1,y1,"text", block, line, word_no]
-    if not words:
-        return rects
-    out = []
-    for r in rects:
-        # 找和矩形相交的 word
-        hit = False
-        for w in words:
-            wx0, wy0, wx1, wy1, wtext = w[:5]
-            wrect = fitz.Rect(wx0, wy0, wx1, wy1)
-            if not r.intersects(wrect):
-                continue
-            if ignore_case:
-                if wtext.casefold() == kw.casefold():
-                    hit = True
-                    break
-            else:
-                if wtext == kw:
-                    hit = True
-                    break
-        if hit:
-            out.append(r)
-    return out
-
-def collect_redaction_rects(page: fitz.Page, keywords, ignore_case: bool, whole_word: bool):
-    """依關鍵字回傳要遮罩的矩形陣列"""
-    all_rects = []
-    for kw in keywords:
-        rects = _collect_rects_basic(page, kw, ignore_case)
-        if whole_word:
-            rects = _filter_whole_word(page, rects, kw, ignore_case)
-        all_rects.extend(rects)
-    # 最終再去重
-    uniq = []
-    seen = set()
-    for r in all_rects:
-        key = (round(r.x0,1), round(r.y0,1), round(r.x1,1), round(r.y1,1))
-        if key not in seen:
-            seen.add(key)
-            uniq.append(r)
-    return uniq
-
-def redact_pdf(input_bytes: bytes, keywords, ignore_case=True, whole_word=False) -> bytes:
-    """實際寫入紅色遮罩並輸出 PDF bytes"""
-    doc = fitz.open(stream=input_bytes, filetype="pdf")
-    try:
-        for page in doc:
-            rects = collect_redaction_rects(page, keywords, ignore_case, whole_word)
-            for r in rects:
-                page.add_redact_annot(r, fill=(0, 0, 0))
-            page.apply_redactions()
-        out = io.BytesIO()
-        doc.save(out)
-        return out.getvalue()
-    finally:
-        doc.close()
-
-def preview_first_page(input_bytes: bytes, keywords, ignore_case=True, whole_word=False) -> Image.Image:
-    """只渲染第 1 頁，畫出將被遮罩的紅框（不改原檔）"""
-    doc = fitz.open(stream=input_bytes, filetype="pdf")
-    try:
-        if len(doc) == 0:
-            raise RuntimeError("PDF 無頁面")
-        page = doc.load_page(0)
-        # 渲染
-        pix = page.get_pixmap(alpha=False)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        # 收集矩形並畫紅框
-        rects = collect_redaction_rects(page, keywords, ignore_case, whole_word)
-        draw = ImageDraw.Draw(img, "RGBA")
-        for r in rects:
-            draw.rectangle([r.x0, r.y0, r.x1, r.y1], outline=(255, 0, 0, 255), width=3)
-            draw.rectangle([r.x0, r.y0, r.x1, r.y1], fill=(255, 0, 0, 50))
-        return img
-    finally:
-        doc.close()
+import os, tempfile
+
+from redact_core import (normalize_keywords, normalize_patterns, get_pattern_set, redact_pdf,
+                         RedactStats, BUILTIN_PATTERNS)
+from redact_preview import PreviewCache, THUMB_ZOOM
+from redact_batch import redact_batch, redact_pdf_sharded, output_name
+from batch_util import default_workers, content_key
+
+# 批次遮罩時 UI 程序的記憶體只與平行數有關，但 st.download_button 會把整個 ZIP 讀進 Streamlit 程序
+# （並留在 media 快取直到下次 rerun），下載這一步與 ZIP 大小成正比；超過此上限就不提供網頁下載
+BATCH_ZIP_MAX_MB = 512
 
 # ================== Streamlit UI ==================
 st.set_page_config(page_title="PDF 關鍵字遮罩工具", layout="centered")
@@ -150,42 +35,132 @@ with kw_col2:
     if "keywords_input" in st.session_state:
         keywords_input = st.session_state["keywords_input"]
 
+# 樣式區（身分證、電話、E-mail 等不必逐一列出）
+with st.expander("樣式遮罩（身分證字號、電話、E-mail、自訂正規表示式）", expanded=False):
+    builtin_ids = st.multiselect(
+        "內建樣式", list(BUILTIN_PATTERNS.keys()),
+        format_func=lambda k: BUILTIN_PATTERNS[k][0],
+    )
+    patterns_input = st.text_area("自訂正規表示式（每行一個）", placeholder=r"PRD-\d{6}", height=80)
+patterns = normalize_patterns(patterns_input, builtin_ids)
+try:
+    get_pattern_set(patterns, True)
+except ValueError as e:
+    st.error(str(e))
+    patterns = []
+
 ignore_case = st.checkbox("忽略大小寫（建議勾選）", value=True,
-                          help="PyMuPDF 沒有原生 ignore-case，本工具會用多種大小寫變體近似搜尋。")
-whole_word = st.checkbox("整字匹配（僅針對單一詞）", value=False,
-                         help="只對不含空白的單一字詞做整字比對；含空白的片語則忽略此設定。")
+                          help="以 casefold 做完整的不分大小寫比對（例如 straße 與 STRASSE 視為相同）。")
+whole_word = st.checkbox("整字匹配", value=False,
+                         help="命中範圍前後須為詞界（空白、標點或中日韓文字）；片語也適用。樣式遮罩不受此設定影響。")
+
+batch_workers = st.slider("多檔平行處理數", 1, max(2, os.cpu_count() or 1), default_workers(),
+                          help="多檔上傳時同時處理的檔案數；單一大檔分段處理時則為同時處理的分段數。")
+with st.expander("大型檔案（單檔）分段平行處理", expanded=False):
+    use_shards = st.checkbox("啟用分段平行遮罩", value=False,
+                             help="把頁面切成多段交給多個處理程序，完成後合併；書籤、連結與 metadata 會保留。")
+    shard_pages = st.number_input("每段頁數", min_value=10, max_value=5000, value=200, step=10)
 
 # 預覽
-st.subheader("🔍 預覽第 1 頁（紅框為將遮罩區域，僅示意不改原檔）")
-if uploaded_files and keywords_input.strip():
+@st.cache_resource
+def get_preview_cache() -> PreviewCache:
+    """跨 rerun 共用的預覽快取（已渲染頁面與每頁文字索引）"""
+    return PreviewCache()
+
+def _content_key(f) -> str:
+    """以內容雜湊為鍵；同一個上傳檔只算一次雜湊"""
+    keys = st.session_state.setdefault("preview_keys", {})
+    fid = getattr(f, "file_id", None) or f.name
+    if fid not in keys:
+        keys[fid] = content_key(f.getvalue())
+    return keys[fid]
+
+st.subheader("🔍 預覽（紅框為將遮罩區域，僅示意不改原檔）")
+if uploaded_files and (keywords_input.strip() or patterns):
     keywords = normalize_keywords(keywords_input)
+    cache = get_preview_cache()
     try:
+        names = [f.name for f in uploaded_files]
+        fi = st.selectbox("預覽檔案", range(len(names)), format_func=lambda i: names[i]) if len(names) > 1 else 0
+        pf = uploaded_files[fi]
         # 重要：getvalue()，不要用 read()
-        img = preview_first_page(uploaded_files[0].getvalue(), keywords, ignore_case, whole_word)
+        data = pf.getvalue()
+        key = _content_key(pf)
+        n_pages = cache.page_count(key, data)
+        if n_pages == 0:
+            raise RuntimeError("PDF 無頁面")
+        pno = st.number_input(f"頁碼（共 {n_pages} 頁）", min_value=1, max_value=n_pages, value=1, step=1) - 1
+        img = cache.overlay(key, data, pno, keywords, ignore_case, whole_word, patterns)
         st.image(img, use_column_width=True)
+
+        if st.checkbox("顯示附近頁面縮圖", value=False):
+            start = max(0, min(pno - 4, n_pages - 8))
+            cols = st.columns(4)
+            for j, p in enumerate(range(start, min(start + 8, n_pages))):
+                thumb = cache.overlay(key, data, p, keywords, ignore_case, whole_word, patterns, zoom=THUMB_ZOOM)
+                with cols[j % 4]:
+                    st.image(thumb, caption=f"第 {p + 1} 頁", use_column_width=True)
     except Exception as e:
         st.error(f"預覽失敗：{e}")
 else:
-    st.info("請先上傳至少一個 PDF，並輸入至少一個關鍵字。")
+    st.info("請先上傳至少一個 PDF，並輸入至少一個關鍵字或選擇樣式。")
 
 # 執行
 if st.button("🚀 執行遮罩並下載"):
-    if not (uploaded_files and keywords_input.strip()):
-        st.warning("請先上傳檔案並輸入關鍵字")
+    if not (uploaded_files and (keywords_input.strip() or patterns)):
+        st.warning("請先上傳檔案並輸入關鍵字或選擇樣式")
     else:
         keywords = normalize_keywords(keywords_input)
 
         if len(uploaded_files) == 1:
             f = uploaded_files[0]
-            out_bytes = redact_pdf(f.getvalue(), keywords, ignore_case, whole_word)
-            out_name = f"{os.path.splitext(f.name)[0]}_redacted.pdf"
+            stats = RedactStats()
+            if use_shards:
+                with st.spinner("分段平行遮罩中..."):
+                    out_bytes = redact_pdf_sharded(f.getvalue(), keywords, ignore_case, whole_word,
+                                                   shard_pages=int(shard_pages), max_workers=batch_workers,
+                                                   stats=stats, patterns=patterns)
+            else:
+                out_bytes = redact_pdf(f.getvalue(), keywords, ignore_case, whole_word, stats, patterns=patterns)
+            st.caption(stats.summary())
+            out_name = output_name(f.name)
             st.download_button("⬇️ 下載處理後 PDF", data=out_bytes, file_name=out_name, mime="application/pdf")
         else:
-            buf = io.BytesIO()
-            with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_DEFLATED) as zf:
-                for f in uploaded_files:
-                    out_bytes = redact_pdf(f.getvalue(), keywords, ignore_case, whole_word)
-                    out_name = f"{os.path.splitext(f.name)[0]}_redacted.pdf"
-                    zf.writestr(out_name, out_bytes)
-            buf.seek(0)
-            st.download_button("⬇️ 下載全部（ZIP）", data=buf.getvalue(), file_name="redacted_pdfs.zip", mime="application/zip")
+            # 上一次的批次結果不再需要，先清掉磁碟上的 ZIP
+            old_zip = st.session_state.pop("batch_zip_path", None)
+            if old_zip and os.path.exists(old_zip):
+                os.remove(old_zip)
+            fd, zip_path = tempfile.mkstemp(prefix="redacted_", suffix=".zip")
+            os.close(fd)
+            st.session_state["batch_zip_path"] = zip_path
+
+            bar = st.progress(0, text="批次遮罩中...")
+            def _on_progress(done, total, item):
+                mark = "✅" if item.ok else "❌"
+                bar.progress(int(100 * done / max(1, total)), text=f"{mark} {done}/{total}：{item.name}")
+
+            results = redact_batch(
+                [(f.name, f) for f in uploaded_files], zip_path, keywords,
+                ignore_case, whole_word, max_workers=batch_workers, on_progress=_on_progress,
+                patterns=patterns,
+            )
+            failed = [r for r in results if not r.ok]
+            if failed:
+                st.error(f"{len(failed)} 個檔案處理失敗：")
+                for r in failed:
+                    st.write(f"- {r.name}：{r.error}")
+            skipped = sum(r.stats.pages_skipped for r in results if r.stats)
+            pages = sum(r.stats.pages for r in results if r.stats)
+            st.success(f"完成 {len(results) - len(failed)}/{len(results)} 個檔案（共 {pages} 頁，其中 {skipped} 頁無命中而略過）")
+            zip_mb = os.path.getsize(zip_path) / (1024 * 1024)
+            if zip_mb > BATCH_ZIP_MAX_MB:
+                st.error(f"ZIP 共 {zip_mb:.0f} MB，超過網頁下載上限 {BATCH_ZIP_MAX_MB} MB"
+                         "（下載時整個檔案會載入伺服器記憶體）。請分批上傳，"
+                         "或改用命令列版 redact_cli.py 直接輸出到資料夾。")
+                os.remove(zip_path)
+                st.session_state.pop("batch_zip_path", None)
+            else:
+                st.caption(f"ZIP 共 {zip_mb:.1f} MB；下載時會整個載入伺服器記憶體（上限 {BATCH_ZIP_MAX_MB} MB）。")
+                with open(zip_path, "rb") as zf:
+                    st.download_button("⬇️ 下載全部（ZIP）", data=zf, file_name="redacted_pdfs.zip",
+                                       mime="application/zip")
@@ -4,287 +4,33 @@ Streamlit｜PDF 差異比對（整合單檔報告版，簡化 UI + 可收合進
 """
 
 import streamlit as st
-import io, os, base64, datetime, difflib, unicodedata, gc, traceback
-from dataclasses import dataclass
-from typing import List, Tuple
-
-import fitz  # PyMuPDF
-from PIL import Image, ImageChops, ImageDraw, ImageFilter
-import numpy as np
-
-
-# ---------------------- 設定 ----------------------
-@dataclass
-class DiffSettings:
-    dpi: int = 220
-    header_ignore_ratio: float = 0.05
-    footer_ignore_ratio: float = 0.05
-    pixel_threshold: int = 18
-    bbox_min_area: int = 250
-    text_similarity_warn: float = 0.985
-    max_image_side: int = 3000
-    blur_radius: int = 1
-    merge_padding: int = 10
-
-
-DEFAULT = DiffSettings()
-
-# 三種預設模式（使用者不懂就用這些，不必展開進階設定）
-PRESETS = {
-    "標準（建議）": DiffSettings(
-        dpi=220, pixel_threshold=18, bbox_min_area=250,
-        header_ignore_ratio=0.05, footer_ignore_ratio=0.05,
-        blur_radius=1, merge_padding=10
-    ),
-    "高敏感（抓更多差異）": DiffSettings(
-        dpi=240, pixel_threshold=12, bbox_min_area=150,
-        header_ignore_ratio=0.04, footer_ignore_ratio=0.04,
-        blur_radius=1, merge_padding=8
-    ),
-    "低敏感（只看明顯差異）": DiffSettings(
-        dpi=180, pixel_threshold=28, bbox_min_area=400,
-        header_ignore_ratio=0.06, footer_ignore_ratio=0.06,
-        blur_radius=0, merge_padding=12
-    ),
-}
-
-
-# ---------------------- 工具函式 ----------------------
-def normalize_text(text: str) -> str:
-    if not text:
-        return ""
-    try:
-        text = unicodedata.normalize("NFKC", text)
-        for ch in ["\u00ad", "\ufeff", "\u200b", "\u200c", "\u200d", "\u2060"]:
-            text = text.replace(ch, "")
-        lines = []
-        for line in text.replace("\r\n","\n").replace("\r","\n").split("\n"):
-            lines.append(" ".join(line.split()))
-        return "\n".join(lines).strip()
-    except Exception:
-        return text.strip()
-
-
-def extract_texts(doc: fitz.Document, head_ratio: float, foot_ratio: float) -> List[str]:
-    texts = []
-    for i in range(len(doc)):
-        try:
-            page = doc.load_page(i)
-            ph = page.rect.height
-            top_cut = head_ratio * ph
-            bottom_cut = (1.0 - foot_ratio) * ph
-            blocks = page.get_text("blocks")
-            parts = []
-            for b in blocks:
-                if len(b) < 5:
-                    continue
-                x0,y0,x1,y1,txt = b[:5]
-                if y1 <= top_cut or y0 >= bottom_cut:
-                    continue
-                if txt and txt.strip():
-                    parts.append(txt)
-            ptxt = "\n".join(parts) if parts else page.get_text("text")
-            texts.append(normalize_text(ptxt))
-        except Exception as e:
-            print(f"[warn] 第 {i+1} 頁取文失敗：{e}")
-            texts.append("")
-    return texts
-
-
-def render_page_image(page: fitz.Page, dpi: int, max_side: int, blur: int=0) -> Image.Image:
-    try:
-        zoom = dpi / 72.0
-        mat = fitz.Matrix(zoom, zoom)
-        est_w = int(page.rect.width * zoom)
-        est_h = int(page.rect.height * zoom)
-        if max(est_w, est_h) > max_side:
-            scale = max_side / max(est_w, est_h)
-            mat = fitz.Matrix(zoom*scale, zoom*scale)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        if blur > 0:
-            img = img.filter(ImageFilter.GaussianBlur(blur))
-        return img
-    except Exception as e:
-        print(f"[warn] 渲染頁面失敗：{e}")
-        return Image.new("RGB", (800, 1000), (255,255,255))
-
-
-def pad_to_same(img1: Image.Image, img2: Image.Image) -> Tuple[Image.Image, Image.Image]:
-    w = max(img1.width, img2.width); h = max(img1.height, img2.height)
-    def pad(i):
-        if i.width==w and i.height==h: return i
-        c = Image.new("RGB",(w,h),(255,255,255)); c.paste(i,(0,0)); return c
-    return pad(img1), pad(img2)
-
-
-def find_components(mask_array: np.ndarray, min_area: int) -> List[Tuple[int,int,int,int]]:
-    h,w = mask_array.shape
-    visited = np.zeros_like(mask_array, dtype=bool)
-    comps = []
-    def flood(y0,x0):
-        if y0<0 or y0>=h or x0<0 or x0>=w: return []
-        if visited[y0,x0] or mask_array[y0,x0]==0: return []
-        stack=[(y0,x0)]; pts=[]
-        while stack:
-            y,x = stack.pop()
-            if y<0 or y>=h or x<0 or x>=w: continue
-            if visited[y,x] or mask_array[y,x]==0: continue
-            visited[y,x]=True; pts.append((x,y))
-            for dy in (-1,0,1):
-                for dx in (-1,0,1):
-                    if dy==0 and dx==0: continue
-                    stack.append((y+dy,x+dx))
-        return pts
-    step=2
-    for y in range(0,h,step):
-        for x in range(0,w,step):
-            if mask_array[y,x]>0 and not visited[y,x]:
-                pts = flood(y,x)
-                if len(pts) >= max(1, min_area//4):
-                    xs=[p[0] for p in pts]; ys=[p[1] for p in pts]
-                    comps.append((min(xs),min(ys),max(xs),max(ys)))
-    return comps
-
-
-def merge_boxes(boxes: List[Tuple[int,int,int,int]], pad: int) -> List[Tuple[int,int,int,int]]:
-    if not boxes: return []
-    out=[]
-    def close(a,b):
-        ax0,ay0,ax1,ay1=a; bx0,by0,bx1,by1=b
-        return not (ax1+pad<bx0 or bx1+pad<ax0 or ay1+pad<by0 or by1+pad<ay0)
-    for b in boxes:
-        merged=False
-        for i,ex in enumerate(out):
-            if close(b,ex):
-                x0=min(b[0],ex[0]); y0=min(b[1],ex[1])
-                x1=max(b[2],ex[2]); y1=max(b[3],ex[3])
-                out[i]=(x0,y0,x1,y1); merged=True; break
-        if not merged: out.append(b)
-    return out
-
-
-def compute_overlay(img_a: Image.Image, img_b: Image.Image, thr: int, min_area: int, merge_pad_px: int) -> Tuple[Image.Image, List[Tuple[int,int,int,int]]]:
-    i1,i2 = pad_to_same(img_a,img_b)
-    diff = ImageChops.difference(i1,i2).convert("L")
-    mask = diff.point(lambda p: 255 if p>=thr else 0)
-    comps = find_components(np.array(mask), min_area)
-    boxes = [b for b in merge_boxes(comps, merge_pad_px) if (b[2]-b[0])*(b[3]-b[1])>=min_area]
-    ov = i2.convert("RGBA"); dr = ImageDraw.Draw(ov,"RGBA")
-    for (x0,y0,x1,y1) in boxes:
-        dr.rectangle([x0,y0,x1,y1], outline=(255,0,0,255), width=2)
-        dr.rectangle([x0,y0,x1,y1], fill=(255,0,0,40))
-    return ov, boxes
-
-
-def similarity(a: str, b: str) -> float:
-    if not a and not b: return 1.0
-    if not a or not b: return 0.0
-    return difflib.SequenceMatcher(None, a, b).ratio()
-
-
-def pil_to_datauri(img: Image.Image) -> str:
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-    return f"data:image/png;base64,{b64}"
-
-
-def unified_diff_html(a_text: str, b_text: str, from_label: str, to_label: str) -> str:
-    a_lines = a_text.splitlines(keepends=True)
-    b_lines = b_text.splitlines(keepends=True)
-    diff = difflib.unified_diff(a_lines, b_lines, fromfile=from_label, tofile=to_label, lineterm="")
-    return "<pre style='background:#fafafa;border:1px solid #eee;padding:12px;white-space:pre-wrap;overflow:auto;'>" + \
-           "".join(diff).replace("&","&amp;").replace("<","&lt;").replace(">","&gt;") + \
-           "</pre>"
-
-
-def build_html_report(name_a: str, name_b: str, per_page, overall_sim: float, warn_threshold: float) -> bytes:
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    rows = []
-    low_pages = 0
-    total_boxes = 0
-    for r in per_page:
-        total_boxes += r["boxes_count"]
-        if r["sim"] < warn_threshold:
-            low_pages += 1
-        warn = " ⚠️" if r["sim"] < warn_threshold else ""
-        rows.append(f"<tr><td style='text-align:right'>{r['idx']}</td>"
-                    f"<td style='text-align:right'>{r['sim']:.4f}{warn}</td>"
-                    f"<td style='text-align:right'>{r['boxes_count']}</td></tr>")
-
-    table_html = (
-        "<table style='border-collapse:collapse;width:100%'>"
-        "<thead><tr>"
-        "<th style='border-bottom:1px solid #ddd;text-align:right;width:80px'>頁碼</th>"
-        "<th style='border-bottom:1px solid #ddd;text-align:right;width:160px'>文字相似度</th>"
-        "<th style='border-bottom:1px solid #ddd;text-align:right;width:160px'>差異框數</th>"
-        "</tr></thead><tbody>"
-        + "".join(rows) + "</tbody></table>"
-    )
+import os, shutil, tempfile, traceback
+from contextlib import nullcontext
 
-    page_sections = []
-    for r in per_page:
-        page_sections.append(
-            f"""
-<section style="margin:24px 0">
-  <h3 style="margin:6px 0">第 {r['idx']} 頁</h3>
-  <div style="color:#555;margin:4px 0">文字相似度：{r['sim']:.4f}{' ⚠️' if r['sim']<warn_threshold else ''}、差異框數：{r['boxes_count']}</div>
-  <div style="margin:10px 0">
-    <img src="{r['overlay_datauri']}" alt="差異疊圖 p{r['idx']}" style="max-width:100%;border:1px solid #eee;border-radius:6px"/>
-  </div>
-  <details style="background:#fcfcfc;border:1px solid #eee;border-radius:6px;padding:8px">
-    <summary style="cursor:pointer;font-weight:600">文字 unified diff（A vs B）</summary>
-    {r['text_diff_html']}
-  </details>
-</section>
-"""
-        )
-
-    html = f"""
-<!doctype html>
-<html lang="zh-Hant">
-<head>
-<meta charset="utf-8"/>
-<title>PDF 差異比對報告 - {name_a} vs {name_b}</title>
-<meta name="viewport" content="width=device-width, initial-scale=1"/>
-<style>
-body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Noto Sans TC", Arial, "PingFang TC", "Microsoft JhengHei", sans-serif; line-height:1.6; color:#111; margin:0; }}
-.container {{ max-width: 1080px; margin: 0 auto; padding: 24px; }}
-h1,h2,h3 {{ margin: 8px 0; }}
-.small {{ color:#666; font-size: 0.95rem; }}
-kbd {{ background:#eee; border-radius:4px; padding:1px 6px; }}
-</style>
-</head>
-<body>
-<div class="container">
-  <h1>PDF 差異比對報告</h1>
-  <p class="small">檔案 A：<kbd>{name_a}</kbd>；檔案 B：<kbd>{name_b}</kbd></p>
-  <p class="small">時間：{now}</p>
-
-  <h2>整體分析</h2>
-  <ul>
-    <li>整體文字相似度：<strong>{overall_sim:.4f}</strong> {"⚠️ 可能有重大變更" if overall_sim < 0.985 else "✅ 高度相似"}</li>
-    <li>低相似度頁面數：<strong>{sum(1 for r in per_page if r['sim'] < 0.985)}/{len(per_page)}</strong></li>
-    <li>總差異框數：<strong>{sum(r['boxes_count'] for r in per_page)}</strong></li>
-  </ul>
-
-  <h2>逐頁摘要</h2>
-  {table_html}
-
-  <h2>逐頁詳情</h2>
-  {"".join(page_sections)}
-</div>
-</body>
-</html>
-"""
-    return html.encode("utf-8")
+from diff_core import DiffSettings, DEFAULT, PRESETS, compare_pages_vector
+from diff_cache import DiffCache
+from diff_batch import diff_chain, chain_jobs
+from diff_store import RenderStore
+from diff_stream import diff_stream, spill_upload
+from diff_profile import Profiler
+from diff_text import document_similarity
+from diff_parallel import diff_pages_parallel
+from batch_util import default_workers, content_key
+from diff_report import ReportWriter, report_output_name
 
 
 # ---------------------- Streamlit UI ----------------------
 st.set_page_config(page_title="PDF 差異比對（整合報告）", layout="wide")
 st.title("📘 PDF 差異比對工具（簡化 UI）")
 
+STORE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 多版本磁碟快取上限，每次比對後修剪
+
+compare_kind = st.radio(
+    "比對對象", ["pair", "chain"], horizontal=True,
+    format_func=lambda k: {"pair": "兩份檔案（A / B）", "chain": "多版本（v1 → v2 → …）"}[k],
+    help="多版本模式會依序比對相鄰版本（可另加第一版 vs 最後一版），每個版本的每一頁只渲染一次。"
+)
+
 # 1) 先選擇模式（一般人直接用預設，不需展開進階設定）
 preset_name = st.selectbox(
     "參數模式",
@@ -293,6 +39,11 @@ preset_name = st.selectbox(
     help="一般建議用「標準（建議）」。若希望抓到更多細微差異，選「高敏感」。若只想看到明顯變更，選「低敏感」。"
 )
 preset = PRESETS[preset_name]
+mode = st.radio(
+    "比對方式", ["raster", "vector"], horizontal=True,
+    format_func=lambda m: {"raster": "點陣（看得到所有視覺變化）", "vector": "向量文字（快，適合原生 PDF）"}[m],
+    help="向量文字模式直接比對每個字與座標，不渲染整頁影像；圖片或向量圖形有變更的頁面會自動改用點陣比對。掃描檔請用點陣。"
+)
 
 # 2) 需要時才展開進階參數
 with st.expander("進階參數（可選，懂的人再調整）", expanded=False):
@@ -327,6 +78,35 @@ with st.expander("進階參數（可選，懂的人再調整）", expanded=False
         "框合併 Padding", 0, 30, preset.merge_padding, 1,
         help="差異框之間若距離在此值以內會合併成較大的區塊，可減少過度分裂的小框。"
     )
+    grayscale = st.checkbox(
+        "灰階比對（較省記憶體）", value=preset.grayscale,
+        help="直接渲染灰階影像並以 NumPy 比對，記憶體約為彩色比對的 1/3。只有顏色改變、亮度不變的差異可能偵測不到。"
+    )
+    coarse_to_fine = st.checkbox(
+        "由粗到細（只細看有差異的區塊）", value=preset.coarse_dpi > 0,
+        help="先以低解析度比對整頁，只把有差異的區塊以完整 DPI 重新渲染。改動少的頁面會快很多，差異框精度不變；疊圖改以 150 DPI 顯示。"
+    )
+    align = st.checkbox(
+        "頁面對齊（偵測新增／刪除頁）", value=True,
+        help="依文字內容對齊兩份文件的頁序。B 多插入一頁時，後面的頁面仍會和正確的對應頁比對，不會整份錯位。"
+    )
+    workers = st.slider(
+        "平行處理數", 1, max(2, os.cpu_count() or 2), default_workers(), 1,
+        help="同時比對的頁面數（每個 worker 一個程序）。頁數多時可大幅縮短時間；設為 1 則逐頁處理。"
+    )
+    memory_budget_mb = st.number_input(
+        "記憶體上限（MB，0 = 不限制）", min_value=0, max_value=65536, value=0, step=256,
+        help="處理數千頁的大檔時設定：改用串流模式（上傳檔寫成暫存檔、文字逐頁抽取、結果寫出後即丟棄），"
+             "並依上限調整平行數與渲染解析度，記憶體用量不隨頁數成長。串流模式不提供逐頁預覽。"
+    )
+    profile = st.checkbox(
+        "效能分析（逐階段計時）", value=False,
+        help="記錄每頁渲染、遮罩、標記、合併、編碼等各階段耗時，完成後顯示最慢的階段與頁面，報告附上效能附錄，並可下載 JSON 與 Chrome trace。"
+    )
+    profile_memory = st.checkbox(
+        "效能分析含峰值記憶體（較慢）", value=False,
+        help="以 tracemalloc 量測各階段 Python／NumPy 的峰值記憶體；MuPDF 內部配置不計入，開啟後處理會變慢。"
+    )
 # 若沒有展開，以上滑桿的預設值就來自所選模式；接著把值帶進變數（確保下方統一用）
 dpi = locals().get("dpi", preset.dpi)
 pixel_threshold = locals().get("pixel_threshold", preset.pixel_threshold)
@@ -335,102 +115,266 @@ header_ignore_ratio = locals().get("header_ignore_ratio", preset.header_ignore_r
 footer_ignore_ratio = locals().get("footer_ignore_ratio", preset.footer_ignore_ratio)
 blur_radius = locals().get("blur_radius", preset.blur_radius)
 merge_padding = locals().get("merge_padding", preset.merge_padding)
+grayscale = locals().get("grayscale", preset.grayscale)
+coarse_to_fine = locals().get("coarse_to_fine", preset.coarse_dpi > 0)
+align = locals().get("align", True)
+workers = locals().get("workers", default_workers())
+memory_budget_mb = locals().get("memory_budget_mb", 0)
+profile = locals().get("profile", False)
+profile_memory = locals().get("profile_memory", False)
+settings = DiffSettings(
+    dpi=dpi, header_ignore_ratio=header_ignore_ratio, footer_ignore_ratio=footer_ignore_ratio,
+    pixel_threshold=pixel_threshold, bbox_min_area=bbox_min_area,
+    text_similarity_warn=preset.text_similarity_warn, max_image_side=DEFAULT.max_image_side,
+    blur_radius=blur_radius, merge_padding=merge_padding, grayscale=grayscale,
+    coarse_dpi=72 if coarse_to_fine else 0, mode=mode,
+    profile=profile or profile_memory, profile_memory=profile_memory,
+    memory_budget_mb=int(memory_budget_mb),
+)
 
-# 上傳檔案
-col_l, col_r = st.columns(2)
-with col_l:
-    pdf_a = st.file_uploader("上傳 PDF A（原始檔）", type=["pdf"], key="a")
-with col_r:
-    pdf_b = st.file_uploader("上傳 PDF B（比對檔）", type=["pdf"], key="b")
-
-# ---------- 預覽第 1 頁 ----------
-st.subheader("🔍 第 1 頁預覽")
-if pdf_a and pdf_b:
-    try:
-        a_bytes = pdf_a.read(); b_bytes = pdf_b.read()
-        da = fitz.open(stream=a_bytes, filetype="pdf")
-        db = fitz.open(stream=b_bytes, filetype="pdf")
-        if len(da)==0 or len(db)==0:
-            st.warning("無法讀取其中一份 PDF。")
-        else:
-            pa = da.load_page(0); pb = db.load_page(0)
-            img_a = render_page_image(pa, dpi, DEFAULT.max_image_side, blur_radius)
-            img_b = render_page_image(pb, dpi, DEFAULT.max_image_side, blur_radius)
-            overlay, _ = compute_overlay(img_a, img_b, pixel_threshold, bbox_min_area, merge_padding)
-
-            c1,c2,c3 = st.columns(3)
-            with c1: st.image(img_a, caption="A 第 1 頁", use_column_width=True)
-            with c2: st.image(img_b, caption="B 第 1 頁", use_column_width=True)
-            with c3: st.image(overlay, caption="差異疊圖（紅框熱區）", use_column_width=True)
-        da.close(); db.close()
-    except Exception as e:
-        traceback.print_exc()
-        st.error(f"預覽失敗：{e}")
-else:
-    st.info("請先上傳 A 與 B。")
-
-# ---------- 產出整合報告 ----------
-st.subheader("🧾 產出整合報告（HTML）")
-run = st.button("🚀 開始處理並下載報告")
-
-if run:
-    if not (pdf_a and pdf_b):
-        st.warning("請先上傳 A 與 B。")
-    else:
+# ---------- 快取（跨 rerun 共用） ----------
+@st.cache_resource
+def get_diff_cache() -> DiffCache:
+    """跨 rerun 共用的快取（已開啟文件、逐頁文字、指紋、對齊結果與渲染影像）；超出記憶體上限的影像暫存到磁碟"""
+    return DiffCache(spill_dir=os.path.join(tempfile.gettempdir(), "pdf_diff_cache"))
+
+@st.cache_resource
+def get_render_store() -> RenderStore:
+    """多版本比對用的磁碟快取（以檔案內容雜湊為鍵；同一版本在不同組比對中只渲染一次）"""
+    return RenderStore(os.path.join(tempfile.gettempdir(), "pdf_diff_store"))
+
+def _content_key(f) -> str:
+    """以內容雜湊為鍵；同一個上傳檔只算一次雜湊"""
+    keys = st.session_state.setdefault("diff_keys", {})
+    fid = getattr(f, "file_id", None) or f.name
+    if fid not in keys:
+        keys[fid] = content_key(f.getvalue())
+    return keys[fid]
+
+if compare_kind == "pair":
+    # 上傳檔案
+    col_l, col_r = st.columns(2)
+    with col_l:
+        pdf_a = st.file_uploader("上傳 PDF A（原始檔）", type=["pdf"], key="a")
+    with col_r:
+        pdf_b = st.file_uploader("上傳 PDF B（比對檔）", type=["pdf"], key="b")
+
+    # ---------- 預覽 ----------
+    st.subheader("🔍 逐頁預覽")
+    if pdf_a and pdf_b and settings.memory_budget_mb > 0:
+        st.info("已設定記憶體上限（串流模式）：預覽需要把整份文件載入記憶體，因此不提供；請直接產出報告。")
+    elif pdf_a and pdf_b:
+        cache = get_diff_cache()
         try:
+            # 重要：getvalue()，不要用 read()
             a_bytes = pdf_a.getvalue(); b_bytes = pdf_b.getvalue()
-            name_a = os.path.basename(pdf_a.name) if getattr(pdf_a,"name",None) else "A.pdf"
-            name_b = os.path.basename(pdf_b.name) if getattr(pdf_b,"name",None) else "B.pdf"
-
-            doc_a = fitz.open(stream=a_bytes, filetype="pdf")
-            doc_b = fitz.open(stream=b_bytes, filetype="pdf")
-
-            with st.spinner("抽取文字..."):
-                texts_a = extract_texts(doc_a, header_ignore_ratio, footer_ignore_ratio)
-                texts_b = extract_texts(doc_b, header_ignore_ratio, footer_ignore_ratio)
-
-            n_pages = max(len(doc_a), len(doc_b))
-            per_page = []
-            st.progress(0, text="處理頁面中...")
-
-            for i in range(n_pages):
-                page_a = doc_a.load_page(i) if i < len(doc_a) else None
-                page_b = doc_b.load_page(i) if i < len(doc_b) else None
-
-                ta = texts_a[i] if i < len(texts_a) else ""
-                tb = texts_b[i] if i < len(texts_b) else ""
-                sim = similarity(ta, tb)
-                text_diff_html = unified_diff_html(ta, tb, f"A:page{i+1}", f"B:page{i+1}")
-
-                img_a = render_page_image(page_a, dpi, DEFAULT.max_image_side, blur_radius) if page_a else Image.new("RGB",(800,1000),(255,255,255))
-                img_b = render_page_image(page_b, dpi, DEFAULT.max_image_side, blur_radius) if page_b else Image.new("RGB",(800,1000),(255,255,255))
-                overlay, boxes = compute_overlay(img_a, img_b, pixel_threshold, bbox_min_area, merge_padding)
-
-                per_page.append({
-                    "idx": i+1,
-                    "sim": sim,
-                    "boxes_count": len(boxes),
-                    "overlay_datauri": pil_to_datauri(overlay),
-                    "text_diff_html": text_diff_html
-                })
+            key_a, key_b = _content_key(pdf_a), _content_key(pdf_b)
+            if cache.page_count(key_a, a_bytes) == 0 or cache.page_count(key_b, b_bytes) == 0:
+                st.warning("無法讀取其中一份 PDF。")
+            else:
+                pairs = cache.pairs(key_a, a_bytes, key_b, b_bytes, header_ignore_ratio, footer_ignore_ratio, align)
+                def _pair_label(k):
+                    ia, ib = pairs[k]
+                    if ia is None: return f"B 第 {ib+1} 頁（新增）"
+                    if ib is None: return f"A 第 {ia+1} 頁（刪除）"
+                    return f"第 {ia+1} 頁" if ia == ib else f"A 第 {ia+1} 頁 ↔ B 第 {ib+1} 頁"
+                k = st.selectbox(f"預覽頁面（共 {len(pairs)} 組）", range(len(pairs)), format_func=_pair_label)
+                ia, ib = pairs[k]
+                vec = None
+                if mode == "vector" and ia is not None and ib is not None:
+                    vec = compare_pages_vector(cache.page(key_a, a_bytes, ia), cache.page(key_b, b_bytes, ib), settings)
+                if vec is not None:
+                    overlay, _ = vec
+                    if overlay is None:
+                        st.success("此頁文字與圖形皆相同。")
+                    else:
+                        st.image(overlay, caption="向量文字比對（左 A 紅：刪除；右 B 綠：新增）", use_column_width=True)
+                else:
+                    if mode == "vector" and ia is not None and ib is not None:
+                        st.caption("此頁的圖片或向量圖形有變更，改用點陣比對。")
+                    # 渲染結果由快取提供；只調整閾值、面積或 padding 時只重跑遮罩與合併
+                    img_a, img_b, overlay, _ = cache.compare(key_a, a_bytes, key_b, b_bytes, ia, ib, settings)
+
+                    c1,c2,c3 = st.columns(3)
+                    with c1: st.image(img_a, caption=f"A 第 {ia+1} 頁" if ia is not None else "A（無對應頁）", use_column_width=True)
+                    with c2: st.image(img_b, caption=f"B 第 {ib+1} 頁" if ib is not None else "B（無對應頁）", use_column_width=True)
+                    with c3: st.image(overlay, caption="差異疊圖（紅框熱區）", use_column_width=True)
+        except Exception as e:
+            traceback.print_exc()
+            st.error(f"預覽失敗：{e}")
+    else:
+        st.info("請先上傳 A 與 B。")
 
-                if (i+1) % 10 == 0:
-                    gc.collect()
-                st.progress(int(100*(i+1)/max(1,n_pages)), text=f"處理第 {i+1}/{n_pages} 頁")
+    # ---------- 產出整合報告 ----------
+    st.subheader("🧾 產出整合報告（HTML + 影像，ZIP）")
+    run = st.button("🚀 開始處理並下載報告")
 
-            overall_sim = similarity("\n".join(texts_a), "\n".join(texts_b))
-            html_bytes = build_html_report(name_a, name_b, per_page, overall_sim, DEFAULT.text_similarity_warn)
+    if run:
+        if not (pdf_a and pdf_b):
+            st.warning("請先上傳 A 與 B。")
+        else:
+            try:
+                name_a = os.path.basename(pdf_a.name) if getattr(pdf_a,"name",None) else "A.pdf"
+                name_b = os.path.basename(pdf_b.name) if getattr(pdf_b,"name",None) else "B.pdf"
+                stream = settings.memory_budget_mb > 0
+                stream_res = None
+
+                # 效能分析：主程序的抽字、指紋、對齊與報告寫出記在 prof；各頁的量測隨結果列從 worker 帶回
+                prof = Profiler(profile_memory) if settings.profile else None
+                with prof if prof is not None else nullcontext():
+                    progress = st.progress(0, text="處理頁面中...")
+
+                    # 上一次的報告不再需要，先清掉磁碟上的 ZIP
+                    old_zip = st.session_state.pop("report_zip_path", None)
+                    if old_zip and os.path.exists(old_zip):
+                        os.remove(old_zip)
+                    fd, zip_path = tempfile.mkstemp(prefix="diff_report_", suffix=".zip")
+                    os.close(fd)
+                    st.session_state["report_zip_path"] = zip_path
+                    writer = ReportWriter(zip_path, name_a, name_b, settings.text_similarity_warn)
+
+                    def on_progress(done, total, r):
+                        # 每頁結果一回來就寫進 ZIP，影像不留在記憶體
+                        if prof is not None:
+                            prof.add_row(r)
+                        writer.add(r)
+                        progress.progress(int(100*done/max(1,total)), text=f"已完成 {done}/{total} 頁")
+
+                    try:
+                        if stream:
+                            # 串流模式：上傳檔分塊寫成暫存檔後依路徑開檔，文字逐頁現抽，不經過預覽快取
+                            with tempfile.TemporaryDirectory(prefix="pdf_diff_upload_") as up:
+                                path_a = spill_upload(pdf_a, os.path.join(up, "a.pdf"))
+                                path_b = spill_upload(pdf_b, os.path.join(up, "b.pdf"))
+                                with st.spinner("逐頁掃描文字與指紋..."):
+                                    stream_res = diff_stream(path_a, path_b, settings, align, workers, on_progress)
+                            n_pages = len(stream_res.rows)
+                            overall_sim = stream_res.similarity
+                        else:
+                            # 重要：getvalue()，不要用 read()
+                            a_bytes = pdf_a.getvalue(); b_bytes = pdf_b.getvalue()
+                            # 文字、指紋與對齊結果取自快取：預覽時已算過的不再重算
+                            cache = get_diff_cache()
+                            key_a, key_b = _content_key(pdf_a), _content_key(pdf_b)
+                            with st.spinner("抽取文字..."):
+                                texts_a = cache.texts(key_a, a_bytes, header_ignore_ratio, footer_ignore_ratio)
+                                texts_b = cache.texts(key_b, b_bytes, header_ignore_ratio, footer_ignore_ratio)
+                            with st.spinner("計算頁面指紋..."):
+                                fps_a = cache.fingerprints(key_a, a_bytes, header_ignore_ratio, footer_ignore_ratio)
+                                fps_b = cache.fingerprints(key_b, b_bytes, header_ignore_ratio, footer_ignore_ratio)
+                            pairs = cache.pairs(key_a, a_bytes, key_b, b_bytes, header_ignore_ratio, footer_ignore_ratio, align)
+                            n_pages = len(pairs)
+                            per_page = diff_pages_parallel(a_bytes, b_bytes, texts_a, texts_b, fps_a, fps_b, settings,
+                                                           max_workers=workers, on_progress=on_progress, pairs=pairs)
+                            # 整體相似度由逐頁結果加權而得，不再對整份文字重跑一次比對
+                            overall_sim = document_similarity(texts_a, texts_b, pairs, [r["sim"] for r in per_page])
+                        writer.finish(overall_sim, prof.summary() if prof is not None else None)
+                    except Exception:
+                        writer.abort()
+                        st.session_state.pop("report_zip_path", None)
+                        raise
+                progress.progress(100, text=f"已完成 {n_pages}/{n_pages} 頁")
+
+                st.success("完成！以下可下載整合報告（解壓縮後開啟 report.html）：")
+                if stream_res is not None:
+                    plan = stream_res.plan
+                    st.caption(f"串流模式：平行 {plan.workers}、渲染長邊上限 {plan.max_image_side}px"
+                               f"（每頁估計 {plan.page_mb} MB）、主程序峰值 {stream_res.peak_rss_mb} MB、"
+                               f"釋放快取 {stream_res.releases} 次")
+                with open(zip_path, "rb") as zf:
+                    st.download_button("⬇️ 下載整合報告（ZIP）", data=zf, file_name=report_output_name(name_a, name_b),
+                                       mime="application/zip")
+
+                if prof is not None:
+                    st.subheader("⏱️ 效能分析")
+                    st.caption("各階段為所有頁面的合計；平行處理時各 worker 的時間重疊，合計可能大於總耗時。")
+                    totals = prof.stage_totals()
+                    st.dataframe([{"階段": k, "次數": v["count"], "合計 (s)": v["total_s"],
+                                   "平均 (ms)": round(v["mean_s"] * 1000, 2), "最大 (ms)": round(v["max_s"] * 1000, 2),
+                                   **({"峰值 (MB)": v["peak_mb"]} if profile_memory else {})}
+                                  for k, v in totals.items()], use_container_width=True)
+                    st.markdown("**最慢的頁**")
+                    st.dataframe([{"列序": p["page"], "耗時 (s)": p["total_s"],
+                                   "各階段": "、".join(f"{k} {v:.3f}s" for k, v in
+                                                     sorted(p["stages"].items(), key=lambda kv: -kv[1]))}
+                                  for p in prof.slowest_pages()], use_container_width=True)
+                    c1, c2 = st.columns(2)
+                    with c1:
+                        st.download_button("⬇️ 效能資料（JSON）", data=prof.to_json(), file_name="diff_profile.json",
+                                           mime="application/json")
+                    with c2:
+                        st.download_button("⬇️ Chrome trace", data=prof.chrome_trace(), file_name="diff_trace.json",
+                                           mime="application/json")
+
+            except Exception as e:
+                traceback.print_exc()
+                st.error(f"處理失敗：{e}")
 
-            out_name = f"diff_report_{os.path.splitext(name_a)[0]}_vs_{os.path.splitext(name_b)[0]}.html"
-            st.success("完成！以下可下載整合報告：")
-            st.download_button("⬇️ 下載整合報告（HTML）", data=html_bytes, file_name=out_name, mime="text/html")
+else:
+    # ---------- 多版本比對 ----------
+    st.subheader("📚 多版本比對（v1 → v2 → … → vN）")
+    revs = st.file_uploader("依版本順序上傳 PDF（至少兩份）", type=["pdf"], accept_multiple_files=True, key="revs")
+    c1, c2 = st.columns(2)
+    with c1:
+        sort_by_name = st.checkbox("依檔名排序（否則依上傳順序）", value=False)
+    with c2:
+        first_last = st.checkbox("另外比對第一版 vs 最後一版", value=True)
+    files = sorted(revs, key=lambda f: f.name) if (revs and sort_by_name) else list(revs or [])
+    if len(files) >= 2:
+        st.caption("版本順序：" + " → ".join(f"v{k+1} {f.name}" for k, f in enumerate(files)))
+    else:
+        st.info("請上傳至少兩個版本。")
 
-        except Exception as e:
-            traceback.print_exc()
-            st.error(f"處理失敗：{e}")
-        finally:
-            try: doc_a.close(); doc_b.close()
-            except Exception: pass
+    if st.button("🚀 比對所有版本並下載報告"):
+        if len(files) < 2:
+            st.warning("請上傳至少兩個版本。")
+        else:
+            try:
+                old_zip = st.session_state.pop("chain_zip_path", None)
+                if old_zip and os.path.exists(old_zip):
+                    os.remove(old_zip)
+                names = [os.path.basename(f.name) for f in files]
+                n_jobs = len(chain_jobs(names, first_last))
+                progress = st.progress(0, text="處理中...")
+
+                def on_page(k, done, total, p):
+                    pct = int(100 * (k + done / max(1, total)) / n_jobs)
+                    progress.progress(min(100, pct), text=f"第 {k+1}/{n_jobs} 組：已完成 {done}/{total} 頁")
+
+                store = get_render_store()
+                with tempfile.TemporaryDirectory(prefix="pdf_chain_") as tmp:
+                    paths = []
+                    for k, (f, name) in enumerate(zip(files, names)):
+                        # 每個版本放在各自的子資料夾，保留原檔名（報告檔名與標題才看得懂）
+                        p = os.path.join(tmp, "in", f"{k+1:02d}", name)
+                        os.makedirs(os.path.dirname(p), exist_ok=True)
+                        with open(p, "wb") as out:
+                            out.write(f.getvalue())
+                        paths.append(p)
+                    report_dir = os.path.join(tmp, "report")
+                    results = diff_chain(paths, settings, store, first_last=first_last, align=align,
+                                         report_dir=report_dir, report_zip=False, max_workers=workers,
+                                         on_page=on_page, names=names)
+                    fd, zip_path = tempfile.mkstemp(prefix="diff_chain_", suffix=".zip")
+                    os.close(fd)
+                    shutil.make_archive(zip_path[:-4], "zip", report_dir)
+                st.session_state["chain_zip_path"] = zip_path
+                store.prune(STORE_MAX_BYTES)
+                progress.progress(100, text=f"已完成 {n_jobs}/{n_jobs} 組")
+
+                st.table([{"比對": r.name, "整體相似度": f"{r.similarity:.4f}" if r.ok else "失敗",
+                           "變更頁數": r.changed_pages, "新增／刪除頁": f"{r.inserted_pages}／{r.deleted_pages}",
+                           "差異框數": r.boxes} for r in results])
+                for r in results:
+                    if not r.ok:
+                        st.error(f"{r.name} 失敗：{r.error}")
+                st.success("完成！解壓縮後開啟 index.html 查看各組報告：")
+                with open(zip_path, "rb") as zf:
+                    st.download_button("⬇️ 下載多版本報告（ZIP）", data=zf, file_name="diff_chain_report.zip",
+                                       mime="application/zip")
+            except Exception as e:
+                traceback.print_exc()
+                st.error(f"處理失敗：{e}")
 
 # 3) 參數調整影響（給一般使用者看的說明）
 st.markdown("""
@@ -447,5 +391,13 @@ st.markdown("""
 - **忽略頁首/頁尾比例**：避免頁眉頁碼造成每頁都被標記。  
 - **模糊半徑**：先做輕微模糊可降低噪點（影像品質差時有幫助）。  
 - **框合併 Padding**：把彼此很近的小框合併成較大的區塊，便於閱讀。
+- **灰階比對**：以灰階影像比對，速度較快、記憶體較省；需要偵測純顏色變更時請取消勾選。
+- **比對方式**：點陣會抓到所有視覺差異（含字型、顏色）；向量文字只比對字與位置，速度接近抽字，圖片或圖形有變更的頁面會自動改回點陣。
+- **頁面對齊**：依文字內容配對頁面，插入或刪除頁會被單獨標示，不會讓後面每一頁都被判定為差異。
+- **由粗到細**：先低解析度找出有差異的區塊，再只對這些區塊做高解析度比對；大部分頁面只有小改動時最有效。
+- **多版本**：一次上傳同一份文件的多個版本，依序產生 v1→v2、v2→v3… 的報告；中間版本的渲染與抽字結果會存在磁碟快取中重用，不會處理兩次。
+- **記憶體上限**：數千頁的大檔請設定（例如 1024 MB）。改以串流模式處理：文字逐頁抽取、每頁結果寫進報告後即丟棄，平行數與渲染解析度依上限自動調整；預算過小時會降低渲染解析度，差異框精度略降。
+- **效能分析**：記錄每頁各階段（渲染、遮罩、標記、合併、編碼、文字比對）耗時與最慢的頁，用來調整參數或找出變慢的原因；可匯出 JSON 或 Chrome trace（chrome://tracing、Perfetto）。
+- **預覽**：渲染過的頁面會保留在快取中；只調整像素閾值、最小面積或合併 Padding 時不會重新渲染，切換頁面也只渲染新的那一頁。
 """)
 